@@ -0,0 +1,98 @@
+import random
+import time
+import statistics
+import uuid
+
+from django.db import connection
+
+from bank_controller.models import User, CashAccount, Merchant, Purchase, Transfer, Message, Credit
+
+
+
+def timed( function, repeat : int = 1 ) -> dict:
+    """
+        Calls the function "repeat" times, returns the mean and the median time of one call in milliseconds
+    """
+
+    durations = []
+
+    for _ in range( repeat ):
+        start = time.perf_counter()
+        function()
+        durations.append( ( time.perf_counter() - start ) * 1000 )
+
+    return {
+        'mean_ms' : round( statistics.mean( durations ), 4 ),
+        'median_ms' : round( statistics.median( durations ), 4 ),
+    }
+
+def tables_size( tables : list[ str ] ) -> int | None:
+    """
+        Returns the size in bytes of the given tables including their indexes, or None if the database cannot report it
+    """
+
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute( 'SELECT SUM( pg_total_relation_size( to_regclass( name ) ) ) FROM unnest( %s ) AS name', [ list( tables ) ] )
+            return int( cursor.fetchone()[0] )
+
+        if connection.vendor == 'sqlite':
+            # Indexes of SQLite tables are separate b-trees, "dbstat" lists them with "tbl_name" of their table
+            placeholders = ', '.join( [ '%s' ] * len( tables ) )
+            cursor.execute(
+                f'SELECT SUM( dbstat.pgsize ) FROM dbstat JOIN sqlite_master ON sqlite_master.name = dbstat.name WHERE sqlite_master.tbl_name IN ( {placeholders} )',
+                list( tables ),
+            )
+            return cursor.fetchone()[0]
+
+    return None
+
+def drop_tables( tables : list[ str ] ) -> None:
+    """
+        Drops the given scratch tables if they exist
+    """
+
+    with connection.cursor() as cursor:
+        for table in tables:
+            cursor.execute( f'DROP TABLE IF EXISTS {table}' )
+
+def create_account_with_history( purchases : int, transfers : int, messages : int, seed : int = 0 ) -> list:
+    """
+        Creates a scratch user whose cash account has "purchases" purchases, "transfers" sent and "transfers" recieved transfers,
+        "messages" messages and a credit ( a realistic "RetrieveCashAccountSerializer" response ), and the user on the other side of the transfers.
+        Returns both users, to be removed by "delete_users"
+    """
+
+    generator = random.Random( seed )
+
+    users = [
+        User.objects.create_user( email = f'{uuid.uuid4().hex}@benchmark.local', first_name = 'Benchmark', last_name = uuid.uuid4().hex, password = None )
+        for _ in range( 2 )
+    ]
+    account, other_account = [ CashAccount.objects.get( pk = user.cash_account_uuid ) for user in users ]
+
+    merchants = [ Merchant.objects.get_or_create( name = f'Merchant store #{index} | Online payment' )[0] for index in range( 50 ) ]
+
+    Purchase.objects.bulk_create( [
+        Purchase( cash_account = account, merchant_ref = generator.choice( merchants ), amount = generator.randint( 1, 10000 ) )
+        for _ in range( purchases )
+    ] )
+    Transfer.objects.bulk_create( [
+        Transfer( sender = account, reciever = other_account, amount = generator.randint( 1, 10000 ) ) if index % 2 else
+        Transfer( sender = other_account, reciever = account, amount = generator.randint( 1, 10000 ) )
+        for index in range( transfers * 2 )
+    ] )
+    Message.objects.bulk_create( [ Message( cash_account = account, content = f'Credit payment #{index} was successful' ) for index in range( messages ) ] )
+    Credit.objects.create( cash_account = account, amount = 50000, loan_duration = 12 )
+
+    return users
+
+def delete_users( users : list ) -> None:
+    """
+        Deletes the scratch users and their cash accounts
+    """
+
+    for user in users:
+        Credit.objects.filter( cash_account_id = user.cash_account_uuid ).delete()
+        CashAccount.objects.filter( pk = user.cash_account_uuid ).delete()
+        user.delete()
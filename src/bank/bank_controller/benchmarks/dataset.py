@@ -0,0 +1,26 @@
+"""
+    Measures the synthetic dataset generator ( "services/dataset_service.py" ): generates a dataset of "users" users
+    with the default history per user, reports the created rows and the throughput in rows per minute, then deletes the dataset
+"""
+
+import time
+
+from bank_controller.services.dataset_service import generate_dataset, delete_dataset
+
+
+DEFAULT_OPTIONS = {
+    'users' : 10000,
+    'chunk_size' : 10000,
+    'batch_size' : 5000,
+    'seed' : 0,
+}
+
+
+def run( users : int, chunk_size : int, batch_size : int, seed : int ) -> dict:
+    summary = generate_dataset( users, seed = seed, chunk_size = chunk_size, batch_size = batch_size, rollups = False )
+
+    start = time.perf_counter()
+    delete_dataset( seed )
+    summary['delete_seconds'] = round( time.perf_counter() - start, 2 )
+
+    return summary
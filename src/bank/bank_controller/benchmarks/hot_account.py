@@ -0,0 +1,72 @@
+"""
+    Measures the throughput of concurrent replenishments of one cash account, with the account row ( slots=0 ) and with sub-balances of a hot account
+    ( see "set_hot_account_slots" ). Every replenishment is a transaction that holds its row lock for "hold_ms" milliseconds
+    ( the rest of the work of a transfer: the transfer row, the rollups ), "threads" threads send "credits" replenishments in total.
+    Checks that the balance of the account is exact after the compaction.
+    Row locks only exist on PostgreSQL: SQLite locks the whole database for every write, so the throughput does not depend on the slots there.
+"""
+
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connections, transaction
+from django.db.models import F
+
+from bank_controller.models import User, CashAccount
+from bank_controller.services.cash_management_service import cash_replenishment, compact_sub_balances, get_balance, set_hot_account_slots
+
+
+DEFAULT_OPTIONS = {
+    'slots' : '0,1,4,16',
+    'threads' : 8,
+    'credits' : 2000,
+    'hold_ms' : 2,
+}
+
+
+def _credit( account : CashAccount, hold_seconds : float ) -> None:
+    with transaction.atomic():
+        if account.hot_account_slots:
+            cash_replenishment( 1, account )
+        else:
+            # The row of the account itself, updated in the database so no replenishment is lost
+            CashAccount.objects.filter( pk = account.pk ).update( amount = F( 'amount' ) + 1 )
+
+        time.sleep( hold_seconds )
+
+def _worker( account : CashAccount, credits : int, hold_seconds : float ) -> None:
+    try:
+        for _ in range( credits ):
+            _credit( account, hold_seconds )
+    finally:
+        connections.close_all()
+
+def run( slots : str, threads : int, credits : int, hold_ms : int ) -> dict:
+    results = { 'database' : connections['default'].vendor, 'threads' : threads, 'credits' : credits }
+
+    user = User.objects.create_user( email = f'{uuid.uuid4().hex}@benchmark.local', first_name = 'Benchmark', last_name = uuid.uuid4().hex, password = None )
+
+    try:
+        for slot_count in [ int( value ) for value in slots.split( ',' ) ]:
+            account = CashAccount.objects.get( pk = user.cash_account_uuid )
+            set_hot_account_slots( account, slot_count )
+            start_amount = get_balance( account )
+
+            start = time.perf_counter()
+            with ThreadPoolExecutor( threads ) as executor:
+                for future in [ executor.submit( _worker, account, credits // threads, hold_ms / 1000 ) for _ in range( threads ) ]:
+                    future.result()
+            elapsed = time.perf_counter() - start
+
+            compact_sub_balances( account )
+
+            results[ f'slots_{slot_count}' ] = {
+                'credits_per_second' : round( ( credits // threads ) * threads / elapsed, 1 ),
+                'balance_exact' : account.amount - start_amount == ( credits // threads ) * threads,
+            }
+
+        return results
+    finally:
+        CashAccount.objects.filter( pk = user.cash_account_uuid ).delete()
+        user.delete()
@@ -0,0 +1,51 @@
+"""
+    Measures the loan book forecast ( "services/loan_book_service.py" ) on a synthetic portfolio of "credits" credits
+    ( amounts of 1000 - 100000, durations of 3, 6 and 12 parts, created during the last 12 periods, 10% with the doubled rate, 1% blocked ):
+    - wall time of the forecast of one scenario with a pool of "workers" processes
+    - throughput in credit-periods per second over all the runs
+"""
+
+import time
+
+import numpy as np
+
+from bank_controller.services.loan_book_service import forecast_loan_book
+
+
+DEFAULT_OPTIONS = {
+    'credits' : 1000000,
+    'periods' : 12,
+    'runs' : 100,
+    'workers' : 4,
+    'chunk_size' : 10000,
+    'miss_rate' : 0.05,
+    'seed' : 0,
+}
+
+
+def synthetic_portfolio( credits : int, seed : int ) -> dict:
+    generator = np.random.default_rng( seed )
+
+    return {
+        'amount' : generator.integers( 1000, 100000, credits ).astype( np.float64 ),
+        'loan_duration' : generator.choice( ( 3.0, 6.0, 12.0 ), credits ),
+        'amount_returned' : np.zeros( credits ),
+        'increased' : generator.random( credits ) < 0.1,
+        'blocked' : generator.random( credits ) < 0.01,
+        'created' : -generator.random( credits ) * 12,
+    }
+
+def run( credits : int, periods : int, runs : int, workers : int, chunk_size : int, miss_rate : float, seed : int ) -> dict:
+    portfolio = synthetic_portfolio( credits, seed )
+
+    start = time.perf_counter()
+    forecast = forecast_loan_book( portfolio, { 'base' : miss_rate }, periods, runs, seed = seed, workers = workers, chunk_size = chunk_size )
+    duration = time.perf_counter() - start
+
+    return {
+        'credits' : credits,
+        'seconds' : round( duration, 2 ),
+        'credit_periods_per_second' : round( credits * periods * runs / duration ),
+        'first_period' : forecast['base'][0],
+        'last_period' : forecast['base'][-1],
+    }
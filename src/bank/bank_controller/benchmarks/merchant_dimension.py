@@ -0,0 +1,99 @@
+"""
+    Compares storing the purchase merchant as free text with storing it as a key of the merchant dimension table:
+    - size of the purchase table and its merchant index
+    - time of a per-merchant aggregate query ( the dimension variant resolves the name through the merchant cache, as the application does )
+"""
+
+import random
+
+from django.db import connection, transaction
+
+from bank_controller.benchmarks._common import timed, tables_size, drop_tables
+
+
+DEFAULT_OPTIONS = {
+    'rows' : 200000,
+    'merchants' : 2000,
+    'queries' : 200,
+    'seed' : 0,
+}
+
+TEXT_TABLE = 'benchmark_purchase_text'
+DIMENSION_TABLE = 'benchmark_purchase_dimension'
+MERCHANT_TABLE = 'benchmark_merchant'
+
+
+def _merchant_names( count : int ) -> list[ str ]:
+    # Realistic lengths: store names and the names written by credit payments
+    return [
+        f'Credit | PK: {index}' if index % 4 == 0 else f'Merchant store #{index} | Online payment'
+        for index in range( count )
+    ]
+
+def run( rows : int, merchants : int, queries : int, seed : int ) -> dict:
+    generator = random.Random( seed )
+    names = _merchant_names( merchants )
+    # Skewed popularity: a few merchants get most of the purchases
+    weights = [ 1 / ( index + 1 ) for index in range( merchants ) ]
+    purchase_merchants = generator.choices( range( merchants ), weights = weights, k = rows )
+    amounts = [ generator.randint( 1, 10000 ) for _ in range( rows ) ]
+
+    tables = ( TEXT_TABLE, DIMENSION_TABLE, MERCHANT_TABLE )
+    drop_tables( tables )
+
+    try:
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute( f'CREATE TABLE {TEXT_TABLE} ( id bigint PRIMARY KEY, merchant varchar(255) NOT NULL, amount integer NOT NULL )' )
+            cursor.execute( f'CREATE INDEX {TEXT_TABLE}_merchant ON {TEXT_TABLE} ( merchant )' )
+            cursor.execute( f'CREATE TABLE {MERCHANT_TABLE} ( id bigint PRIMARY KEY, name varchar(255) NOT NULL UNIQUE )' )
+            cursor.execute( f'CREATE TABLE {DIMENSION_TABLE} ( id bigint PRIMARY KEY, merchant_id bigint NOT NULL, amount integer NOT NULL )' )
+            cursor.execute( f'CREATE INDEX {DIMENSION_TABLE}_merchant ON {DIMENSION_TABLE} ( merchant_id )' )
+
+            cursor.executemany( f'INSERT INTO {MERCHANT_TABLE} VALUES ( %s, %s )', list( enumerate( names ) ) )
+            cursor.executemany(
+                f'INSERT INTO {TEXT_TABLE} VALUES ( %s, %s, %s )',
+                [ ( index, names[ merchant ], amounts[ index ] ) for index, merchant in enumerate( purchase_merchants ) ],
+            )
+            cursor.executemany(
+                f'INSERT INTO {DIMENSION_TABLE} VALUES ( %s, %s, %s )',
+                [ ( index, merchant, amounts[ index ] ) for index, merchant in enumerate( purchase_merchants ) ],
+            )
+
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute( f'ANALYZE {TEXT_TABLE}, {DIMENSION_TABLE}, {MERCHANT_TABLE}' )
+
+        merchant_ids = { name : index for index, name in enumerate( names ) }
+        sample = generator.choices( names, weights = weights, k = queries )
+
+        def query_text():
+            with connection.cursor() as cursor:
+                for name in sample:
+                    cursor.execute( f'SELECT SUM( amount ), COUNT( * ) FROM {TEXT_TABLE} WHERE merchant = %s', [ name ] )
+                    cursor.fetchone()
+
+        def query_dimension():
+            with connection.cursor() as cursor:
+                for name in sample:
+                    cursor.execute( f'SELECT SUM( amount ), COUNT( * ) FROM {DIMENSION_TABLE} WHERE merchant_id = %s', [ merchant_ids[ name ] ] )
+                    cursor.fetchone()
+
+        text_time = timed( query_text, repeat = 3 )
+        dimension_time = timed( query_dimension, repeat = 3 )
+
+        return {
+            'database' : connection.vendor,
+            'rows' : rows,
+            'merchants' : merchants,
+            'free_text' : {
+                'size_bytes' : tables_size( [ TEXT_TABLE ] ),
+                'per_merchant_query_ms' : round( text_time['median_ms'] / queries, 4 ),
+            },
+            'dimension' : {
+                'size_bytes' : tables_size( [ DIMENSION_TABLE ] ),
+                'merchant_table_size_bytes' : tables_size( [ MERCHANT_TABLE ] ),
+                'per_merchant_query_ms' : round( dimension_time['median_ms'] / queries, 4 ),
+            },
+        }
+    finally:
+        drop_tables( tables )
@@ -0,0 +1,57 @@
+"""
+    Compares the serializers of the cash account response ( "RetrieveCashAccountSerializer" ) with the fast read path ( "cash_account_representation" )
+    on a cash account with "purchases" purchases, "transfers" sent and recieved transfers, "messages" messages and a credit:
+    - CPU time and wall time of building the response data ( the queries included )
+    - whether both give the same JSON
+"""
+
+import time
+
+from rest_framework.renderers import JSONRenderer
+
+from bank_controller.benchmarks._common import timed, create_account_with_history, delete_users
+from bank_controller.models import CashAccount
+from bank_controller.serializers import RetrieveCashAccountSerializer, cash_account_representation
+
+
+DEFAULT_OPTIONS = {
+    'purchases' : 1000,
+    'transfers' : 500,
+    'messages' : 100,
+    'repeat' : 20,
+    'seed' : 0,
+}
+
+
+def _cpu_ms( function, repeat : int ) -> float:
+    start = time.process_time()
+
+    for _ in range( repeat ):
+        function()
+
+    return round( ( time.process_time() - start ) * 1000 / repeat, 4 )
+
+def run( purchases : int, transfers : int, messages : int, repeat : int, seed : int ) -> dict:
+    users = create_account_with_history( purchases, transfers, messages, seed )
+
+    try:
+        account = CashAccount.objects.get( pk = users[0].cash_account_uuid )
+
+        serializer = lambda: RetrieveCashAccountSerializer( instance = account ).data
+        fast_path = lambda: cash_account_representation( account, {} )
+
+        results = {
+            'purchases' : purchases,
+            'transfers' : transfers * 2,
+            'messages' : messages,
+            'identical_output' : JSONRenderer().render( serializer() ) == JSONRenderer().render( fast_path() ),
+        }
+
+        for name, function in ( ( 'serializer', serializer ), ( 'fast_path', fast_path ) ):
+            results[ name ] = dict( timed( function, repeat = repeat ), cpu_ms = _cpu_ms( function, repeat ) )
+
+        results['cpu_ratio'] = round( results['fast_path']['cpu_ms'] / results['serializer']['cpu_ms'], 3 )
+
+        return results
+    finally:
+        delete_users( users )
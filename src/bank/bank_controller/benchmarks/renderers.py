@@ -0,0 +1,40 @@
+"""
+    Compares the renderers of the API ( "bank_controller/renderers.py" ) on a realistic "RetrieveCashAccountSerializer" response:
+    a cash account with "purchases" purchases, "transfers" sent and recieved transfers, "messages" messages and a credit.
+    - encode time of the response data with the stock "JSONRenderer", "ORJSONRenderer" and "MessagePackRenderer"
+    - size of the encoded payload
+"""
+
+from rest_framework.renderers import JSONRenderer
+
+from bank_controller.benchmarks._common import timed, create_account_with_history, delete_users
+from bank_controller.models import CashAccount
+from bank_controller.renderers import ORJSONRenderer, MessagePackRenderer
+from bank_controller.serializers import RetrieveCashAccountSerializer
+
+
+DEFAULT_OPTIONS = {
+    'purchases' : 1000,
+    'transfers' : 500,
+    'messages' : 100,
+    'repeat' : 50,
+    'seed' : 0,
+}
+
+
+def run( purchases : int, transfers : int, messages : int, repeat : int, seed : int ) -> dict:
+    users = create_account_with_history( purchases, transfers, messages, seed )
+
+    try:
+        data = RetrieveCashAccountSerializer( instance = CashAccount.objects.get( pk = users[0].cash_account_uuid ) ).data
+        results = { 'purchases' : purchases, 'transfers' : transfers * 2, 'messages' : messages }
+
+        for name, renderer in ( ( 'json', JSONRenderer() ), ( 'orjson', ORJSONRenderer() ), ( 'msgpack', MessagePackRenderer() ) ):
+            results[ name ] = {
+                'encode' : timed( lambda: renderer.render( data ), repeat = repeat ),
+                'size_bytes' : len( renderer.render( data ) ),
+            }
+
+        return results
+    finally:
+        delete_users( users )
@@ -0,0 +1,100 @@
+"""
+    Compares the development server ( "manage.py runserver" ) with the gunicorn entry point ( "config/gunicorn.conf.py" ):
+    - cold start: time from the start of the process until the first response
+    - throughput: requests per second of "concurrency" clients sending "requests" requests to "path"
+    Both servers are started with the current settings, pass "token" to benchmark an endpoint that requires authentication.
+"""
+
+import socket
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+
+
+DEFAULT_OPTIONS = {
+    'requests' : 2000,
+    'concurrency' : 8,
+    'workers' : 2,
+    'path' : '/user/',
+    'token' : '',
+}
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind( ( '127.0.0.1', 0 ) )
+        return sock.getsockname()[1]
+
+def _request( url : str, token : str ) -> int:
+    """
+        Sends a GET request, returns the status code of the response
+    """
+
+    request = urllib.request.Request( url, headers = { 'Authorization' : f'Token {token}' } if token else {} )
+
+    try:
+        with urllib.request.urlopen( request, timeout = 30 ) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as error:
+        return error.code
+
+def _wait_for_first_response( url : str, token : str, process : subprocess.Popen, timeout : float = 60 ) -> None:
+    deadline = time.perf_counter() + timeout
+
+    while time.perf_counter() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError( f'The server exited on start with the code {process.returncode}' )
+
+        try:
+            _request( url, token )
+            return
+        except ( urllib.error.URLError, ConnectionError ):
+            time.sleep( 0.01 )
+
+    raise TimeoutError( 'The server did not respond in time' )
+
+def _measure( command : list[ str ], url : str, requests : int, concurrency : int, token : str ) -> dict:
+    start = time.perf_counter()
+    process = subprocess.Popen( command, cwd = settings.BASE_DIR, stdout = subprocess.DEVNULL, stderr = subprocess.DEVNULL )
+
+    try:
+        _wait_for_first_response( url, token, process )
+        cold_start = time.perf_counter() - start
+
+        with ThreadPoolExecutor( concurrency ) as executor:
+            start = time.perf_counter()
+            statuses = list( executor.map( lambda _: _request( url, token ), range( requests ) ) )
+            elapsed = time.perf_counter() - start
+
+        return {
+            'cold_start_s' : round( cold_start, 3 ),
+            'requests_per_second' : round( requests / elapsed, 1 ),
+            'statuses' : { str( code ) : statuses.count( code ) for code in sorted( set( statuses ) ) },
+        }
+    finally:
+        process.terminate()
+        process.wait( timeout = 60 )
+
+def run( requests : int, concurrency : int, workers : int, path : str, token : str ) -> dict:
+    results = { 'requests' : requests, 'concurrency' : concurrency }
+
+    port = _free_port()
+    results['runserver'] = _measure(
+        [ sys.executable, 'manage.py', 'runserver', '--noreload', f'127.0.0.1:{port}' ],
+        f'http://127.0.0.1:{port}{path}', requests, concurrency, token,
+    )
+
+    port = _free_port()
+    results['gunicorn'] = _measure(
+        [ sys.executable, '-m', 'gunicorn', '-c', 'config/gunicorn.conf.py', '--bind', f'127.0.0.1:{port}', '--workers', str( workers ) ],
+        f'http://127.0.0.1:{port}{path}', requests, concurrency, token,
+    )
+    results['gunicorn']['workers'] = workers
+
+    return results
@@ -0,0 +1,115 @@
+"""
+    Measures the startup of a fresh process, the way the worker ( "celery -A config worker" ) or the API ( "config/gunicorn.conf.py" ) starts:
+    - worker: time to the first task - the celery app and Django are set up, the task modules imported and the first task executed
+    - api: time to ready - the WSGI application is loaded and warmed up
+    Also reports the modules with the largest import time ( "python -X importtime" ) and the packages that take the most of it.
+"""
+
+import json
+import os
+import subprocess
+import sys
+import time
+
+from django.conf import settings
+
+
+DEFAULT_OPTIONS = {
+    'process' : 'worker',
+    'task' : 'bank_controller.tasks.maintain_history_partitions',
+    'repeat' : 5,
+    'top' : 20,
+}
+
+# Modules that only the API needs. A worker that imports them pays for the whole URL configuration on every start
+API_ONLY_MODULES = (
+    'bank_controller.views',
+    'bank_controller.serializers',
+    'rest_framework.views',
+    'rest_framework.serializers',
+    'djoser.views',
+    'django.test',
+)
+
+# Time to the first task of a worker that the regression test allows ( seconds )
+WORKER_STARTUP_BUDGET = 3.0
+
+BOOT_SCRIPTS = {
+    # Repeats what "celery worker" does before it consumes tasks, the task is executed in the process
+    'worker' : '''
+import json, sys, time
+start = time.perf_counter()
+from config.celery import app
+app.loader.init_worker()
+app.finalize( auto = True )
+app.tasks[ sys.argv[1] ].apply()
+print( json.dumps( { 'seconds' : time.perf_counter() - start, 'modules' : sorted( sys.modules ) } ) )
+''',
+    'api' : '''
+import json, sys, time
+start = time.perf_counter()
+from config.wsgi import application
+from config.warmup import warm_up_application
+warm_up_application()
+print( json.dumps( { 'seconds' : time.perf_counter() - start, 'modules' : sorted( sys.modules ) } ) )
+''',
+}
+
+
+def boot( process : str = 'worker', task : str = DEFAULT_OPTIONS['task'], importtime : bool = False ) -> dict:
+    """
+        Starts a fresh python process that boots the worker or the API. Returns the startup time ( "seconds", without the interpreter start ),
+        the time including the interpreter start ( "wall_seconds" ), the imported modules and, if "importtime" is True, the "-X importtime" output
+    """
+
+    command = [ sys.executable ] + ( [ '-X', 'importtime' ] if importtime else [] ) + [ '-c', BOOT_SCRIPTS[ process ], task ]
+
+    start = time.perf_counter()
+    result = subprocess.run( command, cwd = settings.BASE_DIR, env = os.environ.copy(), capture_output = True, text = True, check = True )
+    wall_seconds = time.perf_counter() - start
+
+    report = json.loads( result.stdout.strip().splitlines()[-1] )
+    report['wall_seconds'] = wall_seconds
+
+    if importtime:
+        report['importtime'] = result.stderr
+
+    return report
+
+def parse_importtime( output : str ) -> list[ dict ]:
+    """
+        Parses the "-X importtime" output into a list of { 'module', 'self_us', 'cumulative_us' }
+    """
+
+    modules = []
+
+    for line in output.splitlines():
+        if not line.startswith( 'import time:' ) or 'self [us]' in line:
+            continue
+
+        self_us, cumulative_us, name = line[ len( 'import time:' ): ].split( '|' )
+        modules.append( { 'module' : name.strip(), 'self_us' : int( self_us ), 'cumulative_us' : int( cumulative_us ) } )
+
+    return modules
+
+def run( process : str, task : str, repeat : int, top : int ) -> dict:
+    reports = [ boot( process, task ) for _ in range( repeat ) ]
+    seconds = sorted( report['seconds'] for report in reports )
+    wall_seconds = sorted( report['wall_seconds'] for report in reports )
+
+    modules = parse_importtime( boot( process, task, importtime = True )['importtime'] )
+
+    packages = {}
+    for module in modules:
+        package = module['module'].split( '.' )[0]
+        packages[ package ] = packages.get( package, 0 ) + module['self_us']
+
+    return {
+        'process' : process,
+        'startup_median_s' : round( seconds[ len( seconds ) // 2 ], 4 ),
+        'startup_with_interpreter_median_s' : round( wall_seconds[ len( wall_seconds ) // 2 ], 4 ),
+        'modules' : len( reports[0]['modules'] ),
+        'api_only_modules' : [ name for name in API_ONLY_MODULES if name in reports[0]['modules'] ],
+        'slowest_modules' : sorted( modules, key = lambda module: module['cumulative_us'], reverse = True )[ :top ],
+        'slowest_packages_us' : dict( sorted( packages.items(), key = lambda item: item[1], reverse = True )[ :top ] ),
+    }
@@ -0,0 +1,96 @@
+"""
+    Compares random ( uuid4 ) and time-ordered ( uuid7, see "generate_uuid7" ) primary keys of a table that grows by inserts:
+    - insert throughput, when the table already holds "rows" rows
+    - size of the table with its primary key index
+    - time of primary key lookups of random rows and of the most recently inserted rows
+"""
+
+import random
+import time
+import uuid
+
+from django.db import connection, transaction
+from django.db.models import UUIDField
+
+from bank_controller.benchmarks._common import timed, tables_size, drop_tables
+from bank_controller.services.general_service import generate_uuid7
+
+
+DEFAULT_OPTIONS = {
+    'rows' : 200000,
+    'batch_size' : 1000,
+    'lookups' : 2000,
+    'seed' : 0,
+}
+
+TABLES = {
+    'uuid4' : 'benchmark_uuid4_key',
+    'uuid7' : 'benchmark_uuid7_key',
+}
+
+GENERATORS = {
+    'uuid4' : uuid.uuid4,
+    'uuid7' : generate_uuid7,
+}
+
+
+def _column_type() -> str:
+    # The column type Django uses for a UUIDField on this database
+    return UUIDField().db_type( connection )
+
+def _insert( table : str, keys : list, batch_size : int ) -> float:
+    """
+        Inserts the keys in batches of "batch_size" rows ( one transaction per batch, as the application does ).
+        Returns the number of inserted rows per second
+    """
+
+    field = UUIDField()
+    start = time.perf_counter()
+
+    for index in range( 0, len( keys ), batch_size ):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO {table} VALUES ( %s, %s )',
+                [ ( field.get_db_prep_value( key, connection ), 0 ) for key in keys[ index:index + batch_size ] ],
+            )
+
+    return round( len( keys ) / ( time.perf_counter() - start ), 1 )
+
+def run( rows : int, batch_size : int, lookups : int, seed : int ) -> dict:
+    generator = random.Random( seed )
+    field = UUIDField()
+    drop_tables( TABLES.values() )
+
+    results = { 'database' : connection.vendor, 'rows' : rows }
+
+    try:
+        for name, table in TABLES.items():
+            with connection.cursor() as cursor:
+                cursor.execute( f'CREATE TABLE {table} ( id {_column_type()} PRIMARY KEY, amount integer NOT NULL )' )
+
+            keys = [ GENERATORS[ name ]() for _ in range( rows ) ]
+            insert_rate = _insert( table, keys, batch_size )
+
+            if connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute( f'ANALYZE {table}' )
+
+            random_keys = [ field.get_db_prep_value( key, connection ) for key in generator.choices( keys, k = lookups ) ]
+            recent_keys = [ field.get_db_prep_value( key, connection ) for key in generator.choices( keys[ -max( rows // 100, 1 ): ], k = lookups ) ]
+
+            def lookup( sample ):
+                with connection.cursor() as cursor:
+                    for key in sample:
+                        cursor.execute( f'SELECT amount FROM {table} WHERE id = %s', [ key ] )
+                        cursor.fetchone()
+
+            results[ name ] = {
+                'inserts_per_second' : insert_rate,
+                'size_bytes' : tables_size( [ table ] ),
+                'random_lookup_ms' : round( timed( lambda: lookup( random_keys ), repeat = 3 )['median_ms'] / lookups, 4 ),
+                'recent_lookup_ms' : round( timed( lambda: lookup( recent_keys ), repeat = 3 )['median_ms'] / lookups, 4 ),
+            }
+
+        return results
+    finally:
+        drop_tables( TABLES.values() )
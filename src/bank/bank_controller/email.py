@@ -0,0 +1,38 @@
+from djoser import email
+
+from bank_controller.services.email_service import enqueue_email
+
+
+# The emails of djoser ( see DJOSER['EMAIL'] ), that are sent by the "flush_email_outbox" celery task instead of the request
+
+
+class OutboxEmailMixin():
+    """
+        Mixin of a djoser email, that saves the rendered email to the outbox instead of sending it, see "services/email_service.py"
+    """
+
+    def send( self, to, *args, **kwargs ):
+        self.render()
+
+        self.to = to
+        self.from_email = kwargs.pop( 'from_email', self.from_email )
+
+        enqueue_email( self )
+
+class ActivationEmail( OutboxEmailMixin, email.ActivationEmail ):
+    pass
+
+class ConfirmationEmail( OutboxEmailMixin, email.ConfirmationEmail ):
+    pass
+
+class PasswordResetEmail( OutboxEmailMixin, email.PasswordResetEmail ):
+    pass
+
+class PasswordChangedConfirmationEmail( OutboxEmailMixin, email.PasswordChangedConfirmationEmail ):
+    pass
+
+class UsernameChangedConfirmationEmail( OutboxEmailMixin, email.UsernameChangedConfirmationEmail ):
+    pass
+
+class UsernameResetEmail( OutboxEmailMixin, email.UsernameResetEmail ):
+    pass
@@ -0,0 +1,142 @@
+"""
+    Long polling of the change-data feed of the cash accounts, served by the ASGI application ( "config/asgi.py" ).
+
+    The feed ( ACCOUNT_EVENT_FEED_PATH, see "services/event_service.py" ) takes the same parameters as the feed endpoint of the API,
+    plus "wait": if there are no events after the "since" cursor, the request waits up to "wait" seconds for new ones instead of
+    returning at once, so a reader that is up to date does not poll. A waiting request is a coroutine blocked on the ACCOUNT_EVENT_STREAM
+    Redis stream ( XREAD ), woken by the relay when it publishes the next numbered events; it holds no worker and no database connection.
+
+    The id of the last entry of the stream is read before the events, so an event numbered after the read of the database is added
+    to the stream after that id and wakes the request. If Redis is unavailable, the request returns at once.
+"""
+
+import asyncio
+import json
+import logging
+from urllib.parse import parse_qsl
+
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+
+from bank_controller.models import User
+from bank_controller.push import get_token_key
+from bank_controller.serializers import AccountEventFeedQuerySerializer
+from bank_controller.services.event_service import get_feed
+from bank_controller.services.redis_service import get_async_redis
+
+
+logger = logging.getLogger( __name__ )
+
+
+@sync_to_async
+def authenticate( scope : dict ) -> User | None:
+    """
+        Returns the active user of the token of the request ( the "Authorization: Token <key>" header ), or None
+    """
+
+    key = get_token_key( scope )
+    token = Token.objects.select_related( 'user' ).filter( key = key ).first() if key else None
+
+    if token is None or not token.user.is_active:
+        return None
+
+    return token.user
+
+@sync_to_async
+def validate_query( scope : dict ) -> tuple[ dict | None, dict | None ]:
+    """
+        Returns the validated query parameters of the feed and None, or None and the errors
+    """
+
+    serializer = AccountEventFeedQuerySerializer( data = dict( parse_qsl( scope.get( 'query_string', b'' ).decode() ) ) )
+
+    if not serializer.is_valid():
+        return None, serializer.errors
+
+    return serializer.validated_data, None
+
+async def wait_for_feed( since : str, limit : int, wait : float, client ) -> tuple[ list[ str ], str ]:
+    """
+        Returns the events after the cursor as "get_feed" does. If there are none, waits up to "wait" seconds for the relay
+        to publish new events to the Redis stream, and reads them
+    """
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + wait
+    last_id = None
+
+    if wait:
+        try:
+            last_entries = await client.xrevrange( settings.ACCOUNT_EVENT_STREAM, count = 1 )
+            last_id = last_entries[0][0] if last_entries else b'0-0'
+        except redis.RedisError:
+            logger.warning( 'The feed does not wait for new events, Redis is unavailable', exc_info = True )
+
+    while True:
+        lines, cursor = await sync_to_async( get_feed )( since, limit )
+        remaining = deadline - loop.time()
+
+        if lines or last_id is None or remaining <= 0:
+            return lines, cursor
+
+        try:
+            entries = await client.xread( { settings.ACCOUNT_EVENT_STREAM : last_id }, count = limit, block = max( int( remaining * 1000 ), 1 ) )
+        except redis.RedisError:
+            logger.warning( 'The feed stopped waiting for new events, Redis is unavailable', exc_info = True )
+            return lines, cursor
+
+        if not entries:
+            return lines, cursor
+
+        # The stream holds the events of all the databases, the feed reads the ones after the cursor
+        last_id = entries[0][1][-1][0]
+
+async def send_json( send, status : int, data : dict ) -> None:
+    await send( { 'type' : 'http.response.start', 'status' : status, 'headers' : [ ( b'content-type', b'application/json' ) ] } )
+    await send( { 'type' : 'http.response.body', 'body' : json.dumps( data ).encode() } )
+
+async def feed_application( scope, receive, send ) -> None:
+    """
+        ASGI application of the feed ( admins only ), the same responses as of "RetrieveAccountEventFeedAPIView"
+    """
+
+    user = await authenticate( scope )
+
+    if user is None:
+        return await send_json( send, 401, { 'detail' : 'Invalid token.' } )
+
+    if not user.is_staff:
+        return await send_json( send, 403, { 'detail' : 'You do not have permission to perform this action.' } )
+
+    query, errors = await validate_query( scope )
+
+    if errors is not None:
+        return await send_json( send, 400, errors )
+
+    async def wait_for_disconnect():
+        while ( await receive() )['type'] != 'http.disconnect':
+            pass
+
+    feed = asyncio.ensure_future( wait_for_feed( query['since'], query['limit'], query['wait'], get_async_redis() ) )
+    disconnect = asyncio.ensure_future( wait_for_disconnect() )
+
+    try:
+        await asyncio.wait( ( feed, disconnect ), return_when = asyncio.FIRST_COMPLETED )
+    finally:
+        disconnect.cancel()
+
+    # The client is gone, nobody reads the events
+    if not feed.done():
+        feed.cancel()
+        return
+
+    lines, cursor = feed.result()
+
+    await send( {
+        'type' : 'http.response.start',
+        'status' : 200,
+        'headers' : [ ( b'content-type', b'application/x-ndjson' ), ( b'x-next-cursor', cursor.encode() ) ],
+    } )
+    await send( { 'type' : 'http.response.body', 'body' : ''.join( f'{line}\n' for line in lines ).encode() } )
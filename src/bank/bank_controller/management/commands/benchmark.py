@@ -0,0 +1,61 @@
+import json
+import pkgutil
+from importlib import import_module
+
+from django.core.management.base import BaseCommand, CommandError
+
+
+BENCHMARKS_PACKAGE = 'bank_controller.benchmarks'
+
+
+def get_benchmark_names() -> list[ str ]:
+    """
+        Returns the names of all benchmark modules ( modules starting with "_" are helpers )
+    """
+
+    package = import_module( BENCHMARKS_PACKAGE )
+
+    return sorted( module.name for module in pkgutil.iter_modules( package.__path__ ) if not module.name.startswith( '_' ) )
+
+
+class Command( BaseCommand ):
+    """
+        Runs one of the benchmarks from "bank_controller/benchmarks" and prints its results as JSON.
+
+        Every benchmark module defines:
+        - DEFAULT_OPTIONS - a dictionary of the options and their default values ( the type of the default value is used to parse the option )
+        - run( **options ) - runs the benchmark and returns a JSON-serializable dictionary of results
+
+        Benchmarks create and drop their own scratch tables, but still should be run against a staging database.
+    """
+
+    help = 'Runs a benchmark from "bank_controller/benchmarks" and prints its results as JSON'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( 'name', help = 'Name of the benchmark' )
+        parser.add_argument( '-o', '--option', action = 'append', default = [], help = 'Benchmark option in the form key=value' )
+
+    def handle( self, *args, **options ):
+        if options['name'] not in get_benchmark_names():
+            raise CommandError( f'Unknown benchmark "{options["name"]}". Available benchmarks: {", ".join( get_benchmark_names() )}' )
+
+        benchmark = import_module( f'{BENCHMARKS_PACKAGE}.{options["name"]}' )
+        benchmark_options = dict( benchmark.DEFAULT_OPTIONS )
+
+        for option in options['option']:
+            key, separator, value = option.partition( '=' )
+
+            if not separator or key not in benchmark_options:
+                raise CommandError( f'Invalid option "{option}". Available options: {", ".join( benchmark_options )}' )
+
+            default = benchmark_options[ key ]
+            if isinstance( default, bool ):
+                benchmark_options[ key ] = value.lower() in ( '1', 'true', 'yes' )
+            elif default is not None:
+                benchmark_options[ key ] = type( default )( value )
+            else:
+                benchmark_options[ key ] = value
+
+        results = benchmark.run( **benchmark_options )
+
+        self.stdout.write( json.dumps( results, indent = 4, default = str ) )
@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bank_controller.models import Credit
+from bank_controller.routers import get_account_databases
+from bank_controller.services.credit_service import find_inconsistent_credits
+
+
+class Command( BaseCommand ):
+    """
+        Checks the status columns of the credits ( "Credit.STATUS_FIELDS" ) against the "calc_*" functions of "services/credit_service.py".
+        Reports every inconsistent credit, "--fix" writes the computed values. Exits with an error if an inconsistent credit was left unfixed.
+    """
+
+    help = 'Checks the status columns of the credits against the calculations ( "--fix" repairs them )'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--fix', action = 'store_true', help = 'Write the computed status of the inconsistent credits' )
+        parser.add_argument( '--batch-size', type = int, default = 1000 )
+
+    def handle( self, *args, **options ):
+        inconsistent = 0
+
+        # Every shard with account sharding, otherwise only the primary
+        for using in get_account_databases():
+            for credit, differences in find_inconsistent_credits( using = using, batch_size = options['batch_size'] ):
+                inconsistent += 1
+
+                for name, ( stored, computed ) in differences.items():
+                    self.stdout.write( f'Credit {credit.pk} ( {using} ): {name} is {stored}, expected {computed}' )
+
+                if options['fix']:
+                    Credit.objects.using( using ).filter( pk = credit.pk ).update( **{ name : computed for name, ( _, computed ) in differences.items() } )
+
+        if inconsistent and not options['fix']:
+            raise CommandError( f'{inconsistent} credits have inconsistent status columns' )
+
+        self.stdout.write( self.style.SUCCESS( f'{inconsistent} inconsistent credits{" fixed" if inconsistent else ""}' ) )
@@ -0,0 +1,51 @@
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank_controller.routers import get_account_databases
+from bank_controller.services.clock_service import SimulatedClock
+from bank_controller.services.credit_service import fast_forward_credits
+
+
+class Command( BaseCommand ):
+    """
+        Replays the lifecycle of the credits in the simulated time: advances a simulated clock by "--periods" periods,
+        running the sweep of the credits "--sweeps" times a period, and prints the state of the credits after every period.
+        The payments, the rate escalations and the blockings are written to the database, so it must be run on a staging copy.
+    """
+
+    help = 'Fast-forwards the credit processing in the simulated time ( changes the credits, run it on a staging copy )'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--periods', type = int, default = 12, help = 'Number of the periods ( UNIT_PAYMENT_CREDIT_TIME ) to simulate' )
+        parser.add_argument( '--sweeps', type = int, default = 1, help = 'Number of the sweeps of the credits a period' )
+        parser.add_argument( '--start', help = 'Start of the simulated time in the ISO 8601 format ( now by default )' )
+        parser.add_argument( '--noinput', '--no-input', action = 'store_false', dest = 'interactive', help = 'Do not ask for the confirmation' )
+
+    def handle( self, *args, **options ):
+        if options['periods'] < 1 or options['sweeps'] < 1:
+            raise CommandError( 'The periods and the sweeps must be positive' )
+
+        try:
+            start = datetime.datetime.fromisoformat( options['start'] ) if options['start'] else None
+        except ValueError:
+            raise CommandError( f'Invalid start "{options["start"]}", expected an ISO 8601 date' )
+
+        if start is not None and start.tzinfo is None:
+            raise CommandError( 'The start must have a time zone' )
+
+        if options['interactive']:
+            answer = input( 'The credits of all databases will be changed. Is it a staging copy? Type "yes" to continue: ' )
+            if answer != 'yes':
+                raise CommandError( 'Cancelled' )
+
+        for using in get_account_databases():
+            clock = SimulatedClock( start )
+
+            for state in fast_forward_credits( clock, options['periods'], sweeps_per_period = options['sweeps'], using = using ):
+                self.stdout.write(
+                    f'{using} {state["time"].isoformat()}: {state["credits"]} credits, '
+                    f'{state["increased_percentage"]} with the increased percentage, {state["blocked_accounts"]} blocked accounts'
+                )
+
+        self.stdout.write( self.style.SUCCESS( 'Done' ) )
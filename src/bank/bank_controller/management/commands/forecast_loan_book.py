@@ -0,0 +1,53 @@
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank_controller.services.loan_book_service import load_portfolio, forecast_loan_book
+
+
+class Command( BaseCommand ):
+    """
+        Forecasts the cash flows of the loan book for the next "--periods" periods under the scenarios ( "--scenario name=miss_rate",
+        the probability that a borrower misses a due payment ) and prints the aggregates of every period as JSON.
+        See "services/loan_book_service.py"
+    """
+
+    help = 'Forecasts the repayments, rate escalations and blockings of the loan book under Monte-Carlo scenarios'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--periods', type = int, default = 12 )
+        parser.add_argument( '--runs', type = int, default = 100, help = 'Number of the Monte-Carlo runs of every scenario' )
+        parser.add_argument( '--scenario', action = 'append', default = [], help = 'Scenario in the form name=miss_rate ( "base=0.05" by default )' )
+        parser.add_argument( '--seed', type = int, default = 0 )
+        parser.add_argument( '--workers', type = int, default = os.cpu_count(), help = 'Number of the processes of the pool' )
+        parser.add_argument( '--chunk-size', type = int, default = 10000, help = 'Number of the credits simulated by one task of the pool' )
+
+    def handle( self, *args, **options ):
+        scenarios = {}
+
+        for scenario in options['scenario'] or [ 'base=0.05' ]:
+            name, separator, miss_rate = scenario.partition( '=' )
+
+            try:
+                scenarios[ name ] = float( miss_rate )
+            except ValueError:
+                raise CommandError( f'Invalid scenario "{scenario}", expected name=miss_rate' )
+
+            if not separator or not 0 <= scenarios[ name ] <= 1:
+                raise CommandError( f'Invalid scenario "{scenario}", the miss rate must be between 0 and 1' )
+
+        if min( options['periods'], options['runs'], options['workers'], options['chunk_size'] ) < 1:
+            raise CommandError( 'The periods, the runs, the workers and the chunk size must be positive' )
+
+        forecast = forecast_loan_book(
+            load_portfolio(),
+            scenarios,
+            periods = options['periods'],
+            runs = options['runs'],
+            seed = options['seed'],
+            workers = options['workers'],
+            chunk_size = options['chunk_size'],
+        )
+
+        self.stdout.write( json.dumps( forecast, indent = 4 ) )
@@ -0,0 +1,59 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank_controller.services.dataset_service import generate_dataset, delete_dataset
+
+
+class Command( BaseCommand ):
+    """
+        Generates a synthetic dataset for the benchmarks and the staging databases: users, cash accounts, credits in every state
+        and a skewed history of purchases, transfers and messages ( see "services/dataset_service.py" ). Prints the numbers of the created rows as JSON.
+        The same seed gives the same dataset, "--delete" removes the dataset of the seed.
+    """
+
+    help = 'Generates a deterministic synthetic dataset ( users, cash accounts, credits and history )'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( 'users', type = int, help = 'Number of the users' )
+        parser.add_argument( '--seed', type = int, default = 0 )
+        parser.add_argument( '--purchases', type = int, default = 50, help = 'Average number of the purchases of a user' )
+        parser.add_argument( '--transfers', type = int, default = 10, help = 'Average number of the sent transfers of a user' )
+        parser.add_argument( '--messages', type = int, default = 5, help = 'Average number of the messages of a user' )
+        parser.add_argument( '--credit-rate', type = float, default = 0.2, help = 'Share of the accounts with a credit' )
+        parser.add_argument( '--merchants', type = int, default = 1000 )
+        parser.add_argument( '--days', type = int, default = 365, help = 'Number of the days the history spans' )
+        parser.add_argument( '--password', help = 'Password of all the users ( an unusable one by default )' )
+        parser.add_argument( '--chunk-size', type = int, default = 10000, help = 'Number of the users generated and inserted at a time' )
+        parser.add_argument( '--batch-size', type = int, default = 5000 )
+        parser.add_argument( '--no-rollups', action = 'store_false', dest = 'rollups', help = 'Do not rebuild the spending rollups' )
+        parser.add_argument( '--delete', action = 'store_true', help = 'Delete the dataset of the seed instead' )
+
+    def handle( self, *args, **options ):
+        if options['delete']:
+            deleted = delete_dataset( options['seed'] )
+            self.stdout.write( self.style.SUCCESS( f'Deleted {deleted} users of the dataset {options["seed"]}' ) )
+            return
+
+        if min( options['users'], options['merchants'], options['days'], options['chunk_size'], options['batch_size'] ) < 1:
+            raise CommandError( 'The users, the merchants, the days, the chunk size and the batch size must be positive' )
+
+        if not 0 <= options['credit_rate'] <= 1:
+            raise CommandError( 'The credit rate must be between 0 and 1' )
+
+        summary = generate_dataset(
+            options['users'],
+            seed = options['seed'],
+            purchases = options['purchases'],
+            transfers = options['transfers'],
+            messages = options['messages'],
+            credit_rate = options['credit_rate'],
+            merchants = options['merchants'],
+            days = options['days'],
+            password = options['password'],
+            chunk_size = options['chunk_size'],
+            batch_size = options['batch_size'],
+            rollups = options['rollups'],
+        )
+
+        self.stdout.write( json.dumps( summary, indent = 4 ) )
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bank_controller.models import CashAccount
+from bank_controller.services.cash_management_service import set_hot_account_slots
+
+
+class Command( BaseCommand ):
+    """
+        Switches a cash account to the hot account mode: its replenishments are spread over "--slots" sub-balances.
+        "--slots 0" switches the mode off, see "services/cash_management_service.py"
+    """
+
+    help = 'Switches a cash account to the hot account mode ( or off with "--slots 0" )'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( 'account', help = 'Id of the cash account' )
+        parser.add_argument( '--slots', type = int, default = 16, help = 'Number of the sub-balances of the account' )
+
+    def handle( self, *args, **options ):
+        if options['slots'] < 0:
+            raise CommandError( 'The number of slots cannot be negative' )
+
+        try:
+            cash_account = CashAccount.objects.get( pk = options['account'] )
+        except ( CashAccount.DoesNotExist, ValueError ):
+            raise CommandError( f'Cash account "{options["account"]}" does not exist' )
+
+        set_hot_account_slots( cash_account, options['slots'] )
+
+        self.stdout.write( self.style.SUCCESS( f'Cash account "{cash_account.pk}" has {options["slots"]} sub-balances' ) )
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+
+
+class Command( BaseCommand ):
+    """
+        Applies the migrations to the primary database and to every account shard ( read replicas get them through replication ).
+        Runs as a separate one-shot step before the API and the workers are started, see "docker-compose.yaml"
+    """
+
+    help = 'Applies the migrations to the primary database and to every account shard'
+
+    def handle( self, *args, **options ):
+        for alias in dict.fromkeys( [ DEFAULT_DB_ALIAS, *settings.ACCOUNT_SHARDS ] ):
+            self.stdout.write( f'Migrating the "{alias}" database' )
+            call_command( 'migrate', database = alias, interactive = False, verbosity = options['verbosity'], stdout = self.stdout )
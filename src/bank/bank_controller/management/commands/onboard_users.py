@@ -0,0 +1,71 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from bank_controller.services.onboarding_service import onboard_users
+
+
+class Command( BaseCommand ):
+    """
+        Creates users and their cash accounts from a CSV ( with a header ) or NDJSON file.
+
+        Fields of a row: email, first_name, last_name, birth_date ( optional ), password ( optional, a hash with --pre-hashed ).
+        Passwords are hashed in a process pool, users are inserted with bulk inserts, one transaction per chunk.
+        Rows that cannot be created are reported as NDJSON lines ( line, email, error ) to --errors-file or stderr.
+    """
+
+    help = 'Creates users and their cash accounts from a CSV or NDJSON file'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( 'path', help = 'Path to the file ( "-" for stdin )' )
+        parser.add_argument( '--format', choices = ( 'csv', 'ndjson' ), help = 'Format of the file, by default taken from the file extension' )
+        parser.add_argument( '--chunk-size', type = int, default = 1000 )
+        parser.add_argument( '--workers', type = int, default = None, help = 'Number of password hashing processes ( 0 - hash in this process ). By default - the number of CPUs' )
+        parser.add_argument( '--pre-hashed', action = 'store_true', help = 'The "password" field contains password hashes' )
+        parser.add_argument( '--errors-file', help = 'Path of the NDJSON file for the rows that were not created' )
+
+    def handle( self, *args, **options ):
+        file_format = options['format']
+        if file_format is None:
+            if options['path'].endswith( '.csv' ):
+                file_format = 'csv'
+            elif options['path'].endswith( ( '.ndjson', '.jsonl' ) ):
+                file_format = 'ndjson'
+            else:
+                raise CommandError( 'Cannot detect the format of the file, use --format' )
+
+        def on_chunk( report ):
+            self.stdout.write(
+                f'{report["rows"]} rows processed: {report["created"]} created, {len( report["errors"] )} errors, '
+                f'{report["rows_per_second"]:.0f} rows/s'
+            )
+
+        stream = sys.stdin if options['path'] == '-' else open( options['path'], newline = '', encoding = 'utf-8' )
+
+        try:
+            report = onboard_users(
+                stream,
+                file_format,
+                chunk_size = options['chunk_size'],
+                pre_hashed = options['pre_hashed'],
+                workers = options['workers'],
+                on_chunk = on_chunk,
+            )
+        finally:
+            if stream is not sys.stdin:
+                stream.close()
+
+        errors_stream = open( options['errors_file'], 'w', encoding = 'utf-8' ) if options['errors_file'] else self.stderr
+
+        try:
+            for line_number, email, message in report['errors']:
+                errors_stream.write( json.dumps( { 'line' : line_number, 'email' : email, 'error' : message } ) + '\n' )
+        finally:
+            if options['errors_file']:
+                errors_stream.close()
+
+        self.stdout.write( self.style.SUCCESS(
+            f'Created {report["created"]} of {report["rows"]} users in {report["seconds"]:.2f} s '
+            f'( {report["rows_per_second"]:.0f} rows/s ), {len( report["errors"] )} errors'
+        ) )
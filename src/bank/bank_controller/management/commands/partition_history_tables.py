@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from bank_controller.routers import get_account_databases
+from bank_controller.services.partition_service import is_partitioning_supported, partition_history_tables, unpartition_history_tables
+
+
+class Command( BaseCommand ):
+    """
+        Converts the history tables into tables partitioned by month on "creation_date" ( see "services/partition_service.py" ).
+        The migration "0004_history_partitioning" converts them on migrate, the command is run by hand when settings.HISTORY_PARTITIONING is enabled later.
+        The tables that are already converted are skipped, "--reverse" converts them back into regular tables
+    """
+
+    help = 'Converts the history tables into tables partitioned by month ( PostgreSQL only )'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--database', help = 'Alias of the database ( every database that stores cash accounts by default )' )
+        parser.add_argument( '--months-ahead', type = int, help = 'Number of the monthly partitions to create ahead ( HISTORY_PARTITIONING["MONTHS_AHEAD"] by default )' )
+        parser.add_argument( '--reverse', action = 'store_true', help = 'Convert the partitioned tables back into regular tables' )
+
+    def handle( self, *args, **options ):
+        aliases = [ options['database'] ] if options['database'] else get_account_databases()
+
+        for alias in aliases:
+            if alias not in connections:
+                raise CommandError( f'Database "{alias}" does not exist' )
+
+            connection = connections[ alias ]
+
+            if options['reverse']:
+                tables = unpartition_history_tables( connection = connection )
+            elif is_partitioning_supported( connection ):
+                tables = partition_history_tables( months_ahead = options['months_ahead'], connection = connection )
+            else:
+                raise CommandError( 'History partitioning is disabled or the database is not PostgreSQL' )
+
+            self.stdout.write( self.style.SUCCESS( f'{alias}: converted {len( tables )} tables {", ".join( tables )}'.rstrip() ) )
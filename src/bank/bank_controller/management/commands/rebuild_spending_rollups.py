@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from bank_controller.models import CashAccount
+from bank_controller.routers import get_account_databases
+from bank_controller.services.analytics_service import rebuild_spending_rollups
+
+
+class Command( BaseCommand ):
+    """
+        Recalculates the spending rollups from the purchases and transfers.
+        Used to backfill the rollups and to repair them after manual changes of the history.
+    """
+
+    help = 'Recalculates the spending rollups from the purchases and transfers'
+
+    def add_arguments( self, parser ):
+        parser.add_argument( '--account', help = 'Id of the cash account to rebuild ( all accounts by default )' )
+        parser.add_argument( '--batch-size', type = int, default = 1000 )
+
+    def handle( self, *args, **options ):
+        cash_account = None
+
+        if options['account']:
+            try:
+                cash_account = CashAccount.objects.get( pk = options['account'] )
+            except ( CashAccount.DoesNotExist, ValueError ):
+                raise CommandError( f'Cash account "{options["account"]}" does not exist' )
+
+        if cash_account is not None:
+            created = rebuild_spending_rollups( cash_account, batch_size = options['batch_size'] )
+        else:
+            # Every shard with account sharding, otherwise only the primary
+            created = sum(
+                rebuild_spending_rollups( batch_size = options['batch_size'], using = using ) for using in get_account_databases()
+            )
+
+        self.stdout.write( self.style.SUCCESS( f'Created {created} spending rollup rows' ) )
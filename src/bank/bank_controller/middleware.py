@@ -0,0 +1,26 @@
+from rest_framework.permissions import SAFE_METHODS
+
+from bank_controller.routers import pin_to_primary
+
+
+class ReadYourWritesMiddleware:
+    """
+        After a successful write request of an authenticated user, pins the reads of that user to the primary database
+        for a short time, so the following read-only requests see the write even if the replicas are lagging.
+        See "bank_controller/routers.py"
+    """
+
+    def __init__( self, get_response ):
+        self.get_response = get_response
+
+    def __call__( self, request ):
+        response = self.get_response( request )
+
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            # REST framework sets the authenticated user on the django request as well
+            user = getattr( request, 'user', None )
+
+            if user is not None and user.is_authenticated:
+                pin_to_primary( user.pk )
+
+        return response
@@ -0,0 +1,152 @@
+import datetime
+
+from django.conf import settings
+from django.db import migrations
+
+
+# Converts the history tables into tables partitioned by month on "creation_date".
+# Does nothing unless settings.HISTORY_PARTITIONING['ENABLED'] is True and the database is PostgreSQL,
+# a deployment that enables the partitioning later runs the "partition_history_tables" command by hand.
+#
+# The migration keeps its own copy of the conversion of "services/partition_service.py" as of this migration, and the models
+# it converts are read from the historical state, so a later change of the services, the settings or the models does not change it.
+# The "maintain_history_partitions" task creates the partitions of the following months.
+
+MODELS = ( 'bank_controller.Purchase', 'bank_controller.Transfer', 'bank_controller.Message' )
+MONTHS_AHEAD = 3
+
+
+def add_months( value : datetime.date, months : int ) -> datetime.date:
+    month_index = value.year * 12 + value.month - 1 + months
+
+    return datetime.date( month_index // 12, month_index % 12 + 1, 1 )
+
+def is_table_partitioned( cursor, table : str ) -> bool:
+    cursor.execute( 'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass( %s )', [ table ] )
+
+    return cursor.fetchone() is not None
+
+def collect_rebuild_statements( cursor, table : str, new_table : str ) -> list[ str ]:
+    # The secondary indexes and the foreign keys of the "table" for the "new_table", without the primary key and the unique indexes
+    statements = []
+
+    cursor.execute(
+        '''
+            SELECT pg_get_indexdef( index.indexrelid ) FROM pg_index index
+            WHERE index.indrelid = to_regclass( %s ) AND NOT index.indisprimary AND NOT index.indisunique
+        ''',
+        [ table ],
+    )
+    for ( definition, ) in cursor.fetchall():
+        head, tail = definition.split( ' USING ', 1 )
+        statements.append( f'{ head.split( " ON " )[0] } ON "{new_table}" USING {tail}' )
+
+    cursor.execute(
+        '''
+            SELECT conname, pg_get_constraintdef( oid ) FROM pg_constraint
+            WHERE conrelid = to_regclass( %s ) AND contype = 'f'
+        ''',
+        [ table ],
+    )
+    for name, definition in cursor.fetchall():
+        statements.append( f'ALTER TABLE "{new_table}" ADD CONSTRAINT "{name}" {definition}' )
+
+    return statements
+
+def move_id_sequence( cursor, old_table : str, new_table : str ) -> None:
+    # The "id" column of the "new_table" uses ( and owns ) a sequence that continues the ids of the "old_table"
+    cursor.execute( "SELECT attidentity FROM pg_attribute WHERE attrelid = to_regclass( %s ) AND attname = 'id'", [ old_table ] )
+
+    if not cursor.fetchone()[0]:
+        cursor.execute( "SELECT pg_get_serial_sequence( %s, 'id' )", [ old_table ] )
+        cursor.execute( f'ALTER SEQUENCE {cursor.fetchone()[0]} OWNED BY "{new_table}".id' )
+        return
+
+    sequence = f'{new_table}_id_partitioned_seq'
+    cursor.execute( f'CREATE SEQUENCE IF NOT EXISTS "{sequence}" OWNED BY "{new_table}".id' )
+    cursor.execute( f'''SELECT setval( '"{sequence}"', COALESCE( ( SELECT MAX( id ) FROM "{new_table}" ), 0 ) + 1, false )''' )
+    cursor.execute( f'''ALTER TABLE "{new_table}" ALTER COLUMN id SET DEFAULT nextval( '"{sequence}"' )''' )
+
+def partition_table( cursor, table : str ) -> None:
+    # The primary key becomes ( id, creation_date ), PostgreSQL requires the partition key in every unique constraint
+    if is_table_partitioned( cursor, table ):
+        return
+
+    legacy = f'{table}_legacy'
+
+    cursor.execute( f'ALTER TABLE "{table}" RENAME TO "{legacy}"' )
+    cursor.execute( f'CREATE TABLE "{table}" ( LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS ) PARTITION BY RANGE ( creation_date )' )
+
+    # Partitions for every month that already has rows, up to MONTHS_AHEAD months ahead, plus a default partition
+    cursor.execute( f'SELECT MIN( creation_date ) FROM "{legacy}"' )
+    first_row_date = cursor.fetchone()[0]
+
+    today = datetime.datetime.now( tz = datetime.timezone.utc ).date()
+    current_month = datetime.date( today.year, today.month, 1 )
+    month = datetime.date( first_row_date.year, first_row_date.month, 1 ) if first_row_date else current_month
+
+    while month <= add_months( current_month, MONTHS_AHEAD ):
+        cursor.execute(
+            f'''CREATE TABLE "{table}_p{month:%Y_%m}" PARTITION OF "{table}" '''
+            f'''FOR VALUES FROM ( '{month.isoformat()} 00:00:00+00' ) TO ( '{add_months( month, 1 ).isoformat()} 00:00:00+00' )'''
+        )
+        month = add_months( month, 1 )
+
+    cursor.execute( f'CREATE TABLE "{table}_default" PARTITION OF "{table}" DEFAULT' )
+    cursor.execute( f'INSERT INTO "{table}" SELECT * FROM "{legacy}"' )
+
+    rebuild_statements = collect_rebuild_statements( cursor, legacy, table )
+    move_id_sequence( cursor, legacy, table )
+
+    cursor.execute( f'DROP TABLE "{legacy}"' )
+    cursor.execute( f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY ( id, creation_date )' )
+
+    for statement in rebuild_statements:
+        cursor.execute( statement )
+
+def unpartition_table( cursor, table : str ) -> None:
+    if not is_table_partitioned( cursor, table ):
+        return
+
+    partitioned = f'{table}_partitioned'
+
+    cursor.execute( f'ALTER TABLE "{table}" RENAME TO "{partitioned}"' )
+    cursor.execute( f'CREATE TABLE "{table}" ( LIKE "{partitioned}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS )' )
+    cursor.execute( f'INSERT INTO "{table}" SELECT * FROM "{partitioned}"' )
+
+    rebuild_statements = collect_rebuild_statements( cursor, partitioned, table )
+    move_id_sequence( cursor, partitioned, table )
+
+    cursor.execute( f'DROP TABLE "{partitioned}" CASCADE' )
+    cursor.execute( f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY ( id )' )
+
+    for statement in rebuild_statements:
+        cursor.execute( statement )
+
+
+def forwards( apps, schema_editor ):
+    if not settings.HISTORY_PARTITIONING['ENABLED'] or schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for label in MODELS:
+            partition_table( cursor, apps.get_model( label )._meta.db_table )
+
+def backwards( apps, schema_editor ):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    with schema_editor.connection.cursor() as cursor:
+        for label in MODELS:
+            unpartition_table( cursor, apps.get_model( label )._meta.db_table )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0003_credit_amount_returned'),
+    ]
+
+    operations = [
+        migrations.RunPython( forwards, backwards ),
+    ]
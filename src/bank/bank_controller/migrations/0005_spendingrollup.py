@@ -0,0 +1,30 @@
+# Generated by Django 4.0.7 on 2026-10-19 10:37
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0004_history_partitioning'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('category', models.CharField(choices=[('purchase', 'purchase'), ('transfer_sent', 'transfer_sent'), ('transfer_recieved', 'transfer_recieved')], max_length=31)),
+                ('merchant', models.CharField(blank=True, max_length=255)),
+                ('total', models.PositiveBigIntegerField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('cash_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spending_rollups', to='bank_controller.cashaccount')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='spendingrollup',
+            constraint=models.UniqueConstraint(fields=('cash_account', 'day', 'category', 'merchant'), name='unique_spending_rollup'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+from collections import defaultdict
+
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+
+# The purchases are converted in batches of BATCH_SIZE rows ordered by the primary key,
+# so the memory usage does not depend on the size of the table
+
+BATCH_SIZE = 1000
+
+
+def forwards( apps, schema_editor ):
+    Purchase = apps.get_model( 'bank_controller', 'Purchase' )
+    Merchant = apps.get_model( 'bank_controller', 'Merchant' )
+    db_alias = schema_editor.connection.alias
+
+    merchant_ids = {}
+    last_pk = 0
+
+    while True:
+        rows = list(
+            Purchase.objects.using( db_alias ).filter( pk__gt = last_pk ).order_by( 'pk' ).values_list( 'pk', 'merchant' )[ :BATCH_SIZE ]
+        )
+
+        if not rows:
+            break
+
+        last_pk = rows[-1][0]
+
+        # Creates the merchants that were not met in the previous batches
+        new_names = { name for _, name in rows if name not in merchant_ids }
+        if new_names:
+            Merchant.objects.using( db_alias ).bulk_create( [ Merchant( name = name ) for name in new_names ], ignore_conflicts = True )
+            merchant_ids.update( Merchant.objects.using( db_alias ).filter( name__in = new_names ).values_list( 'name', 'id' ) )
+
+        # One update per merchant of the batch
+        pks_by_merchant = defaultdict( list )
+        for pk, name in rows:
+            pks_by_merchant[ merchant_ids[ name ] ].append( pk )
+
+        for merchant_id, pks in pks_by_merchant.items():
+            Purchase.objects.using( db_alias ).filter( pk__in = pks ).update( merchant_ref_id = merchant_id )
+
+def backwards( apps, schema_editor ):
+    Purchase = apps.get_model( 'bank_controller', 'Purchase' )
+    Merchant = apps.get_model( 'bank_controller', 'Merchant' )
+    db_alias = schema_editor.connection.alias
+
+    Purchase.objects.using( db_alias ).update(
+        merchant = Subquery( Merchant.objects.filter( pk = OuterRef( 'merchant_ref_id' ) ).values( 'name' )[ :1 ] )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0006_merchant'),
+    ]
+
+    operations = [
+        migrations.RunPython( forwards, backwards ),
+    ]
@@ -0,0 +1,27 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0007_purchase_merchant_ref_data'),
+    ]
+
+    operations = [
+        # The default lets the column be added back ( and filled by 0007 ) when the migration is reversed
+        migrations.AlterField(
+            model_name='purchase',
+            name='merchant',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.RemoveField(
+            model_name='purchase',
+            name='merchant',
+        ),
+        migrations.AlterField(
+            model_name='purchase',
+            name='merchant_ref',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='purchases', to='bank_controller.merchant'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.0.7 on 2026-10-19 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0008_remove_purchase_merchant'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['cash_account', 'is_ignore', 'creation_date'], name='purchase_history_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['cash_account', 'is_ignore', 'merchant_ref'], name='purchase_history_merchant_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['cash_account', 'is_ignore', 'amount'], name='purchase_history_amount_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['sender', 'is_ignore', 'creation_date'], name='transfer_sent_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transfer',
+            index=models.Index(fields=['reciever', 'is_ignore', 'creation_date'], name='transfer_recieved_date_idx'),
+        ),
+    ]
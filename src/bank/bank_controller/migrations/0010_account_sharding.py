@@ -0,0 +1,65 @@
+# Generated by Django 4.0.7 on 2026-10-19 11:07
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+import uuid
+
+
+def fill_cash_account_uuid( apps, schema_editor ):
+    User = apps.get_model( 'bank_controller', 'User' )
+    CashAccount = apps.get_model( 'bank_controller', 'CashAccount' )
+    db_alias = schema_editor.connection.alias
+
+    User.objects.using( db_alias ).update(
+        cash_account_uuid = Subquery( CashAccount.objects.using( db_alias ).filter( user = OuterRef( 'pk' ) ).values( 'id' )[ :1 ] )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0009_history_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='cash_account_uuid',
+            field=models.UUIDField(editable=False, null=True),
+        ),
+        migrations.RunPython( fill_cash_account_uuid, migrations.RunPython.noop ),
+        migrations.AlterField(
+            model_name='cashaccount',
+            name='user',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.PROTECT, related_name='cash_account', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='reciever',
+            field=models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recieved_transfers', to='bank_controller.cashaccount'),
+        ),
+        migrations.AlterField(
+            model_name='transfer',
+            name='sender',
+            field=models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='sent_transfers', to='bank_controller.cashaccount'),
+        ),
+        migrations.CreateModel(
+            name='TransferOutbox',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('is_delivered', models.BooleanField(db_index=True, default=False)),
+                ('creation_date', models.DateTimeField(auto_now_add=True)),
+                ('transfer', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='outbox', to='bank_controller.transfer')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='TransferInbox',
+            fields=[
+                ('outbox_id', models.UUIDField(primary_key=True, serialize=False)),
+                ('creation_date', models.DateTimeField(auto_now_add=True)),
+                ('transfer', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='inbox', to='bank_controller.transfer')),
+            ],
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.7 on 2026-10-19 11:10
+
+import bank_controller.services.general_service
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0010_account_sharding'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='cashaccount',
+            name='id',
+            field=models.UUIDField(db_index=True, default=bank_controller.services.general_service.generate_uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='user',
+            name='id',
+            field=models.UUIDField(db_index=True, default=bank_controller.services.general_service.generate_uuid7, editable=False, primary_key=True, serialize=False, unique=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.0.7 on 2026-10-19 11:32
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0012_email_outbox'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cashaccount',
+            name='hot_account_slots',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='CashAccountSubBalance',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('slot', models.PositiveSmallIntegerField()),
+                ('amount', models.PositiveBigIntegerField(default=0)),
+                ('cash_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sub_balances', to='bank_controller.cashaccount')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='cashaccountsubbalance',
+            constraint=models.UniqueConstraint(fields=('cash_account', 'slot'), name='unique_cash_account_sub_balance'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 4.0.7 on 2026-10-19 11:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0013_hot_account_sub_balances'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AccountEvent',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('purchase', 'purchase'), ('transfer_sent', 'transfer_sent'), ('transfer_recieved', 'transfer_recieved'), ('credit_created', 'credit_created'), ('credit_payment', 'credit_payment'), ('credit_escalated', 'credit_escalated'), ('credit_repaid', 'credit_repaid'), ('account_blocked', 'account_blocked'), ('account_unblocked', 'account_unblocked'), ('message', 'message')], max_length=31)),
+                ('payload', models.JSONField(default=dict)),
+                ('sequence', models.PositiveBigIntegerField(null=True, unique=True)),
+                ('is_published', models.BooleanField(default=False)),
+                ('creation_date', models.DateTimeField(auto_now_add=True)),
+                ('cash_account', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='bank_controller.cashaccount')),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='accountevent',
+            index=models.Index(fields=['is_published', 'sequence'], name='account_event_unpublished_idx'),
+        ),
+    ]
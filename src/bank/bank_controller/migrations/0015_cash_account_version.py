@@ -0,0 +1,23 @@
+# Generated by Django 4.0.7 on 2026-10-19 11:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0014_account_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cashaccount',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='cashaccountsubbalance',
+            name='version',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,90 @@
+# Generated by Django 4.0.7 on 2026-10-19 12:11
+
+import datetime
+from math import ceil
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# The status columns of the existing credits are computed in batches of BATCH_SIZE rows ordered by the primary key.
+# The migration keeps its own copy of the calculation of "calc_credit_status" as of this migration ( "services/credit_service.py" ),
+# so a later change of the services does not change what it writes
+
+BATCH_SIZE = 1000
+
+
+def calc_credit_status( credit ) -> dict:
+    total = credit.amount + ( credit.amount / 100 ) * ( 1 + int( credit.is_increased_percentage ) )
+    remaining = total - credit.amount_returned
+
+    if remaining <= 0:
+        return { 'next_payment_date' : None, 'next_installment_amount' : 0, 'remaining_amount' : 0, 'remaining_parts' : 0 }
+
+    part = min( total / credit.loan_duration, remaining )
+    remaining_parts = ceil( remaining / part )
+
+    key = next( i for i in settings.UNIT_PAYMENT_CREDIT_TIME.keys() )
+    plus_to_credit_time = {
+        key : credit.loan_duration - remaining_parts + int( credit.is_increased_percentage ) + 1
+    }
+
+    return {
+        'next_payment_date' : credit.creation_date + datetime.timedelta( **plus_to_credit_time ),
+        'next_installment_amount' : part,
+        'remaining_amount' : remaining,
+        'remaining_parts' : remaining_parts,
+    }
+
+
+def forwards( apps, schema_editor ):
+    Credit = apps.get_model( 'bank_controller', 'Credit' )
+    db_alias = schema_editor.connection.alias
+    status_fields = ( 'next_payment_date', 'next_installment_amount', 'remaining_amount', 'remaining_parts' )
+
+    last_pk = 0
+
+    while True:
+        credits = list( Credit.objects.using( db_alias ).filter( pk__gt = last_pk ).order_by( 'pk' )[ :BATCH_SIZE ] )
+
+        if not credits:
+            break
+
+        last_pk = credits[-1].pk
+
+        for credit in credits:
+            for name, value in calc_credit_status( credit ).items():
+                setattr( credit, name, value )
+
+        Credit.objects.using( db_alias ).bulk_update( credits, status_fields )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0015_cash_account_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='credit',
+            name='next_installment_amount',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='next_payment_date',
+            field=models.DateTimeField(db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='remaining_amount',
+            field=models.FloatField(db_index=True, default=0),
+        ),
+        migrations.AddField(
+            model_name='credit',
+            name='remaining_parts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.RunPython( forwards, migrations.RunPython.noop ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.0.7 on 2026-10-19 12:19
+
+import bank_controller.services.clock_service
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0016_credit_status'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='credit',
+            name='creation_date',
+            field=models.DateTimeField(default=bank_controller.services.clock_service.now),
+        ),
+        migrations.AlterField(
+            model_name='credit',
+            name='last_payment_date',
+            field=models.DateTimeField(default=bank_controller.services.clock_service.now),
+        ),
+    ]
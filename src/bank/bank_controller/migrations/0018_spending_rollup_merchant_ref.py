@@ -0,0 +1,66 @@
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+import django.db.models.deletion
+
+
+# The rollups refer to the merchant dimension instead of copying the name ( as the purchases since "0007_purchase_merchant_ref_data" ).
+# The names are converted in batches of BATCH_SIZE names, the merchants that do not exist are created
+
+BATCH_SIZE = 1000
+
+
+def forwards( apps, schema_editor ):
+    SpendingRollup = apps.get_model( 'bank_controller', 'SpendingRollup' )
+    Merchant = apps.get_model( 'bank_controller', 'Merchant' )
+    db_alias = schema_editor.connection.alias
+
+    names = list( SpendingRollup.objects.using( db_alias ).exclude( merchant = '' ).values_list( 'merchant', flat = True ).distinct().order_by() )
+
+    for start in range( 0, len( names ), BATCH_SIZE ):
+        batch = names[ start : start + BATCH_SIZE ]
+
+        Merchant.objects.using( db_alias ).bulk_create( [ Merchant( name = name ) for name in batch ], ignore_conflicts = True )
+
+        for name, merchant_id in Merchant.objects.using( db_alias ).filter( name__in = batch ).values_list( 'name', 'id' ):
+            SpendingRollup.objects.using( db_alias ).filter( merchant = name ).update( merchant_ref_id = merchant_id )
+
+def backwards( apps, schema_editor ):
+    SpendingRollup = apps.get_model( 'bank_controller', 'SpendingRollup' )
+    Merchant = apps.get_model( 'bank_controller', 'Merchant' )
+    db_alias = schema_editor.connection.alias
+
+    SpendingRollup.objects.using( db_alias ).filter( merchant_ref__isnull = False ).update(
+        merchant = Subquery( Merchant.objects.filter( pk = OuterRef( 'merchant_ref_id' ) ).values( 'name' )[ :1 ] )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0017_credit_dates_clock'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='spendingrollup',
+            name='unique_spending_rollup',
+        ),
+        migrations.AddField(
+            model_name='spendingrollup',
+            name='merchant_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='spending_rollups', to='bank_controller.merchant'),
+        ),
+        migrations.RunPython( forwards, backwards ),
+        migrations.RemoveField(
+            model_name='spendingrollup',
+            name='merchant',
+        ),
+        migrations.AddConstraint(
+            model_name='spendingrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('merchant_ref__isnull', False)), fields=('cash_account', 'day', 'category', 'merchant_ref'), name='unique_spending_rollup'),
+        ),
+        migrations.AddConstraint(
+            model_name='spendingrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('merchant_ref__isnull', True)), fields=('cash_account', 'day', 'category'), name='unique_spending_rollup_without_merchant'),
+        ),
+    ]
@@ -0,0 +1,31 @@
+from django.db import migrations
+
+
+# "0010_account_sharding" created the "transfer" fields of the outbox and the inbox with foreign key constraints,
+# which cannot exist once the transfer table is partitioned ( "partition_history_tables" ). The databases migrated before
+# the fix still have them, they are dropped here. Only PostgreSQL can be partitioned, so the other databases keep them.
+
+TABLES = ( 'TransferOutbox', 'TransferInbox' )
+
+
+def forwards( apps, schema_editor ):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+
+    for name in TABLES:
+        model = apps.get_model( 'bank_controller', name )
+        column = model._meta.get_field( 'transfer' ).column
+
+        for constraint in schema_editor._constraint_names( model, [ column ], foreign_key = True ):
+            schema_editor.execute( schema_editor._delete_fk_sql( model, constraint ) )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0018_spending_rollup_merchant_ref'),
+    ]
+
+    operations = [
+        migrations.RunPython( forwards, migrations.RunPython.noop ),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.0.7 on 2026-10-19 12:51
+
+from decimal import Decimal, ROUND_HALF_UP
+
+from django.db import migrations, models
+
+
+# The amount columns of the credits become decimals rounded to the cents. They are computed again from the fields of the credits
+# ( the float columns may already be rounded by the conversion of the column ), by a copy of the calculation of "calc_credit_status"
+
+BATCH_SIZE = 1000
+
+
+def round_credit_amount( amount : float ) -> Decimal:
+    return Decimal( str( amount ) ).quantize( Decimal( '0.01' ), rounding = ROUND_HALF_UP )
+
+
+def forwards( apps, schema_editor ):
+    Credit = apps.get_model( 'bank_controller', 'Credit' )
+    db_alias = schema_editor.connection.alias
+
+    last_pk = 0
+
+    while True:
+        credits = list( Credit.objects.using( db_alias ).filter( pk__gt = last_pk ).order_by( 'pk' )[ :BATCH_SIZE ] )
+
+        if not credits:
+            break
+
+        last_pk = credits[-1].pk
+
+        for credit in credits:
+            total = credit.amount + ( credit.amount / 100 ) * ( 1 + int( credit.is_increased_percentage ) )
+            remaining = total - credit.amount_returned
+
+            if remaining <= 0:
+                credit.next_installment_amount = credit.remaining_amount = Decimal( '0.00' )
+                continue
+
+            credit.next_installment_amount = round_credit_amount( min( total / credit.loan_duration, remaining ) )
+            credit.remaining_amount = round_credit_amount( remaining )
+
+        Credit.objects.using( db_alias ).bulk_update( credits, ( 'next_installment_amount', 'remaining_amount' ) )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('bank_controller', '0019_transfer_outbox_no_constraint'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='credit',
+            name='next_installment_amount',
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AlterField(
+            model_name='credit',
+            name='remaining_amount',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.RunPython( forwards, migrations.RunPython.noop ),
+    ]
@@ -64,4 +64,20 @@ class SerializerWithAmountValidation( BaseCashAccountSerializer ):
         if checking_availability_money( value, cash_account ):
             return value
         
-        raise ValidationError( 'There are not enough funds on your cash account' )
\ No newline at end of file
+        raise ValidationError( 'There are not enough funds on your cash account' )
+
+
+class SparseFieldsetSerializerMixin:
+    """
+        Serializer mixin for the sparse fieldsets of the account resources ( see "SparseFieldsetQuerySerializer" ).
+        Keeps only the fields listed in context['fields'] ( all of them if it is None ), so the other ones are not computed
+    """
+
+    def __init__( self, *args, **kwargs ):
+        super().__init__( *args, **kwargs )
+
+        fields = self.context.get( 'fields' )
+
+        if fields is not None:
+            for name in set( self.fields ) - set( fields ):
+                self.fields.pop( name )
@@ -1,8 +1,14 @@
+from django.db import router
 from django.db.models import Model
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework import status
+from rest_framework.permissions import SAFE_METHODS
 
-from bank_controller.services.general_service import *
+from bank_controller.services.general_service import id_list_validate, set_ignore_status_for_queryset
+from bank_controller.services.version_service import get_version, bump_version
+from bank_controller.serializers import HistorySearchSerializer, SparseFieldsetQuerySerializer
+from bank_controller.routers import choose_read_database, set_read_database, reset_read_database
 
 
 
@@ -57,15 +63,122 @@ class ClearHistoryMixinAPIView( APIView ):
 
         id_list = request.data.get( 'id_list' )
 
+        # The records live on the database of the cash account ( see "bank_controller/routers.py" )
+        objects = cls.model.objects.db_manager( router.db_for_write( cls.model, instance = request.user.cash_account ) )
+
         if not id_list:
-            set_ignore_status_for_queryset( True, cls.model.objects.filter( cash_account = request.user.cash_account ) )
+            set_ignore_status_for_queryset( True, objects.filter( cash_account = request.user.cash_account ) )
         else:
             validation_result = id_list_validate( id_list )
             
             if not validation_result[0]:
                 return Response( data = validation_result[1], status = 400 )
                 
-            queryset = cls.model.objects.filter( pk__in = id_list, cash_account = request.user.cash_account )
+            queryset = objects.filter( pk__in = id_list, cash_account = request.user.cash_account )
             set_ignore_status_for_queryset( True, queryset = queryset )
+
+        # The history is a part of the cash account resource
+        bump_version( request.user.cash_account )
         
-        return Response( status = 200 )
\ No newline at end of file
+        return Response( status = 200 )
+
+
+class HistorySearchMixin:
+    """
+        Mixin for views that show the history of the cash account.
+        Validates the history search parameters of the query string ( see "HistorySearchSerializer" ) and passes them
+        to the serializer context as "history_filters". Invalid parameters cause a 400 response.
+    """
+
+    def get_history_filters( self ) -> dict:
+        serializer = HistorySearchSerializer( data = self.request.query_params )
+        serializer.is_valid( raise_exception = True )
+
+        return serializer.validated_data
+
+    def get_serializer_context( self ):
+        context = super().get_serializer_context()
+        context['history_filters'] = self.get_history_filters()
+
+        return context
+
+
+class SparseFieldsetMixin:
+    """
+        Mixin for views of the account resources. Validates the "fields" and "expand" query parameters ( see "SparseFieldsetQuerySerializer" )
+        and passes them to the serializer context as "fields" and "expand". Invalid parameters cause a 400 response.
+    """
+
+    # The fields of the resource, and the fields of the related resources that can be expanded ( { resource : fields } )
+    sparse_fields : tuple = ()
+    expandable : dict = {}
+
+    def get_sparse_fieldset( self ) -> dict:
+        serializer = SparseFieldsetQuerySerializer(
+            data = self.request.query_params,
+            context = { 'fields' : self.sparse_fields, 'expandable' : self.expandable },
+        )
+        serializer.is_valid( raise_exception = True )
+
+        return serializer.validated_data
+
+    def get_serializer_context( self ):
+        context = super().get_serializer_context()
+        context.update( self.get_sparse_fieldset() )
+
+        return context
+
+
+class ReplicaReadMixin:
+    """
+        Mixin for read-only views. After authentication ( which always reads from the primary ), the reads of the request
+        go to one of the read replicas, unless the user has written recently. See "bank_controller/routers.py"
+    """
+
+    _read_database_token = None
+
+    def initial( self, request, *args, **kwargs ):
+        self.perform_authentication( request )
+
+        if request.method in SAFE_METHODS:
+            self._read_database_token = set_read_database( choose_read_database( request.user ) )
+
+        super().initial( request, *args, **kwargs )
+
+    def finalize_response( self, request, response, *args, **kwargs ):
+        if self._read_database_token is not None:
+            reset_read_database( self._read_database_token )
+            self._read_database_token = None
+
+        return super().finalize_response( request, response, *args, **kwargs )
+
+
+class ConditionalGetMixin:
+    """
+        Mixin for read-only views of the cash account resources. The version of the cash account of the user ( see "services/version_service.py" )
+        is served as the ETag, and a request with a matching "If-None-Match" gets a 304 response: the cash account is read ( by the permission check
+        of the cash account views ), nothing is serialized
+    """
+
+    def get_etag( self, request ) -> str | None:
+        if request.user.cash_account_uuid is None:
+            return None
+
+        # The version is read before the response is built: a change made in between gives a newer response with the older ETag,
+        # which is only a needless 200 for the next request
+        version = get_version( request.user.cash_account )
+
+        return f'"{request.user.cash_account_uuid}.{version}.{request.accepted_renderer.format}"'
+
+    def get( self, request, *args, **kwargs ):
+        etag = self.get_etag( request )
+
+        if etag is not None and etag in [ value.strip() for value in request.headers.get( 'If-None-Match', '' ).split( ',' ) ]:
+            return Response( status = status.HTTP_304_NOT_MODIFIED, headers = { 'ETag' : etag } )
+
+        response = super().get( request, *args, **kwargs )
+
+        if etag is not None and response.status_code == status.HTTP_200_OK:
+            response['ETag'] = etag
+
+        return response
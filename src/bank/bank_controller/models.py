@@ -1,4 +1,4 @@
-from django.db import models
+from django.db import models, router
 from django.contrib.auth.models import UserManager, AbstractUser
 from django.contrib.auth.hashers import make_password
 from django.conf import settings
@@ -6,7 +6,9 @@ from django.core.validators import MinValueValidator, MaxValueValidator
 
 import uuid
 
-from bank_controller.services.general_service import generate_pin
+from bank_controller.services.general_service import generate_pin, generate_uuid7
+from bank_controller.services import clock_service
+from bank_controller.routers import get_account_database
 
 
 
@@ -22,12 +24,44 @@ class CustomUserManager(UserManager):
         user = User(email=email, **extra_fields)
         user.password = make_password(password)
         user.full_name = f'{user.first_name} {user.last_name}'
+        user.cash_account_uuid = generate_uuid7()
         user.save(using=self._db)
 
-        CashAccount.objects.create( user = user )
+        # With account sharding the cash account is created on its shard, see "bank_controller/routers.py"
+        CashAccount.objects.using( get_account_database( user.cash_account_uuid, default = self._db ) ).create( id = user.cash_account_uuid, user = user )
         
         return user
 
+    def bulk_create_users( self, users : list[ dict ], batch_size : int = 1000 ) -> list:
+        """
+            Creates the users and their cash accounts with bulk inserts ( one per "batch_size" rows of each table ).
+            Every dictionary holds the fields of one user, the "password" must already be hashed.
+            Should be called inside a transaction, so a user is never created without a cash account.
+        """
+
+        instances = []
+
+        for fields in users:
+            user = User( **fields )
+            user.email = self.normalize_email( user.email )
+            user.full_name = f'{user.first_name} {user.last_name}'
+            user.cash_account_uuid = generate_uuid7()
+            instances.append( user )
+
+        self.model.objects.using( self._db ).bulk_create( instances, batch_size = batch_size )
+
+        # One bulk insert per database ( the primary, or every shard with account sharding )
+        cash_accounts = {}
+
+        for user in instances:
+            using = get_account_database( user.cash_account_uuid, default = self._db )
+            cash_accounts.setdefault( using, [] ).append( CashAccount( id = user.cash_account_uuid, user = user ) )
+
+        for using, accounts in cash_accounts.items():
+            CashAccount.objects.using( using ).bulk_create( accounts, batch_size = batch_size )
+
+        return instances
+
     def create_user(self, email, password=None, **extra_fields):
         extra_fields.setdefault('is_staff', False)
         extra_fields.setdefault('is_superuser', False)
@@ -65,7 +99,7 @@ class User( AbstractUser ):
 
 
     id = models.UUIDField(
-        default = uuid.uuid4,
+        default = generate_uuid7,
         unique = True,
         primary_key = True,
         editable = False,
@@ -95,12 +129,65 @@ class User( AbstractUser ):
         null = True,
     )
 
+    # Id of the cash account of the user. Lets the shard of the account be found without a query, see "bank_controller/routers.py"
+    cash_account_uuid = models.UUIDField(
+        null = True,
+        editable = False,
+    )
+
     username = None
 
     USERNAME_FIELD = 'email'
     objects = CustomUserManager()
+
+    def save( self, *args, **kwargs ):
+        from bank_controller.services.version_service import bump_version
+
+        super().save( *args, **kwargs )
+
+        # The user is shown by the account resources, a change of its fields is a new version of the cash account ( the login time is not shown )
+        update_fields = kwargs.get( 'update_fields' )
+
+        if self.cash_account_uuid is not None and ( update_fields is None or set( update_fields ) & set( self.READING_FIELDS ) ):
+            # The cached cash account is bumped as well, so it can still be saved
+            bump_version( self.cash_account if User.cash_account.is_cached( self ) else self.cash_account_uuid )
     
 
+class AccountShardQuerySet( models.QuerySet ):
+    """
+        Queryset of the models that live on the shard of their cash account ( see "bank_controller/routers.py" ).
+        With account sharding, "create" saves the object to the database chosen for the object, not for the model
+    """
+
+    def create( self, **kwargs ):
+        if self._db is not None or not settings.ACCOUNT_SHARDS:
+            return super().create( **kwargs )
+
+        obj = self.model( **kwargs )
+        self._for_write = True
+        obj.save( force_insert = True, using = router.db_for_write( self.model, instance = obj ) )
+
+        return obj
+
+class CashAccountQuerySet( AccountShardQuerySet ):
+    """
+        Queryset of cash accounts. With account sharding, "get" by primary key goes to the shard of the account
+    """
+
+    def get( self, *args, **kwargs ):
+        pk = kwargs.get( 'pk', kwargs.get( 'id' ) )
+
+        if self._db is None and pk is not None and settings.ACCOUNT_SHARDS:
+            return self.using( get_account_database( pk ) ).get( *args, **kwargs )
+
+        return super().get( *args, **kwargs )
+
+
+class CashAccountVersionConflict( Exception ):
+    """
+        Raised by "CashAccount.save" when the account was changed in the database after the instance was read
+    """
+
 class CashAccount( models.Model ):
     """
         Cash account model class
@@ -124,7 +211,7 @@ class CashAccount( models.Model ):
     EXCLUDE_READING_FIELDS = tuple()
 
     id = models.UUIDField(
-        default = uuid.uuid4,
+        default = generate_uuid7,
         unique = True,
         primary_key = True,
         editable = False,
@@ -148,10 +235,12 @@ class CashAccount( models.Model ):
         default = 0,
     )
 
+    # Users live on the primary database and accounts may live on shards, so there is no database constraint
     user = models.OneToOneField(
         to = settings.AUTH_USER_MODEL,
         unique = True,
         on_delete = models.PROTECT,
+        db_constraint = False,
 
         related_name = 'cash_account',
     )
@@ -164,10 +253,110 @@ class CashAccount( models.Model ):
         default = False,
     )
 
+    # Hot account mode: the number of sub-balances the incoming money is spread over ( 0 - off ), see "services/cash_management_service.py"
+    hot_account_slots = models.PositiveSmallIntegerField(
+        default = 0,
+    )
+
+    # Incremented by every change of the account resources, served as their ETag, see "services/version_service.py"
+    version = models.PositiveBigIntegerField(
+        default = 0,
+    )
+
+    objects = CashAccountQuerySet.as_manager()
+
+    _expected_version = None
+
+    def save( self, *args, **kwargs ):
+        # Optimistic concurrency control: an update is written only if the version of the account in the database is still
+        # the version of the instance, otherwise "CashAccountVersionConflict" is raised ( see "update_cash_account" ).
+        # A copy of the account to another database keeps its version
+        if self._state.adding or kwargs.get( 'force_insert' ) or kwargs.get( 'using' ) not in ( None, self._state.db ):
+            return super().save( *args, **kwargs )
+
+        if kwargs.get( 'update_fields' ) is not None:
+            kwargs['update_fields'] = { *kwargs['update_fields'], 'version' }
+
+        self._expected_version = self.version
+        self.version += 1
+
+        try:
+            super().save( *args, **kwargs )
+        except CashAccountVersionConflict:
+            self.version = self._expected_version
+            raise
+        finally:
+            self._expected_version = None
+
+    def _do_update( self, base_qs, using, pk_val, values, update_fields, forced_update ):
+        if self._expected_version is None:
+            return super()._do_update( base_qs, using, pk_val, values, update_fields, forced_update )
+
+        if super()._do_update( base_qs.filter( version = self._expected_version ), using, pk_val, values, update_fields, forced_update ):
+            return True
+
+        # The account was changed after it was read ( a deleted account is inserted again, as by any model )
+        if base_qs.filter( pk = pk_val ).exists():
+            raise CashAccountVersionConflict( f'Cash account "{pk_val}" was changed after version {self._expected_version} was read' )
+
+        return False
+
+
+class CashAccountSubBalance( models.Model ):
+    """
+        Cash account sub-balance model class.
+        A part of the money of a hot account: the replenishments of the account go to one of its sub-balances chosen at random,
+        so they do not wait for each other on the row of the account. Folded back into the amount of the account by the compaction
+    """
+
+    cash_account = models.ForeignKey(
+        to = CashAccount,
+
+        on_delete = models.CASCADE,
+        related_name = 'sub_balances',
+    )
+
+    slot = models.PositiveSmallIntegerField()
+
+    amount = models.PositiveBigIntegerField(
+        default = 0,
+    )
+
+    # Incremented by every replenishment, a part of the version of the account
+    version = models.PositiveBigIntegerField(
+        default = 0,
+    )
+
+    objects = AccountShardQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields = ( 'cash_account', 'slot' ),
+                name = 'unique_cash_account_sub_balance',
+            ),
+        ]
+
+class Merchant( models.Model ):
+    """
+        Merchant model class.
+        Every merchant name is stored once, purchases refer to it by an integer key
+    """
+
+    name = models.CharField(
+        max_length = 255,
+        unique = True,
+    )
+
 
 class Purchase( models.Model ):
     """
         Purchas model class
+
+        The merchant is stored as a reference to the "Merchant" table, but is read and written by name through the "merchant" property:
+        - Purchase.objects.create( merchant = 'Shop', ... ) resolves ( or creates ) the merchant when the purchase is saved
+        - purchase.merchant returns the name of the merchant
+        Names are resolved through an in-process cache, see "services/merchant_service.py"
     """
 
     REQUIRED_FIELDS = (
@@ -177,10 +366,13 @@ class Purchase( models.Model ):
     )
 
     READING_FIELD = '__all__'
-    EXCLUDE_READING_FIELDS = ( 'cash_account', )
+    EXCLUDE_READING_FIELDS = ( 'cash_account', 'merchant_ref' )
 
-    merchant = models.CharField(
-        max_length = 255,
+    merchant_ref = models.ForeignKey(
+        to = Merchant,
+
+        on_delete = models.PROTECT,
+        related_name = 'purchases',
     )
     amount = models.PositiveIntegerField()
 
@@ -198,6 +390,45 @@ class Purchase( models.Model ):
     is_ignore = models.BooleanField(
         default = False,
     )
+
+    objects = AccountShardQuerySet.as_manager()
+
+    class Meta:
+        # Indexes for the history search, see "services/history_service.py"
+        indexes = [
+            models.Index( fields = ( 'cash_account', 'is_ignore', 'creation_date' ), name = 'purchase_history_date_idx' ),
+            models.Index( fields = ( 'cash_account', 'is_ignore', 'merchant_ref' ), name = 'purchase_history_merchant_idx' ),
+            models.Index( fields = ( 'cash_account', 'is_ignore', 'amount' ), name = 'purchase_history_amount_idx' ),
+        ]
+
+    _merchant_name = None
+
+    @property
+    def merchant( self ) -> str:
+        from bank_controller.services.merchant_service import get_merchant_name
+
+        if self._merchant_name is None:
+            if Purchase.merchant_ref.is_cached( self ):
+                self._merchant_name = self.merchant_ref.name
+            elif self.merchant_ref_id is not None:
+                self._merchant_name = get_merchant_name( self.merchant_ref_id, using = self._state.db )
+
+        return self._merchant_name
+
+    @merchant.setter
+    def merchant( self, value : str ) -> None:
+        # The merchant id is resolved on save, when the database is known
+        self._merchant_name = value
+        self.merchant_ref_id = None
+
+    def save( self, *args, **kwargs ):
+        from bank_controller.services.merchant_service import resolve_merchant_id
+
+        if self.merchant_ref_id is None and self._merchant_name is not None:
+            using = kwargs.get( 'using' ) or router.db_for_write( Purchase, instance = self )
+            self.merchant_ref_id = resolve_merchant_id( self._merchant_name, using = using )
+
+        super().save( *args, **kwargs )
     
 
 class Transfer( models.Model ):
@@ -214,10 +445,13 @@ class Transfer( models.Model ):
     READING_FIELDS = '__all__'
     EXCLUDE_READING_FIELDS = tuple()
 
+    # With account sharding the sender and the reciever may live on different shards, so there are no database constraints.
+    # Such a transfer is stored on both shards, see "services/transfer_service.py"
     sender = models.ForeignKey(
         to = CashAccount,
 
         on_delete = models.CASCADE,
+        db_constraint = False,
         related_name = 'sent_transfers',
     )
     reciever = models.ForeignKey(
@@ -226,6 +460,7 @@ class Transfer( models.Model ):
         null = True,
 
         on_delete = models.SET_NULL,
+        db_constraint = False,
         related_name = 'recieved_transfers',
     )
 
@@ -239,6 +474,73 @@ class Transfer( models.Model ):
         default = False,
     )
 
+    objects = AccountShardQuerySet.as_manager()
+
+    class Meta:
+        # Indexes for the history search, see "services/history_service.py"
+        indexes = [
+            models.Index( fields = ( 'sender', 'is_ignore', 'creation_date' ), name = 'transfer_sent_date_idx' ),
+            models.Index( fields = ( 'reciever', 'is_ignore', 'creation_date' ), name = 'transfer_recieved_date_idx' ),
+        ]
+
+class TransferOutbox( models.Model ):
+    """
+        Transfer outbox model class.
+        A transfer to a cash account on another shard, that still has to be credited to the reciever.
+        Stored on the shard of the sender, in the same transaction as the withdrawal, see "services/transfer_service.py"
+    """
+
+    id = models.UUIDField(
+        default = uuid.uuid4,
+        primary_key = True,
+        editable = False,
+    )
+
+    # The partitioned transfer table has the primary key ( id, creation_date ), see "services/partition_service.py",
+    # so "id" alone cannot be referenced by a database constraint
+    transfer = models.OneToOneField(
+        to = Transfer,
+
+        on_delete = models.CASCADE,
+        db_constraint = False,
+        related_name = 'outbox',
+    )
+
+    is_delivered = models.BooleanField(
+        default = False,
+        db_index = True,
+    )
+
+    creation_date = models.DateTimeField(
+        auto_now_add = True,
+    )
+
+class TransferInbox( models.Model ):
+    """
+        Transfer inbox model class.
+        Marks an outbox entry as credited to the reciever. Stored on the shard of the reciever, in the same transaction as the replenishment,
+        so a delivery that is repeated after a failure does not credit the money twice
+    """
+
+    # The id of the "TransferOutbox" entry ( on another database )
+    outbox_id = models.UUIDField(
+        primary_key = True,
+    )
+
+    # The partitioned transfer table has the primary key ( id, creation_date ), see "services/partition_service.py",
+    # so "id" alone cannot be referenced by a database constraint
+    transfer = models.OneToOneField(
+        to = Transfer,
+
+        on_delete = models.CASCADE,
+        db_constraint = False,
+        related_name = 'inbox',
+    )
+
+    creation_date = models.DateTimeField(
+        auto_now_add = True,
+    )
+
 class Credit( models.Model ):
     """
         Credit model class
@@ -295,12 +597,46 @@ class Credit( models.Model ):
         default = False,
     )
 
+    # The dates of the credit follow the clock of the credit processing, see "services/clock_service.py"
     creation_date = models.DateTimeField(
-        auto_now_add = True,
+        default = clock_service.now,
     )
     last_payment_date = models.DateTimeField(
-        auto_now_add = True,
+        default = clock_service.now,
+    )
+
+    # The status of the credit, computed from the fields above on every save ( see "services/credit_service.py" )
+    next_payment_date = models.DateTimeField(
+        null = True,
+        db_index = True,
+    )
+    # The amounts are rounded to the cents ( see "round_credit_amount" ), for the reports; the API shows them as computed
+    next_installment_amount = models.DecimalField(
+        max_digits = 12,
+        decimal_places = 2,
+        default = 0,
+    )
+    remaining_amount = models.DecimalField(
+        max_digits = 12,
+        decimal_places = 2,
+        default = 0,
+        db_index = True,
     )
+    remaining_parts = models.PositiveSmallIntegerField( default = 0 )
+
+    STATUS_FIELDS = ( 'next_payment_date', 'next_installment_amount', 'remaining_amount', 'remaining_parts' )
+
+    objects = AccountShardQuerySet.as_manager()
+
+    def save( self, *args, **kwargs ):
+        from bank_controller.services.credit_service import refresh_credit_status
+
+        refresh_credit_status( self )
+
+        if kwargs.get( 'update_fields' ) is not None:
+            kwargs['update_fields'] = set( kwargs['update_fields'] ) | set( self.STATUS_FIELDS )
+
+        super().save( *args, **kwargs )
 
 
 class Message( models.Model ):
@@ -329,5 +665,198 @@ class Message( models.Model ):
         default = False,
     )
 
+    objects = AccountShardQuerySet.as_manager()
+
+
+
+
+
+class SpendingRollup( models.Model ):
+    """
+        Spending rollup model class.
+        Stores the sum and the number of operations of one cash account for one day, one category and one merchant ( "Merchant" ).
+        Maintained incrementally by the operations themselves, see "services/analytics_service.py"
+    """
+
+    READING_FIELDS = (
+        'period',
+        'category',
+        'merchant',
+        'total',
+        'count',
+    )
+
+    category_choice = (
+        ( 'purchase', 'purchase' ),
+        ( 'transfer_sent', 'transfer_sent' ),
+        ( 'transfer_recieved', 'transfer_recieved' ),
+    )
+
+    cash_account = models.ForeignKey(
+        to = CashAccount,
+
+        on_delete = models.CASCADE,
+        related_name = 'spending_rollups',
+    )
+
+    day = models.DateField()
+
+    category = models.CharField(
+        max_length = 31,
+        choices = category_choice,
+    )
+
+    # Empty for transfers
+    merchant_ref = models.ForeignKey(
+        to = Merchant,
+
+        on_delete = models.PROTECT,
+        related_name = 'spending_rollups',
+        null = True,
+        blank = True,
+    )
+
+    total = models.PositiveBigIntegerField(
+        default = 0,
+    )
+    count = models.PositiveIntegerField(
+        default = 0,
+    )
+
+    objects = AccountShardQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # NULLs are distinct in a unique index, so the rollups of the transfers have their own one
+            models.UniqueConstraint(
+                fields = ( 'cash_account', 'day', 'category', 'merchant_ref' ),
+                condition = models.Q( merchant_ref__isnull = False ),
+                name = 'unique_spending_rollup',
+            ),
+            models.UniqueConstraint(
+                fields = ( 'cash_account', 'day', 'category' ),
+                condition = models.Q( merchant_ref__isnull = True ),
+                name = 'unique_spending_rollup_without_merchant',
+            ),
+        ]
+
+class EmailOutbox( models.Model ):
+    """
+        Email outbox model class.
+        An email ( of djoser: activation, password reset, confirmations ) waiting to be sent by the "flush_email_outbox" celery task,
+        see "services/email_service.py"
+    """
+
+    subject = models.CharField(
+        max_length = 998,
+    )
+
+    body = models.TextField(
+        blank = True,
+    )
+
+    # Alternative HTML body, empty if the email has none
+    html = models.TextField(
+        blank = True,
+    )
+
+    from_email = models.CharField(
+        max_length = 255,
+    )
+
+    to = models.JSONField()
+
+    is_sent = models.BooleanField(
+        default = False,
+    )
+
+    # The number of failed attempts to send the email and the time of the next attempt
+    attempts = models.PositiveSmallIntegerField(
+        default = 0,
+    )
+    next_attempt_date = models.DateTimeField(
+        auto_now_add = True,
+    )
+
+    last_error = models.TextField(
+        blank = True,
+    )
+
+    creation_date = models.DateTimeField(
+        auto_now_add = True,
+    )
+
+    class Meta:
+        indexes = [
+            models.Index( fields = ( 'is_sent', 'next_attempt_date' ), name = 'email_outbox_pending_idx' ),
+        ]
+
+class AccountEvent( models.Model ):
+    """
+        Account event model class.
+        A change of a cash account ( an operation, a change of its credit, a block, a message ), recorded in the transaction of the change.
+        Numbered by the relay in the order of commit and published to the feed, see "services/event_service.py"
+    """
+
+    READING_FIELDS = (
+        'sequence',
+        'kind',
+        'cash_account',
+        'payload',
+        'creation_date',
+    )
+
+    kind_choice = (
+        ( 'purchase', 'purchase' ),
+        ( 'transfer_sent', 'transfer_sent' ),
+        ( 'transfer_recieved', 'transfer_recieved' ),
+        ( 'credit_created', 'credit_created' ),
+        ( 'credit_payment', 'credit_payment' ),
+        ( 'credit_escalated', 'credit_escalated' ),
+        ( 'credit_repaid', 'credit_repaid' ),
+        ( 'account_blocked', 'account_blocked' ),
+        ( 'account_unblocked', 'account_unblocked' ),
+        ( 'message', 'message' ),
+    )
+
+    id = models.BigAutoField(
+        primary_key = True,
+    )
+
+    cash_account = models.ForeignKey(
+        to = CashAccount,
+
+        on_delete = models.CASCADE,
+        related_name = 'events',
+    )
+
+    kind = models.CharField(
+        max_length = 31,
+        choices = kind_choice,
+    )
+
+    payload = models.JSONField(
+        default = dict,
+    )
+
+    # The position of the event in the feed of its database, assigned by the relay once the event is committed. Null - not yet in the feed
+    sequence = models.PositiveBigIntegerField(
+        null = True,
+        unique = True,
+    )
+
+    # The event was added to the Redis stream
+    is_published = models.BooleanField(
+        default = False,
+    )
+
+    creation_date = models.DateTimeField(
+        auto_now_add = True,
+    )
 
+    objects = AccountShardQuerySet.as_manager()
 
+    class Meta:
+        indexes = [
+            models.Index( fields = ( 'is_published', 'sequence' ), name = 'account_event_unpublished_idx' ),
+        ]
@@ -0,0 +1,251 @@
+"""
+    Push channel of the cash account updates: Server-Sent Events served by the ASGI application ( "config/asgi.py" ).
+
+    A client opens PUSH_PATH with its token ( the "Authorization: Token <key>" header ), or with a stream ticket ( "?ticket=<ticket>" )
+    where it cannot set headers ( EventSource ): the tokens are long-lived and must not get into the access logs with the query string,
+    a ticket is issued for the token by the API ( "create_ticket" ), expires in PUSH_TICKET_SECONDS and opens one connection. The client
+    recieves every event of its cash account ( see "services/event_service.py" ) as it is committed: balance changes, messages,
+    credit status updates. The events are published to the Redis channel of the account, so any API process can serve any subscriber.
+
+    Every process keeps one Redis pub/sub connection ( "RedisBroadcaster" ), subscribed to the channels of the accounts it serves.
+    An idle subscriber is a coroutine waiting on its queue, woken only by its events and by a heartbeat every PUSH_HEARTBEAT_SECONDS.
+"""
+
+import asyncio
+import contextlib
+import json
+import logging
+import secrets
+from urllib.parse import parse_qs
+
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from rest_framework.authtoken.models import Token
+
+from bank_controller.models import User
+from bank_controller.services.redis_service import get_redis, get_async_redis
+
+
+logger = logging.getLogger( __name__ )
+
+
+class RedisBroadcaster():
+    """
+        Fans the messages of Redis pub/sub channels out to the queues of the subscribers of this process, over one connection.
+        A channel is subscribed while it has at least one subscriber.
+        When the connection is lost, a new one subscribes to all the channels again, retrying with a delay that doubles
+        from PUSH_RECONNECT_SECONDS up to PUSH_RECONNECT_MAX_SECONDS. The subscribers get heartbeats meanwhile and miss the updates of the outage
+    """
+
+    def __init__( self, pubsub_factory ):
+        self.pubsub_factory = pubsub_factory
+        self.pubsub = None
+        self.reader = None
+        self.subscribers = {}
+        self.lock = asyncio.Lock()
+
+    async def subscribe( self, channel : str, queue : asyncio.Queue ) -> None:
+        async with self.lock:
+            if self.pubsub is None:
+                self.pubsub = self.pubsub_factory()
+
+            reconnect = False
+
+            if channel not in self.subscribers:
+                self.subscribers[ channel ] = set()
+
+                try:
+                    await self.pubsub.subscribe( channel )
+                except redis.RedisError:
+                    # The reader subscribes to the channel with the others once Redis is back
+                    logger.warning( 'The push channel could not subscribe to "%s"', channel, exc_info = True )
+                    reconnect = True
+
+            self.subscribers[ channel ].add( queue )
+
+            # The reader stops when the connection has no channels left
+            if self.reader is None or self.reader.done():
+                self.reader = asyncio.ensure_future( self._read( reconnect = reconnect ) )
+
+    async def unsubscribe( self, channel : str, queue : asyncio.Queue ) -> None:
+        async with self.lock:
+            queues = self.subscribers.get( channel, set() )
+            queues.discard( queue )
+
+            if not queues and channel in self.subscribers:
+                del self.subscribers[ channel ]
+
+                # A lost connection has no subscriptions left, the next one does not subscribe to the channel
+                with contextlib.suppress( redis.RedisError ):
+                    await self.pubsub.unsubscribe( channel )
+
+    async def _read( self, reconnect : bool = False ) -> None:
+        delay = settings.PUSH_RECONNECT_SECONDS
+
+        while True:
+            if reconnect:
+                await asyncio.sleep( delay )
+                delay = min( delay * 2, settings.PUSH_RECONNECT_MAX_SECONDS )
+
+                try:
+                    if not await self._resubscribe():
+                        return
+                except redis.RedisError:
+                    logger.warning( 'The push channel could not reconnect to Redis, retrying in %s seconds', delay, exc_info = True )
+                    continue
+
+            try:
+                async for message in self.pubsub.listen():
+                    delay = settings.PUSH_RECONNECT_SECONDS
+                    self._deliver( message )
+
+                return
+            except redis.RedisError:
+                logger.warning( 'The push channel lost the connection to Redis, reconnecting', exc_info = True )
+                reconnect = True
+
+    async def _resubscribe( self ) -> bool:
+        """
+            Replaces the pub/sub connection with a new one subscribed to all the channels. Returns False if there are no channels left
+        """
+
+        async with self.lock:
+            with contextlib.suppress( redis.RedisError ):
+                await self.pubsub.reset()
+
+            if not self.subscribers:
+                self.pubsub = None
+                return False
+
+            self.pubsub = self.pubsub_factory()
+            await self.pubsub.subscribe( *self.subscribers )
+
+        return True
+
+    def _deliver( self, message : dict ) -> None:
+        if message['type'] != 'message':
+            return
+
+        channel = message['channel'].decode() if isinstance( message['channel'], bytes ) else message['channel']
+
+        for queue in self.subscribers.get( channel, () ):
+            # A subscriber that does not keep up misses the update, it reads the account to catch up
+            if not queue.full():
+                queue.put_nowait( message['data'] )
+
+_broadcaster = None
+
+def get_broadcaster() -> RedisBroadcaster:
+    global _broadcaster
+
+    if _broadcaster is None:
+        _broadcaster = RedisBroadcaster( lambda: get_async_redis().pubsub() )
+
+    return _broadcaster
+
+
+def create_ticket( user : User ) -> str:
+    """
+        Issues a stream ticket of the user: a random key, stored in Redis for PUSH_TICKET_SECONDS and redeemed by one connection
+    """
+
+    ticket = secrets.token_urlsafe( 32 )
+    get_redis().set( f'{settings.PUSH_TICKET_PREFIX}{ticket}', str( user.pk ), px = settings.PUSH_TICKET_SECONDS * 1000 )
+
+    return ticket
+
+def redeem_ticket( ticket : str ) -> str | None:
+    """
+        Returns the id of the user of the ticket and deletes the ticket, or None if it does not exist or has expired
+    """
+
+    user_id = get_redis().getdel( f'{settings.PUSH_TICKET_PREFIX}{ticket}' )
+
+    return user_id.decode() if user_id is not None else None
+
+def get_token_key( scope : dict ) -> str | None:
+    for name, value in scope.get( 'headers', () ):
+        if name == b'authorization':
+            keyword, _, key = value.decode().partition( ' ' )
+            if keyword == 'Token':
+                return key
+
+    return None
+
+@sync_to_async
+def authenticate( scope : dict ) -> User | None:
+    """
+        Returns the active user of the token of the request ( or of its ticket ), or None
+    """
+
+    key = get_token_key( scope )
+
+    if key:
+        token = Token.objects.select_related( 'user' ).filter( key = key ).first()
+        user = token.user if token is not None else None
+    else:
+        ticket = parse_qs( scope.get( 'query_string', b'' ).decode() ).get( 'ticket', [ None ] )[0]
+        user_id = redeem_ticket( ticket ) if ticket else None
+        user = User.objects.filter( pk = user_id ).first() if user_id else None
+
+    if user is None or not user.is_active:
+        return None
+
+    return user
+
+async def stream( channel : str, receive, send, broadcaster : RedisBroadcaster ) -> None:
+    """
+        Sends the messages of the channel as Server-Sent Events until the client disconnects
+    """
+
+    queue = asyncio.Queue( maxsize = settings.PUSH_QUEUE_SIZE )
+    await broadcaster.subscribe( channel, queue )
+
+    async def wait_for_disconnect():
+        while ( await receive() )['type'] != 'http.disconnect':
+            pass
+
+    disconnect = asyncio.ensure_future( wait_for_disconnect() )
+
+    try:
+        await send( {
+            'type' : 'http.response.start',
+            'status' : 200,
+            'headers' : [ ( b'content-type', b'text/event-stream' ), ( b'cache-control', b'no-cache' ), ( b'x-accel-buffering', b'no' ) ],
+        } )
+        await send( { 'type' : 'http.response.body', 'body' : b': connected\n\n', 'more_body' : True } )
+
+        while True:
+            message = asyncio.ensure_future( queue.get() )
+            done, _ = await asyncio.wait( ( message, disconnect ), timeout = settings.PUSH_HEARTBEAT_SECONDS, return_when = asyncio.FIRST_COMPLETED )
+
+            if disconnect in done:
+                message.cancel()
+                return
+
+            if message in done:
+                update = json.loads( message.result() )
+                body = f'event: {update["kind"]}\ndata: {json.dumps( update["payload"] )}\n\n'.encode()
+            else:
+                message.cancel()
+                body = b': heartbeat\n\n'
+
+            await send( { 'type' : 'http.response.body', 'body' : body, 'more_body' : True } )
+    finally:
+        disconnect.cancel()
+        await broadcaster.unsubscribe( channel, queue )
+
+async def push_application( scope, receive, send ) -> None:
+    """
+        ASGI application of the push channel
+    """
+
+    user = await authenticate( scope )
+
+    if user is None or user.cash_account_uuid is None:
+        await send( { 'type' : 'http.response.start', 'status' : 401, 'headers' : [ ( b'content-type', b'application/json' ) ] } )
+        await send( { 'type' : 'http.response.body', 'body' : b'{"detail": "Invalid token."}' } )
+        return
+
+    await stream( f'{settings.PUSH_CHANNEL_PREFIX}{user.cash_account_uuid}', receive, send, get_broadcaster() )
@@ -0,0 +1,62 @@
+import uuid
+
+import msgpack
+import orjson
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+
+
+# Renderers of the API responses, chosen by the "Accept" header of the request ( "DEFAULT_RENDERER_CLASSES" ).
+#
+# Both renderers encode the types orjson and msgpack do not know ( lazy translations, decimals, querysets... )
+# the same way as the stock JSON renderer of REST framework does.
+
+_encoder = JSONEncoder()
+
+
+def encode_default( value ):
+    # The ids of the transfers and the accounts, the most frequent of such values
+    if isinstance( value, uuid.UUID ):
+        return str( value )
+
+    return _encoder.default( value )
+
+
+class ORJSONRenderer( JSONRenderer ):
+    """
+        JSON renderer built on orjson, encoded several times faster than the stock "JSONRenderer". The output is the same bytes:
+        the compact JSON with U+2028 and U+2029 escaped. An "indent" parameter of the media type, or the settings of REST framework
+        that change the output ( COMPACT_JSON, UNICODE_JSON ), fall back to the stock renderer.
+        The only difference: a NaN or an infinite float is written as null, the stock renderer raises ValueError ( STRICT_JSON )
+    """
+
+    def render( self, data, accepted_media_type = None, renderer_context = None ) -> bytes:
+        if data is None:
+            return b''
+
+        if not self.compact or self.ensure_ascii or self.get_indent( accepted_media_type, renderer_context or {} ) is not None:
+            return super().render( data, accepted_media_type, renderer_context )
+
+        # The dates go to the encoder of REST framework as well ( "Z" suffix, milliseconds )
+        content = orjson.dumps( data, default = encode_default, option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME )
+
+        # The line separators are escaped, so the output is a subset of JavaScript as well
+        return content.replace( '\u2028'.encode(), b'\\u2028' ).replace( '\u2029'.encode(), b'\\u2029' )
+
+
+class MessagePackRenderer( BaseRenderer ):
+    """
+        MessagePack renderer ( "Accept: application/msgpack" ), a binary encoding of the same data as the JSON responses
+    """
+
+    media_type = 'application/msgpack'
+    format = 'msgpack'
+    charset = None
+    render_style = 'binary'
+
+    def render( self, data, accepted_media_type = None, renderer_context = None ) -> bytes:
+        if data is None:
+            return b''
+
+        return msgpack.packb( data, default = encode_default, use_bin_type = True )
@@ -0,0 +1,199 @@
+import hashlib
+import random
+import uuid
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+
+
+# Models that live on the shard of their cash account when account sharding is enabled ( settings.ACCOUNT_SHARDS ).
+# Merchants are a small dimension of the purchases, so every shard has its own copy of the merchant table
+SHARDED_MODELS = {
+    'bank_controller.cashaccount',
+    'bank_controller.cashaccountsubbalance',
+    'bank_controller.purchase',
+    'bank_controller.transfer',
+    'bank_controller.credit',
+    'bank_controller.message',
+    'bank_controller.spendingrollup',
+    'bank_controller.merchant',
+    'bank_controller.transferoutbox',
+    'bank_controller.transferinbox',
+    'bank_controller.accountevent',
+}
+
+# The database that reads of the current request / task go to. None - the primary ( default routing )
+_read_database = ContextVar( 'read_database', default = None )
+
+
+def get_read_database() -> str | None:
+    """
+        Returns the database alias that reads are currently routed to ( None - the primary )
+    """
+
+    return _read_database.get()
+
+def set_read_database( alias : str | None ):
+    """
+        Routes the reads of the current context to the "alias" database. Returns a token for "reset_read_database"
+    """
+
+    return _read_database.set( alias )
+
+def reset_read_database( token ) -> None:
+    """
+        Restores the read routing that was active before the "set_read_database" call that returned the token
+    """
+
+    _read_database.reset( token )
+
+
+# Read-your-writes
+
+def _primary_pin_key( user_pk ) -> str:
+    return f'database-primary-pin:{user_pk}'
+
+def pin_to_primary( user_pk ) -> None:
+    """
+        Makes the reads of the user go to the primary for settings.DATABASE_REPLICA_PIN_SECONDS,
+        so the user sees their own writes even if the replicas are lagging
+    """
+
+    cache.set( _primary_pin_key( user_pk ), True, settings.DATABASE_REPLICA_PIN_SECONDS )
+
+def is_pinned_to_primary( user_pk ) -> bool:
+    """
+        Returns True if the user has written recently and must read from the primary
+    """
+
+    return cache.get( _primary_pin_key( user_pk ), False )
+
+def choose_read_database( user ) -> str | None:
+    """
+        Returns a replica alias for the reads of the user's read-only request, or None if the reads must go to the primary
+    """
+
+    if not settings.DATABASE_REPLICAS:
+        return None
+
+    if user is not None and user.is_authenticated and is_pinned_to_primary( user.pk ):
+        return None
+
+    return random.choice( settings.DATABASE_REPLICAS )
+
+
+# Account sharding
+
+def get_account_databases() -> list[ str ]:
+    """
+        Returns the aliases of all databases that store cash accounts ( the shards, or only the primary if sharding is disabled )
+    """
+
+    return list( settings.ACCOUNT_SHARDS ) or [ DEFAULT_DB_ALIAS ]
+
+def get_account_database( account_id, default : str = None ) -> str | None:
+    """
+        Returns the shard of the cash account with the given id ( the hash of the UUID modulo the number of shards ),
+        or "default" if account sharding is disabled. Raises ValueError if the id is not a UUID
+    """
+
+    if not settings.ACCOUNT_SHARDS:
+        return default
+
+    digest = hashlib.blake2b( uuid.UUID( str( account_id ) ).bytes, digest_size = 8 ).digest()
+
+    return settings.ACCOUNT_SHARDS[ int.from_bytes( digest, 'big' ) % len( settings.ACCOUNT_SHARDS ) ]
+
+def _get_account_id( instance ):
+    """
+        Returns the id of the cash account that the object belongs to, or None if it is not known
+    """
+
+    label = instance._meta.label_lower
+
+    if label == 'bank_controller.cashaccount':
+        return instance.pk
+    if label == 'bank_controller.transfer':
+        return instance.sender_id
+    if label == settings.AUTH_USER_MODEL.lower():
+        return instance.cash_account_uuid
+
+    return getattr( instance, 'cash_account_id', None )
+
+
+class AccountShardRouter:
+    """
+        Database router for account sharding. Does nothing unless settings.ACCOUNT_SHARDS is set.
+
+        Cash accounts and their rows ( SHARDED_MODELS ) live on the shard chosen by the hash of the account UUID,
+        users, tokens and the other global tables live on the "default" database. Objects are routed by the instance hints
+        Django passes for related objects ( "user.cash_account", "cash_account.purchases", "Purchase( cash_account = ... )" ),
+        queries without hints go through "CashAccount.objects.get( pk = ... )" or an explicit "using( shard )".
+        Every database has all the tables, so the usual "migrate --database <alias>" works for each of them.
+    """
+
+    def _db_for_model( self, model, instance ):
+        if not settings.ACCOUNT_SHARDS or instance is None:
+            return None
+
+        if model._meta.label_lower not in SHARDED_MODELS:
+            # Global models are reached from sharded objects as well ( "cash_account.user" )
+            return DEFAULT_DB_ALIAS if instance._state.db in settings.ACCOUNT_SHARDS else None
+
+        if instance._state.db in settings.ACCOUNT_SHARDS:
+            return instance._state.db
+
+        account_id = _get_account_id( instance )
+
+        return get_account_database( account_id ) if account_id is not None else None
+
+    def db_for_read( self, model, **hints ):
+        return self._db_for_model( model, hints.get( 'instance' ) )
+
+    def db_for_write( self, model, **hints ):
+        return self._db_for_model( model, hints.get( 'instance' ) )
+
+    def allow_relation( self, obj1, obj2, **hints ):
+        if not settings.ACCOUNT_SHARDS:
+            return None
+
+        # Users are related to accounts on the shards, and transfers to accounts on other shards
+        databases = { DEFAULT_DB_ALIAS, *settings.ACCOUNT_SHARDS, *settings.DATABASE_REPLICAS }
+
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+
+        return None
+
+
+class PrimaryReplicaRouter:
+    """
+        Database router for a primary ( the "default" database ) with read replicas ( settings.DATABASE_REPLICAS ).
+
+        Writes always go to the primary. Reads go to a replica only inside a context marked with "set_read_database",
+        which is done by read-only views ( see "ReplicaReadMixin" ). So PIN checks, writes and celery tasks ( the credit sweep )
+        always read from the primary.
+    """
+
+    def db_for_read( self, model, **hints ):
+        return get_read_database()
+
+    def db_for_write( self, model, **hints ):
+        instance = hints.get( 'instance' )
+
+        # An object read from a replica is written back to the primary, otherwise the default routing applies
+        if instance is not None and instance._state.db in settings.DATABASE_REPLICAS:
+            return DEFAULT_DB_ALIAS
+
+        return None
+
+    def allow_relation( self, obj1, obj2, **hints ):
+        databases = { DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS }
+
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+
+        return None
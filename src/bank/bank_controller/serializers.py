@@ -1,26 +1,32 @@
 from rest_framework import serializers
 from django.urls import reverse
+from django.db import router, transaction
 from rest_framework.exceptions import ValidationError
 from django.core.exceptions import ObjectDoesNotExist
+from django.conf import settings
+from django.utils import timezone
 
-from bank_controller.mixins.serializer_mixins import *
+import datetime
+
+from bank_controller.mixins.serializer_mixins import SerializerWithPinCodeValidation, SerializerWithAmountValidation, SparseFieldsetSerializerMixin
 from bank_controller.services.general_service import CurrentCashAccount
-from bank_controller.services.cash_management_service import *
-from bank_controller.services.credit_service import (
-    calc_amount_required_to_pay_one_credit_part,
-    calc_parts_remaining_to_pay_credit,
-    calc_remaining_amount_to_repay_credit,
-    calc_payment_time_limit
-)
-from bank_controller.models import *
+from bank_controller.services.cash_management_service import cash_withdrawal, cash_replenishment, get_balance
+from bank_controller.services.credit_service import calc_credit_figures, schedule_credit_check
+from bank_controller.services.analytics_service import record_purchase_in_rollups, record_transfer_in_rollups
+from bank_controller.services.history_service import get_history_querysets
+from bank_controller.services.transfer_service import create_cross_shard_transfer
+from bank_controller.services.event_service import record_event, parse_cursor
+from bank_controller.services.version_service import update_cash_account
+from bank_controller.models import User, CashAccount, Purchase, Transfer, Credit, Message, SpendingRollup
 
 
 
 # User Serializers
 
-class RetrieveUserSerializer( serializers.ModelSerializer ):
+class RetrieveUserSerializer( SparseFieldsetSerializerMixin, serializers.ModelSerializer ):
     """
-        Serializer for retrieve user data
+        Serializer for retrieve user data.
+        Accepts the sparse fieldset of the request in the context, see "SparseFieldsetQuerySerializer"
     """
 
     cash_account = serializers.SerializerMethodField()
@@ -30,7 +36,12 @@ class RetrieveUserSerializer( serializers.ModelSerializer ):
         fields = model.READING_FIELDS
 
     def get_cash_account( self, instance ):
-        # Returns a link to view information about 'cash_account', or a link to create one
+        # Returns a link to view information about 'cash_account', or the cash account itself if it is expanded
+
+        expand = self.context.get( 'expand' ) or {}
+
+        if 'cash_account' in expand:
+            return cash_account_representation( instance.cash_account, {}, fields = expand['cash_account'] )
 
         return f"{reverse( 'retrieve-cash_account' )}"
 
@@ -42,6 +53,9 @@ class PurchaseSerializer( serializers.ModelSerializer ):
         Serializer for showing purchases data
     """
 
+    # The name of the merchant, see "Purchase.merchant"
+    merchant = serializers.CharField( max_length = 255 )
+
     class Meta:
         model = Purchase
         exclude = model.EXCLUDE_READING_FIELDS
@@ -57,9 +71,15 @@ class CreatePurchaseSerializer( SerializerWithPinCodeValidation, SerializerWithA
     def create(self, validated_data):
         # Includes an operation to withdraw money and remove the "pin" field to avoid further problems
         validated_data.pop( 'pin' )
-        cash_withdrawal( validated_data['amount'], validated_data['cash_account'] )
 
-        instance = Purchase.objects.create( **validated_data )
+        with transaction.atomic( using = router.db_for_write( Purchase, instance = validated_data['cash_account'] ) ):
+            # The money was checked by the validation, but may have been spent concurrently since
+            if not cash_withdrawal( validated_data['amount'], validated_data['cash_account'] ):
+                raise ValidationError( 'There are not enough funds on your cash account' )
+
+            instance = Purchase.objects.create( **validated_data )
+            record_purchase_in_rollups( instance )
+            record_event( 'purchase', instance.cash_account, purchase_id = instance.pk, amount = instance.amount, merchant = instance.merchant )
 
         return instance
 
@@ -94,10 +114,29 @@ class CreateTransferSerializer( SerializerWithPinCodeValidation, SerializerWithA
         # Includes an operation to withdraw money and remove the "pin" field to avoid further problems
 
         validated_data.pop( 'pin' )
-        cash_withdrawal( validated_data['amount'], validated_data['sender'] )
-        cash_replenishment( validated_data['amount'], validated_data['reciever'] )
 
-        instance = Transfer.objects.create( **validated_data )
+        using = router.db_for_write( Transfer, instance = validated_data['sender'] )
+
+        # With account sharding the reciever may live on another shard, see "services/transfer_service.py"
+        if using != router.db_for_write( Transfer, instance = validated_data['reciever'] ):
+            instance = create_cross_shard_transfer( validated_data['sender'], validated_data['reciever'], validated_data['amount'] )
+
+            if instance is None:
+                raise ValidationError( 'There are not enough funds on your cash account' )
+
+            return instance
+
+        with transaction.atomic( using = using ):
+            # The money was checked by the validation, but may have been spent concurrently since
+            if not cash_withdrawal( validated_data['amount'], validated_data['sender'] ):
+                raise ValidationError( 'There are not enough funds on your cash account' )
+
+            cash_replenishment( validated_data['amount'], validated_data['reciever'] )
+
+            instance = Transfer.objects.create( **validated_data )
+            record_transfer_in_rollups( instance )
+            record_event( 'transfer_sent', instance.sender, transfer_id = instance.pk, amount = instance.amount, reciever = instance.reciever_id )
+            record_event( 'transfer_recieved', instance.reciever, transfer_id = instance.pk, amount = instance.amount, sender = instance.sender_id )
 
         return instance
 
@@ -129,17 +168,19 @@ class CreditSerializer( serializers.ModelSerializer ):
         model = Credit
         fields = model.READING_FIELDS
 
+    # The status columns of the credit, see "calc_credit_status". The amounts are computed, the columns are rounded to the cents
+
     def get_next_payment_date( self, instance ):
-        return calc_payment_time_limit( instance )
+        return instance.next_payment_date
 
     def get_amount_to_pay_the_next_installment_of_the_loan( self, instance ):
-        return calc_amount_required_to_pay_one_credit_part( instance )
+        return calc_credit_figures( instance )['next_installment_amount']
     
     def get_remaining_amount_for_the_full_payment_of_the_loan( self, instance ):
-        return calc_remaining_amount_to_repay_credit( instance )
+        return calc_credit_figures( instance )['remaining_amount']
     
     def get_number_of_parts_until_the_full_payment_of_the_loan( self, instance ):
-        return calc_parts_remaining_to_pay_credit( instance )
+        return instance.remaining_parts
 
 
 class CreateCreditSerializer( SerializerWithPinCodeValidation ):
@@ -161,9 +202,105 @@ class CreateCreditSerializer( SerializerWithPinCodeValidation ):
 
     def create(self, validated_data):
         validated_data.pop('pin')
-        cash_replenishment( validated_data['amount'], validated_data['cash_account'] )
 
-        return Credit.objects.create( **validated_data )
+        with transaction.atomic( using = router.db_for_write( Credit, instance = validated_data['cash_account'] ) ):
+            cash_replenishment( validated_data['amount'], validated_data['cash_account'] )
+
+            credit = Credit.objects.create( **validated_data )
+            record_event( 'credit_created', credit.cash_account, credit_id = credit.pk, amount = credit.amount, loan_duration = credit.loan_duration )
+            schedule_credit_check( credit )
+
+        return credit
+
+
+# History serializers
+
+class HistorySearchSerializer( serializers.Serializer ):
+    """
+        Serializer for validating the history search parameters, see "services/history_service.py"
+    """
+
+    merchant = serializers.CharField( max_length = 255, required = False )
+    amount_min = serializers.IntegerField( min_value = 0, required = False )
+    amount_max = serializers.IntegerField( min_value = 0, required = False )
+    date_from = serializers.DateField( required = False )
+    date_to = serializers.DateField( required = False )
+    direction = serializers.ChoiceField( choices = ( 'purchases', 'sent', 'recieved' ), required = False )
+
+    def validate( self, attrs ):
+        if 'amount_min' in attrs and 'amount_max' in attrs and attrs['amount_min'] > attrs['amount_max']:
+            raise ValidationError( 'The "amount_min" parameter cannot be greater than "amount_max"' )
+
+        if 'date_from' in attrs and 'date_to' in attrs and attrs['date_from'] > attrs['date_to']:
+            raise ValidationError( 'The "date_from" parameter cannot be later than "date_to"' )
+
+        return attrs
+
+class SparseFieldsetQuerySerializer( serializers.Serializer ):
+    """
+        Serializer for validating the sparse fieldset parameters of the account resources:
+        - fields - the comma-separated fields to return ( all of them by default ), the fields of an expanded resource are prefixed with its name ( "user.email" )
+        - expand - the comma-separated related resources to embed into the response
+        Requires "fields" ( the fields of the resource ) and "expandable" ( { resource : its fields } ) in the context.
+        The validated data is { 'fields' : set of fields or None, 'expand' : { resource : set of its fields or None } }
+    """
+
+    fields = serializers.CharField( required = False )
+    expand = serializers.CharField( required = False )
+
+    def validate( self, attrs ):
+        expandable = self.context['expandable']
+        expand = { name : None for name in filter( None, attrs.get( 'expand', '' ).split( ',' ) ) }
+
+        for name in expand:
+            if name not in expandable:
+                raise ValidationError( f'The "{name}" resource cannot be expanded. Expandable resources: {", ".join( expandable ) or "none"}' )
+
+        if 'fields' not in attrs:
+            return { 'fields' : None, 'expand' : expand }
+
+        # The expanded resources are always returned
+        fields = set( expand )
+
+        for field in filter( None, attrs['fields'].split( ',' ) ):
+            resource, _, name = field.rpartition( '.' )
+
+            if resource and resource not in expand:
+                raise ValidationError( f'The field "{field}" belongs to a resource that is not expanded' )
+
+            if name not in ( expandable[ resource ] if resource else self.context['fields'] ):
+                raise ValidationError( f'Unknown field "{field}"' )
+
+            if resource:
+                expand[ resource ] = ( expand[ resource ] or set() ) | { name }
+            else:
+                fields.add( name )
+
+        return { 'fields' : fields, 'expand' : expand }
+
+def serialize_history( cash_account : CashAccount, filters : dict ) -> dict:
+    """
+        Returns the history ( purchases and r/s transfers ) of the cash account, filtered by the validated search parameters.
+        The reference implementation of "history_representation", through the serializers
+    """
+
+    querysets = get_history_querysets( cash_account, **filters )
+
+    purchases = PurchaseSerializer( data = querysets['purchases'].select_related( 'merchant_ref' ), many = True )
+    sent_transfers = TransferSerializer( data = querysets['sent'], many = True )
+    recieved_transfers = TransferSerializer( data = querysets['recieved'], many = True )
+
+    purchases.is_valid()
+    sent_transfers.is_valid()
+    recieved_transfers.is_valid()
+
+    return {
+        'purchases' : purchases.data,
+        'transfers' : {
+            'sent' : sent_transfers.data,
+            'recieved' : recieved_transfers.data,
+        }
+    }
 
 
 # Cash Account Serializers
@@ -173,6 +310,7 @@ class RetrieveCashAccountSerializer( serializers.ModelSerializer ):
         Serializer for retrieve cash account data
     """
 
+    amount = serializers.SerializerMethodField()
     history = serializers.SerializerMethodField()
     credit = CreditSerializer()
     messages = MessageSerializer( many = True )
@@ -181,24 +319,159 @@ class RetrieveCashAccountSerializer( serializers.ModelSerializer ):
         model = CashAccount
         fields = model.READING_FIELDS
 
+    def get_amount( self, instance ):
+        # The money of a hot account includes its sub-balances
+
+        return get_balance( instance )
+
     def get_history( self, instance ):
-        # Returns history ( All purchases and r/s transfers )
+        # Returns history ( All purchases and r/s transfers ), filtered by the search parameters of the request if there are any
+
+        return serialize_history( instance, self.context.get( 'history_filters', {} ) )
+
+
+# Fast read representations.
+#
+# The hottest read endpoints build their responses straight from ".values_list()" rows: no model instances, no serializer fields per row,
+# no validation of the data just read. The output is the same as of the serializers above ( "RetrieveCashAccountSerializer", "serialize_history" ),
+# which stay the definition of the responses: the field lists below follow them, and the snapshot test checks that both give the same bytes.
 
-        purchases = PurchaseSerializer( data = instance.purchases.filter( is_ignore = False ), many = True )
-        sent_transfers = TransferSerializer( data = instance.sent_transfers.filter( is_ignore = False ), many = True )
-        recieved_transfers = TransferSerializer( data = instance.recieved_transfers.filter( is_ignore = False ), many = True )
+PURCHASE_REPRESENTATION_FIELDS = ( 'id', 'merchant_ref__name', 'amount', 'creation_date', 'is_ignore' )
+TRANSFER_REPRESENTATION_FIELDS = ( 'id', 'amount', 'creation_date', 'is_ignore', 'sender_id', 'reciever_id' )
+MESSAGE_REPRESENTATION_FIELDS = ( 'content', 'creation_date' )
+CREDIT_REPRESENTATION_FIELDS = ( 'amount', 'amount_returned', 'loan_duration', 'is_increased_percentage', 'creation_date', 'last_payment_date', *Credit.STATUS_FIELDS )
 
-        purchases.is_valid()
-        sent_transfers.is_valid()
-        recieved_transfers.is_valid()
 
-        return {
-            'purchases' : purchases.data,
-            'transfers' : {
-                'sent' : sent_transfers.data,
-                'recieved' : recieved_transfers.data,
+def _datetime_formatter():
+    # "serializers.DateTimeField" looks up the current time zone for every value, the fast path once per response
+
+    return serializers.DateTimeField( default_timezone = timezone.get_current_timezone() if settings.USE_TZ else None ).to_representation
+
+
+def history_representation( cash_account : CashAccount, filters : dict ) -> dict:
+    """
+        Returns the history ( purchases and r/s transfers ) of the cash account, filtered by the validated search parameters
+    """
+
+    querysets = get_history_querysets( cash_account, **filters )
+    format_date = _datetime_formatter()
+
+    purchases = [
+        { 'id' : id, 'merchant' : merchant, 'amount' : amount, 'creation_date' : format_date( creation_date ), 'is_ignore' : is_ignore }
+        for id, merchant, amount, creation_date, is_ignore in querysets['purchases'].values_list( *PURCHASE_REPRESENTATION_FIELDS )
+    ]
+
+    transfers = {
+        key : [
+            {
+                'id' : id,
+                'amount' : amount,
+                'creation_date' : format_date( creation_date ),
+                'is_ignore' : is_ignore,
+                'sender' : sender,
+                'reciever' : reciever,
             }
-        }
+            for id, amount, creation_date, is_ignore, sender, reciever in querysets[ key ].values_list( *TRANSFER_REPRESENTATION_FIELDS )
+        ]
+        for key in ( 'sent', 'recieved' )
+    }
+
+    return {
+        'purchases' : purchases,
+        'transfers' : transfers,
+    }
+
+def credit_representation( cash_account : CashAccount ) -> dict | None:
+    """
+        Returns the credit of the cash account as "CreditSerializer" does, or None if the account has no credit
+    """
+
+    row = Credit.objects.filter( cash_account = cash_account ).values( *CREDIT_REPRESENTATION_FIELDS ).first()
+
+    if row is None:
+        return None
+
+    # The calculations only read the fields of the row
+    figures = calc_credit_figures( Credit( **row ) )
+    format_date = _datetime_formatter()
+
+    return {
+        'amount' : row['amount'],
+        'loan_duration' : row['loan_duration'],
+        'is_increased_percentage' : row['is_increased_percentage'],
+        'creation_date' : format_date( row['creation_date'] ),
+        'last_payment_date' : format_date( row['last_payment_date'] ),
+        'next_payment_date' : row['next_payment_date'],
+        'amount_to_pay_the_next_installment_of_the_loan' : figures['next_installment_amount'],
+        'remaining_amount_for_the_full_payment_of_the_loan' : figures['remaining_amount'],
+        'number_of_parts_until_the_full_payment_of_the_loan' : row['remaining_parts'],
+    }
+
+def cash_account_representation( cash_account : CashAccount, filters : dict, fields : set = None, expand : dict = None ) -> dict:
+    """
+        Returns the cash account as "RetrieveCashAccountSerializer" does, with the history filtered by the validated search parameters.
+        Only the "fields" ( all of them if None ) are read and computed. "expand" ( { 'user' : its fields or None } ) embeds the user of the account
+    """
+
+    format_date = _datetime_formatter()
+
+    builders = {
+        'id' : lambda: str( cash_account.id ),
+        'pin' : lambda: cash_account.pin,
+        'amount' : lambda: get_balance( cash_account ),
+        'creation_date' : lambda: format_date( cash_account.creation_date ),
+        'is_blocked' : lambda: cash_account.is_blocked,
+        'history' : lambda: history_representation( cash_account, filters ),
+        'credit' : lambda: credit_representation( cash_account ),
+        'messages' : lambda: [
+            { 'content' : content, 'creation_date' : format_date( creation_date ) }
+            for content, creation_date in cash_account.messages.values_list( *MESSAGE_REPRESENTATION_FIELDS )
+        ],
+    }
+
+    representation = { name : build() for name, build in builders.items() if fields is None or name in fields }
+
+    if expand and 'user' in expand:
+        representation['user'] = RetrieveUserSerializer( instance = cash_account.user, context = { 'fields' : expand['user'] } ).data
+
+    return representation
+
+
+# Analytics serializers
+
+class SpendingReportQuerySerializer( serializers.Serializer ):
+    """
+        Serializer for validating the query parameters of the spending report
+    """
+
+    date_from = serializers.DateField( required = False )
+    date_to = serializers.DateField( required = False )
+    period = serializers.ChoiceField( choices = ( 'day', 'month' ), default = 'day' )
+    category = serializers.ChoiceField( choices = SpendingRollup.category_choice, required = False )
+
+    def validate( self, attrs ):
+        # By default the report covers the last 30 days
+        date_to = attrs.setdefault( 'date_to', timezone.localdate() )
+        date_from = attrs.setdefault( 'date_from', date_to - datetime.timedelta( days = 30 ) )
+
+        if date_from > date_to:
+            raise ValidationError( 'The "date_from" parameter cannot be later than "date_to"' )
+
+        if ( date_to - date_from ).days > settings.SPENDING_REPORT_MAX_DAYS:
+            raise ValidationError( f'The report cannot cover more than {settings.SPENDING_REPORT_MAX_DAYS} days' )
+
+        return attrs
+
+class SpendingReportSerializer( serializers.Serializer ):
+    """
+        Serializer for showing spending report rows
+    """
+
+    period = serializers.DateField()
+    category = serializers.CharField()
+    merchant = serializers.CharField()
+    total = serializers.IntegerField()
+    count = serializers.IntegerField()
 
 
 class UpdateCashAccountPinSerializer( serializers.ModelSerializer ):
@@ -220,8 +493,31 @@ class UpdateCashAccountPinSerializer( serializers.ModelSerializer ):
         raise ValidationError( 'Incorrect PIN code entered' )
     
     def update(self, instance, validated_data):
-        return super().update( instance, { 'pin' : validated_data.pop( 'new_pin', None ) } )
+        # A version-checked update, so a concurrent change of the account is not overwritten by this instance
+        update_cash_account( instance, pin = validated_data['new_pin'] )
+
+        return instance
 
     def to_representation(self, instance):
         return {}
-    
\ No newline at end of file
+    
+
+
+# Account event serializers
+
+class AccountEventFeedQuerySerializer( serializers.Serializer ):
+    """
+        Serializer for validating the query parameters of the account event feed, see "services/event_service.py"
+    """
+
+    since = serializers.CharField( required = False, allow_blank = True, default = '' )
+    limit = serializers.IntegerField( min_value = 1, max_value = 1000, default = 100 )
+    wait = serializers.FloatField( min_value = 0, max_value = settings.ACCOUNT_EVENT_FEED_MAX_WAIT_SECONDS, default = 0 )
+
+    def validate_since( self, value ):
+        try:
+            parse_cursor( value )
+        except ValueError as error:
+            raise ValidationError( str( error ) )
+
+        return value
@@ -0,0 +1,161 @@
+import datetime
+
+from django.db import router, transaction, IntegrityError
+from django.db.models import F, Sum, Count, Value
+from django.db.models.functions import Coalesce
+from django.db.models.functions import TruncDate, TruncMonth
+from django.utils import timezone
+
+from bank_controller.models import CashAccount, Purchase, Transfer, SpendingRollup
+
+
+
+def add_to_spending_rollup( cash_account : CashAccount, amount : int, category : str, day : datetime.date, merchant_id : int = None ) -> None:
+    """
+        Adds one operation of the given "amount" to the rollup row of the cash account for the "day", "category" and merchant ( its id ).
+        Should be called in the same transaction as the operation itself.
+    """
+
+    lookup = {
+        'day' : day,
+        'category' : category,
+        'merchant_ref_id' : merchant_id,
+    }
+
+    # The related manager keeps the rollups on the database of the cash account ( see "bank_controller/routers.py" )
+    if cash_account.spending_rollups.filter( **lookup ).update( total = F( 'total' ) + amount, count = F( 'count' ) + 1 ):
+        return
+
+    try:
+        with transaction.atomic( using = router.db_for_write( SpendingRollup, instance = cash_account ) ):
+            cash_account.spending_rollups.create( total = amount, count = 1, **lookup )
+    except IntegrityError:
+        # The row was created by a concurrent transaction after the update above
+        cash_account.spending_rollups.filter( **lookup ).update( total = F( 'total' ) + amount, count = F( 'count' ) + 1 )
+
+def record_purchase_in_rollups( purchase : Purchase ) -> None:
+    """
+        Adds a created purchase to the spending rollups of its cash account
+    """
+
+    add_to_spending_rollup(
+        purchase.cash_account,
+        # The amount is stored in an integer column, the rollup must match what was stored
+        int( purchase.amount ),
+        'purchase',
+        timezone.localtime( purchase.creation_date ).date(),
+        merchant_id = purchase.merchant_ref_id,
+    )
+
+def record_sent_transfer_in_rollups( transfer : Transfer ) -> None:
+    """
+        Adds a created transfer to the spending rollups of the sender
+    """
+
+    add_to_spending_rollup( transfer.sender, int( transfer.amount ), 'transfer_sent', timezone.localtime( transfer.creation_date ).date() )
+
+def record_recieved_transfer_in_rollups( transfer : Transfer ) -> None:
+    """
+        Adds a created transfer to the spending rollups of the reciever
+    """
+
+    add_to_spending_rollup( transfer.reciever, int( transfer.amount ), 'transfer_recieved', timezone.localtime( transfer.creation_date ).date() )
+
+def record_transfer_in_rollups( transfer : Transfer ) -> None:
+    """
+        Adds a created transfer to the spending rollups of the sender and the reciever
+    """
+
+    record_sent_transfer_in_rollups( transfer )
+    record_recieved_transfer_in_rollups( transfer )
+
+def rebuild_spending_rollups( cash_account : CashAccount = None, batch_size : int = 1000, using : str = None ) -> int:
+    """
+        Recalculates the spending rollups from the purchases and transfers ( of one cash account, or of all accounts of the "using" database ).
+        Returns the number of created rollup rows.
+    """
+
+    if cash_account is not None:
+        using = router.db_for_write( SpendingRollup, instance = cash_account )
+
+    purchases = Purchase.objects.using( using ).all()
+    sent_transfers = Transfer.objects.using( using ).all()
+    recieved_transfers = Transfer.objects.using( using ).filter( reciever__isnull = False )
+    rollups = SpendingRollup.objects.using( using ).all()
+
+    if cash_account is not None:
+        purchases = purchases.filter( cash_account = cash_account )
+        sent_transfers = sent_transfers.filter( sender = cash_account )
+        recieved_transfers = recieved_transfers.filter( reciever = cash_account )
+        rollups = rollups.filter( cash_account = cash_account )
+
+    # ( queryset, account field, category, merchant field )
+    sources = (
+        ( purchases, 'cash_account_id', 'purchase', 'merchant_ref_id' ),
+        ( sent_transfers, 'sender_id', 'transfer_sent', None ),
+        ( recieved_transfers, 'reciever_id', 'transfer_recieved', None ),
+    )
+
+    created = 0
+
+    with transaction.atomic( using = using ):
+        rollups.delete()
+
+        for queryset, account_field, category, merchant_field in sources:
+            group_fields = [ account_field, 'day' ] + ( [ merchant_field ] if merchant_field else [] )
+            groups = queryset.annotate( day = TruncDate( 'creation_date' ) ).values( *group_fields ).annotate(
+                sum_amount = Sum( 'amount' ),
+                operations_count = Count( 'id' ),
+            ).order_by()
+
+            batch = []
+
+            for group in groups.iterator( chunk_size = batch_size ):
+                batch.append( SpendingRollup(
+                    cash_account_id = group[ account_field ],
+                    day = group['day'],
+                    category = category,
+                    merchant_ref_id = group[ merchant_field ] if merchant_field else None,
+                    total = group['sum_amount'],
+                    count = group['operations_count'],
+                ) )
+
+                if len( batch ) >= batch_size:
+                    created += len( SpendingRollup.objects.using( using ).bulk_create( batch ) )
+                    batch = []
+
+            created += len( SpendingRollup.objects.using( using ).bulk_create( batch ) )
+
+    return created
+
+def get_spending_report( cash_account : CashAccount, date_from : datetime.date, date_to : datetime.date, period : str = 'day', category : str = None ) -> list[ dict ]:
+    """
+        Returns the spending of the cash account between "date_from" and "date_to" ( inclusive ), grouped by period ( 'day' or 'month' ), category and merchant.
+        Reads only the rollup rows, so the cost depends on the size of the window, not on the size of the history.
+    """
+
+    queryset = cash_account.spending_rollups.filter( day__gte = date_from, day__lte = date_to )
+
+    if category:
+        queryset = queryset.filter( category = category )
+
+    queryset = queryset.annotate(
+        period = TruncMonth( 'day' ) if period == 'month' else F( 'day' ),
+        merchant = Coalesce( 'merchant_ref__name', Value( '' ) ),
+    )
+
+    groups = queryset.values( 'period', 'category', 'merchant' ).annotate(
+        sum_total = Sum( 'total' ),
+        sum_count = Sum( 'count' ),
+    ).order_by( 'period', 'category', 'merchant' )
+
+    return [
+        {
+            'period' : group['period'],
+            'category' : group['category'],
+            'merchant' : group['merchant'],
+            'total' : group['sum_total'],
+            'count' : group['sum_count'],
+        }
+        for group in groups
+    ]
@@ -1,4 +1,96 @@
-from bank_controller.models import CashAccount
+import random
+
+from django.db import router, transaction
+from django.db.models import F, Sum
+
+from bank_controller.models import CashAccount, CashAccountSubBalance
+from bank_controller.services.version_service import update_cash_account
+
+
+
+# Hot accounts.
+#
+# An account that recieves a lot of money ( a marketplace, a utility ) can be switched to the hot account mode ( "set_hot_account_slots" ).
+# The replenishments of a hot account do not update the row of the account, each of them adds the money to one of its sub-balances
+# chosen at random, so concurrent replenishments wait for each other only if they pick the same sub-balance.
+# The money of the account is its amount plus its sub-balances. The sub-balances are folded back into the amount
+# by every withdrawal ( so all the money can be spent ) and by the periodic compaction ( "compact_hot_accounts" ).
+# A sub-balance exists only while it is in use: a replenishment that picked a removed one ( its account instance is stale )
+# updates no row and credits the amount of the account instead.
+
+
+def get_balance( account : CashAccount ) -> int:
+    """
+        Returns the money of the account, including the sub-balances of a hot account
+    """
+
+    if not account.hot_account_slots:
+        return account.amount
+
+    return account.amount + ( account.sub_balances.aggregate( total = Sum( 'amount' ) )['total'] or 0 )
+
+def compact_sub_balances( account : CashAccount ) -> int:
+    """
+        Folds the sub-balances of the account into its amount, returns the folded amount.
+        Locks the account until the end of the transaction and refreshes "account.amount"
+    """
+
+    using = router.db_for_write( CashAccount, instance = account )
+
+    with transaction.atomic( using = using ):
+        account.amount, account.version = CashAccount.objects.using( using ).select_for_update().filter( pk = account.pk ).values_list( 'amount', 'version' ).get()
+
+        sub_balances = dict(
+            CashAccountSubBalance.objects.using( using ).select_for_update().filter( cash_account = account, amount__gt = 0 ).values_list( 'pk', 'amount' )
+        )
+        folded = sum( sub_balances.values() )
+
+        if folded:
+            CashAccountSubBalance.objects.using( using ).filter( pk__in = sub_balances ).update( amount = 0 )
+
+            # The compaction changes the amount, the writers that read the account before it must not overwrite it
+            account.amount += folded
+            account.version += 1
+            CashAccount.objects.using( using ).filter( pk = account.pk ).update( amount = account.amount, version = account.version )
+
+    return folded
+
+def compact_hot_accounts( using : str = None ) -> int:
+    """
+        Folds the sub-balances of all the accounts ( of the "using" database ) into their amounts, returns the number of compacted accounts
+    """
+
+    accounts = CashAccount.objects.using( using ).filter( pk__in = CashAccountSubBalance.objects.using( using ).filter( amount__gt = 0 ).values( 'cash_account' ) )
+
+    for account in accounts:
+        compact_sub_balances( account )
+
+    return len( accounts )
+
+def set_hot_account_slots( account : CashAccount, slots : int ) -> None:
+    """
+        Spreads the replenishments of the account over "slots" sub-balances, 0 turns the hot account mode off
+    """
+
+    using = router.db_for_write( CashAccount, instance = account )
+
+    with transaction.atomic( using = using ):
+        CashAccountSubBalance.objects.using( using ).bulk_create(
+            [ CashAccountSubBalance( cash_account = account, slot = slot ) for slot in range( slots ) ],
+            ignore_conflicts = True,
+        )
+
+        account.hot_account_slots = slots
+        CashAccount.objects.using( using ).filter( pk = account.pk ).update( hot_account_slots = slots, version = F( 'version' ) + 1 )
+
+        # The sub-balances that are not used anymore are locked, so no replenishment credits them between the compaction and the deletion.
+        # Their money stays with the account
+        unused = CashAccountSubBalance.objects.using( using ).filter( cash_account = account, slot__gte = slots )
+        list( unused.select_for_update().values_list( 'pk', flat = True ) )
+
+        compact_sub_balances( account )
+        unused.delete()
+
 
 
 def checking_availability_money( amount : int, account : CashAccount ) -> bool:
@@ -6,7 +98,7 @@ def checking_availability_money( amount : int, account : CashAccount ) -> bool:
         Returns True if the account has "amount" amount of money, and False otherwise
     """
 
-    if amount > account.amount:
+    if amount > get_balance( account ):
         return False
     
     return True
@@ -15,19 +107,43 @@ def cash_withdrawal( amount : int, account : CashAccount ) -> bool:
     """
         Tries to withdraw money from cash_account, if the operation is successful returns True, otherwise False
     """
-    
-    if not checking_availability_money( amount, account ):
-        return False
 
-    account.amount -= amount
-    account.save()
+    # The money of a hot account is spent from its amount, the sub-balances are folded into it first
+    if account.hot_account_slots:
+        compact_sub_balances( account )
 
-    return True
+    def withdraw( account : CashAccount ) -> bool:
+        if amount > account.amount:
+            return False
+
+        account.amount -= amount
+        return True
+
+    return update_cash_account( account, withdraw )
 
 def cash_replenishment( amount : int, account : CashAccount ) -> None:
     """
-        Increases the amount of money in the given "account". Returns None
+        Increases the amount of money in the given "account" ( one of the sub-balances of a hot account ). Returns None
     """
-    
-    account.amount += amount
-    account.save()
\ No newline at end of file
+
+    # Only the row of the sub-balance is locked, by the update itself. The sub-balances are created by "set_hot_account_slots",
+    # without them ( or if the sub-balance was removed since the account was read ) the money goes to the amount of the account
+    credited_to_sub_balance = False
+
+    if account.hot_account_slots:
+        credited_to_sub_balance = bool( CashAccountSubBalance.objects.using( router.db_for_write( CashAccount, instance = account ) ).filter(
+            cash_account = account,
+            slot = random.randrange( account.hot_account_slots ),
+        ).update( amount = F( 'amount' ) + amount, version = F( 'version' ) + 1 ) )
+
+    if not credited_to_sub_balance:
+        def replenish( account : CashAccount ) -> None:
+            account.amount += amount
+
+        update_cash_account( account, replenish )
+
+    # The credit of a blocked account is checked as soon as the money arrives
+    if account.is_blocked:
+        from bank_controller.services.credit_service import schedule_blocked_credit_check
+
+        schedule_blocked_credit_check( account )
\ No newline at end of file
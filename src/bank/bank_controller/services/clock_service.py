@@ -0,0 +1,66 @@
+import datetime
+from contextlib import contextmanager
+
+from django.conf import settings
+
+
+
+# Clock of the credit processing.
+#
+# The time-dependent paths of the credits ( the dates of the credits, the payments, the checks and the sweep of "services/credit_service.py" )
+# read the current time from "now()", the time of the current clock. It is the system clock, a simulated clock ( "use_clock" )
+# replays the lifecycle of the credits in virtual time: the tests and "fast_forward_credits" advance it instead of waiting.
+
+
+class SystemClock():
+    """
+        The real time
+    """
+
+    def now( self ) -> datetime.datetime:
+        return datetime.datetime.now( tz = settings.TIME_ZONE_DATETIME_MODULE_FORMAT )
+
+
+class SimulatedClock():
+    """
+        Virtual time, starts at "start" ( the real time by default ) and moves only by "advance"
+    """
+
+    def __init__( self, start : datetime.datetime = None ):
+        self.current = start or SystemClock().now()
+
+    def now( self ) -> datetime.datetime:
+        return self.current
+
+    def advance( self, delta : datetime.timedelta ) -> datetime.datetime:
+        self.current += delta
+
+        return self.current
+
+
+_clock = SystemClock()
+
+def get_clock():
+    return _clock
+
+def now() -> datetime.datetime:
+    """
+        Returns the current time of the current clock
+    """
+
+    return _clock.now()
+
+@contextmanager
+def use_clock( clock ):
+    """
+        Makes "clock" the current clock of the process until the end of the block
+    """
+
+    global _clock
+
+    previous, _clock = _clock, clock
+
+    try:
+        yield clock
+    finally:
+        _clock = previous
@@ -1,11 +1,21 @@
 import datetime
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
 from math import ceil
 
 from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+from django.db import router, transaction
+from django.db.models import Q
 
-from bank_controller.models import *
-from bank_controller.services.general_service import *
-from bank_controller.services.cash_management_service import *
+from bank_controller.models import CashAccount, Credit, Purchase
+from bank_controller.services.cash_management_service import cash_withdrawal
+from bank_controller.services.analytics_service import record_purchase_in_rollups
+from bank_controller.services.redis_service import RedisLease
+from bank_controller.services.event_service import record_event, send_message
+from bank_controller.services.version_service import update_cash_account
+from bank_controller.services.general_service import dispatch_task
+from bank_controller.services import clock_service
 
 
 
@@ -69,12 +79,168 @@ def calc_payment_time_limit( obj : Credit ) -> datetime.timedelta:
 
 
 
+# Status columns of the credits.
+#
+# The figures of the credit shown by the API ( the payment time, the next installment, the remaining amount and parts ) are functions
+# of its fields. They are stored in the columns of the credit ( "Credit.STATUS_FIELDS" ) as well, refreshed by every save of the credit,
+# so the reports filter and sort the credits by them in SQL and the sweep of the credits reads only the due ones.
+# The amount columns are rounded to the cents, the API shows the amounts as computed ( "calc_credit_figures" ).
+# "find_inconsistent_credits" checks the columns against the functions above ( the "check_credit_status" command ).
+
+def round_credit_amount( amount : float ) -> Decimal:
+    """
+        Returns the amount as the decimal of the amount columns of the credit ( rounded half up to the cents )
+    """
+
+    return Decimal( str( amount ) ).quantize( Decimal( '0.01' ), rounding = ROUND_HALF_UP )
+
+def calc_credit_figures( obj : Credit ) -> dict:
+    """
+        Returns the figures of the credit shown by the API, computed by the "calc_*" functions. A repaid credit has nothing to pay and no payment time
+    """
+
+    if calc_remaining_amount_to_repay_credit( obj ) <= 0:
+        return { 'next_payment_date' : None, 'next_installment_amount' : 0, 'remaining_amount' : 0, 'remaining_parts' : 0 }
+
+    return {
+        'next_payment_date' : calc_payment_time_limit( obj ),
+        'next_installment_amount' : calc_amount_required_to_pay_one_credit_part( obj ),
+        'remaining_amount' : calc_remaining_amount_to_repay_credit( obj ),
+        'remaining_parts' : calc_parts_remaining_to_pay_credit( obj ),
+    }
+
+def calc_credit_status( obj : Credit ) -> dict:
+    """
+        Returns the status columns of the credit: its figures, with the amounts rounded to the cents of the columns
+    """
+
+    status = calc_credit_figures( obj )
+
+    for name in ( 'next_installment_amount', 'remaining_amount' ):
+        status[ name ] = round_credit_amount( status[ name ] )
+
+    return status
+
+def refresh_credit_status( credit : Credit ) -> None:
+    """
+        Sets the status columns of the credit instance ( saved by "Credit.save" )
+    """
+
+    for name, value in calc_credit_status( credit ).items():
+        setattr( credit, name, value )
+
+def find_inconsistent_credits( using : str = None, batch_size : int = 1000 ):
+    """
+        Yields the credits ( of the "using" database ) whose status columns differ from the "calc_*" functions,
+        with the differences: ( credit, { column : ( stored value, computed value ) } )
+    """
+
+    for credit in Credit.objects.using( using ).order_by( 'pk' ).iterator( chunk_size = batch_size ):
+        differences = {
+            name : ( getattr( credit, name ), value ) for name, value in calc_credit_status( credit ).items() if getattr( credit, name ) != value
+        }
+
+        if differences:
+            yield credit, differences
+
+
+
+# Scheduling of the credit checks in the 'eta' mode ( see CREDIT_SCHEDULING_MODE ).
+#
+# A scheduled check carries the payment time it was scheduled for. A payment or a non-payment moves the payment time of the credit,
+# so the checks scheduled before are recognized as stale and do nothing; the check that moved it has already scheduled the next one.
+
+def schedule_credit_check( credit : Credit, eta : datetime.datetime = None ) -> None:
+    """
+        Schedules the check of the credit at its payment time ( or at "eta" ), once the current transaction is committed.
+        Does nothing in the 'beat' mode, or if the check is due later than CREDIT_SCHEDULING_HORIZON_SECONDS ( the periodic task schedules it )
+    """
+
+    # The simulated time is driven by the sweep ( see "fast_forward_credits" ), the tasks of the workers run in the real time
+    if settings.CREDIT_SCHEDULING_MODE != 'eta' or isinstance( clock_service.get_clock(), clock_service.SimulatedClock ):
+        return
+
+    from bank_controller.tasks import check_credit_status
+
+    due_at = calc_payment_time_limit( credit )
+    eta = eta or due_at
+
+    horizon = clock_service.now() + datetime.timedelta( seconds = settings.CREDIT_SCHEDULING_HORIZON_SECONDS )
+    if eta > horizon:
+        return
+
+    using = router.db_for_write( Credit, instance = credit )
+    args = ( credit.pk, due_at.isoformat(), using )
+
+    # If the check is not queued, the periodic sweep checks the credit
+    transaction.on_commit( lambda: dispatch_task( check_credit_status, args, eta = eta ), using = using )
+
+def schedule_blocked_credit_check( account : CashAccount ) -> None:
+    """
+        Schedules an immediate check of the credit of the blocked "account", so the account is unblocked as soon as it has the money
+    """
+
+    if settings.CREDIT_SCHEDULING_MODE != 'eta':
+        return
+
+    try:
+        credit = account.credit
+    except ObjectDoesNotExist:
+        return
+
+    schedule_credit_check( credit, eta = clock_service.now() )
+
+@contextmanager
+def claim_credit( credit_pk : int, using : str, client = None ):
+    """
+        Claims the check of the credit for CREDIT_CHECK_LEASE_SECONDS with a Redis lease ( "client" - Redis client, None - no claiming ).
+        Yields True if the credit is claimed, False if another worker is checking it now
+    """
+
+    if client is None:
+        yield True
+        return
+
+    claim = RedisLease( f'credit-check:{using}:{credit_pk}', settings.CREDIT_CHECK_LEASE_SECONDS, client = client, heartbeat = False )
+
+    if not claim.acquire():
+        yield False
+        return
+
+    try:
+        yield True
+    finally:
+        claim.release()
+
+def check_scheduled_credit( credit_pk : int, due_at : datetime.datetime, using : str = None ) -> bool:
+    """
+        Checks the credit whose check was scheduled for the payment time "due_at", the credit is read again by the check.
+        Returns False if the check is stale ( the credit was repaid, or its payment time has moved since ), True otherwise
+    """
+
+    credit = Credit.objects.using( using ).select_related( 'cash_account' ).filter( pk = credit_pk ).first()
+
+    if credit is None or calc_payment_time_limit( credit ) != due_at:
+        return False
+
+    # The task was executed before its payment time ( the clocks of the worker and of the scheduler differ )
+    if due_at > clock_service.now():
+        schedule_credit_check( credit )
+        return False
+
+    checking_payment_part_credit( credit )
+
+    return True
+
+
+
 def credit_repayment_check( credit : Credit ) -> None:
     """
         Removes a loan if it has been paid
     """
 
     if calc_credit_amount_with_percent( credit ) == credit.amount_returned:
+        record_event( 'credit_repaid', credit.cash_account, credit_id = credit.pk, amount_returned = credit.amount_returned )
         credit.delete()
         return True
     
@@ -90,35 +256,42 @@ def payment_part_credit( credit : Credit, amount : int ) -> bool:
     if amount > amount_required_to_repay_credit:
         amount = amount_required_to_repay_credit
         
-    # If the money was withdrawn
-    if cash_withdrawal( amount, credit.cash_account ):
-        # The result is the total amount repaid for this loan
-        credit.amount_returned += amount
-        credit.save()
-
-        # Update the date of the last payment
-        credit.last_payment_date = datetime.datetime.now( tz = settings.TIME_ZONE_DATETIME_MODULE_FORMAT )
-        credit.save()
-
-        # Creates a purchase object, with the merchant specified as the credit part of which was paid
-        Purchase.objects.create(
-            cash_account = credit.cash_account,
-            amount = amount,
-            merchant = f'Credit | PK: {credit.pk}',
-        )
-
-        # Removes blocking from the account if it had non-payments before
-        credit.cash_account.is_blocked = False
-        credit.cash_account.save()
+    # The withdrawal and all the records about the payment are saved in one transaction
+    with transaction.atomic( using = router.db_for_write( Credit, instance = credit ) ):
+        # If the money was withdrawn
+        if cash_withdrawal( amount, credit.cash_account ):
+            # The result is the total amount repaid for this loan
+            credit.amount_returned += amount
+            credit.save()
+
+            # Update the date of the last payment
+            credit.last_payment_date = clock_service.now()
+            credit.save()
+
+            # Creates a purchase object, with the merchant specified as the credit part of which was paid
+            purchase = Purchase.objects.create(
+                cash_account = credit.cash_account,
+                amount = amount,
+                merchant = f'Credit | PK: {credit.pk}',
+            )
+            record_purchase_in_rollups( purchase )
+            record_event( 'credit_payment', credit.cash_account, credit_id = credit.pk, amount = amount, amount_returned = credit.amount_returned )
+
+            # Removes blocking from the account if it had non-payments before
+            if credit.cash_account.is_blocked:
+                record_event( 'account_unblocked', credit.cash_account, credit_id = credit.pk )
+
+            update_cash_account( credit.cash_account, is_blocked = False )
         
-        # Creates a message notifying about the payment of a part of the loan
-        message_content = f'Your account has been debited for part of the credit'
-        Message.objects.create( cash_account = credit.cash_account, content = message_content )
+            # Creates a message notifying about the payment of a part of the loan
+            message_content = f'Your account has been debited for part of the credit'
+            send_message( credit.cash_account, message_content )
         
-        # If the loan is paid in full, deletes the record and sends a message
-        credit_repayment_check( credit )
+            # If the loan is paid in full, deletes the record and sends a message, otherwise schedules the check of the next part
+            if not credit_repayment_check( credit ):
+                schedule_credit_check( credit )
 
-        return True
+            return True
 
     return False
 
@@ -145,41 +318,99 @@ def checking_payment_part_credit( credit : Credit ) -> bool:
     if not payment_part_credit( credit, payment_amount ):
         # If the payment is not successful and the interest has not yet been increased, the interest rate of the loan is raised
         if not credit.is_increased_percentage:
-            credit.is_increased_percentage = True
-            credit.save()
-            message_content = f'Due to non-payment of the credit, the interest rate was increased for the credit with the identifier "{credit.pk}"'
-            Message.objects.create( cash_account =  credit.cash_account, content = message_content )
+            with transaction.atomic( using = router.db_for_write( Credit, instance = credit ) ):
+                credit.is_increased_percentage = True
+                credit.save()
+                record_event( 'credit_escalated', credit.cash_account, credit_id = credit.pk )
+
+                message_content = f'Due to non-payment of the credit, the interest rate was increased for the credit with the identifier "{credit.pk}"'
+                send_message( credit.cash_account, message_content )
+
+            schedule_credit_check( credit )
         # If the interest has already been increased, which means that the user has not paid the loan,
         # the user account is blocked according to the rules of the bank's credit system
         else:
             if not credit.cash_account.is_blocked:
-                credit.cash_account.is_blocked = True
-                credit.cash_account.save()
+                with transaction.atomic( using = router.db_for_write( Credit, instance = credit ) ):
+                    update_cash_account( credit.cash_account, is_blocked = True )
+                    record_event( 'account_blocked', credit.cash_account, credit_id = credit.pk )
+
+                    message_content = f'Your account is blocked due to non-payment of the credit. To unlock the account, you need to invest the amount ( { calc_remaining_amount_to_repay_credit(credit) } ), after withdrawing the money, the account will be unlocked'
+                    send_message( credit.cash_account, message_content )
 
-                message_content = f'Your account is blocked due to non-payment of the credit. To unlock the account, you need to invest the amount ( { calc_remaining_amount_to_repay_credit(credit) } ), after withdrawing the money, the account will be unlocked'
-                Message.objects.create( cash_account =  credit.cash_account, content = message_content )
+            # The payment time does not move while the account is blocked, the payment in full is retried at an interval
+            retry_at = clock_service.now() + datetime.timedelta( seconds = settings.CREDIT_BLOCKED_RETRY_SECONDS )
+            schedule_credit_check( credit, eta = retry_at )
         
         return False
 
     return True
 
-def checking_credits_status() -> None:
+def checking_credits_status( using : str = None, lease : RedisLease = None ) -> None:
     """
-        Checks all existing credits.
+        Checks all existing credits ( of the "using" database, with account sharding every shard is checked separately ).
         Sends a message and increases the percentage if the credit is not paid on time.
         Blocks the debtor's account if the credit has not been paid twice.
         Withdraws money from the account if it is enough to repay the necessary part of the credit.
+        In the 'eta' mode ( see CREDIT_SCHEDULING_MODE ) this is the safety net of the scheduled checks.
+        With the "lease" of the sweep, every due credit is claimed before its check ( see "claim_credit" ) and the sweep stops if the lease is lost.
     """
 
-    # Collection of all credits
-    credits = Credit.objects.all().select_related( 'cash_account' )
+    client = lease.client if lease is not None else None
+
+    # The credits to check by the index of the payment time: the due ones, and in the 'eta' mode the ones due before the horizon of the scheduling
+    due_before = clock_service.now()
+    if settings.CREDIT_SCHEDULING_MODE == 'eta':
+        due_before += datetime.timedelta( seconds = settings.CREDIT_SCHEDULING_HORIZON_SECONDS )
+
+    credits = Credit.objects.using( using ).filter(
+        Q( next_payment_date__lt = due_before ) | Q( next_payment_date__isnull = True )
+    ).select_related( 'cash_account' )
 
     # Go through all the credit to check
     for credit in credits:
+        # The lease expired ( the worker stalled ), another worker may be sweeping the same credits now
+        if lease is not None and lease.lost:
+            return
+
         # Calculates the time to make the next payment
 
         payment_time_limit = calc_payment_time_limit( credit )
 
-        # The condition will return True when it is necessary to repay part of the credit
-        if payment_time_limit < datetime.datetime.now( tz = settings.TIME_ZONE_DATETIME_MODULE_FORMAT ):
-            checking_payment_part_credit(credit)
\ No newline at end of file
+        # The condition will return True when it is necessary to repay part of the credit.
+        # The credit is read again once claimed, a stale check ( the credit was checked by another worker since it was read ) does nothing
+        if payment_time_limit < clock_service.now():
+            with claim_credit( credit.pk, using, client ) as claimed:
+                if claimed:
+                    check_scheduled_credit( credit.pk, payment_time_limit, using = using )
+        # In the 'eta' mode, schedules the checks that are due before the next run of the periodic task
+        else:
+            schedule_credit_check( credit )
+
+def fast_forward_credits( clock : clock_service.SimulatedClock, periods : int, sweeps_per_period : int = 1, using : str = None ) -> list[ dict ]:
+    """
+        Replays the credit processing in the simulated time: advances the clock by "periods" periods ( UNIT_PAYMENT_CREDIT_TIME ),
+        running the sweep of the credits ( of the "using" database ) "sweeps_per_period" times a period.
+        Returns the state of the credits after every period: { 'time', 'credits', 'increased_percentage', 'blocked_accounts' }
+    """
+
+    key = next( i for i in settings.UNIT_PAYMENT_CREDIT_TIME.keys() )
+    step = datetime.timedelta( **{ key : 1 } ) / sweeps_per_period
+
+    states = []
+
+    with clock_service.use_clock( clock ):
+        for _ in range( periods ):
+            for _ in range( sweeps_per_period ):
+                clock.advance( step )
+                checking_credits_status( using = using )
+
+            credits = Credit.objects.using( using )
+            states.append( {
+                'time' : clock.now(),
+                'credits' : credits.count(),
+                'increased_percentage' : credits.filter( is_increased_percentage = True ).count(),
+                'blocked_accounts' : credits.filter( cash_account__is_blocked = True ).count(),
+            } )
+
+    return states
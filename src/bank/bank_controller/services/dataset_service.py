@@ -0,0 +1,369 @@
+import csv
+import datetime
+import io
+import time
+import uuid
+
+import numpy as np
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.db import connections, router, transaction, models
+
+from bank_controller.models import User, CashAccount, Credit, Merchant, Purchase, Transfer, Message
+from bank_controller.routers import get_account_database, get_account_databases
+from bank_controller.services import clock_service
+from bank_controller.services.analytics_service import rebuild_spending_rollups
+from bank_controller.services.credit_service import refresh_credit_status
+
+
+
+# Synthetic datasets for the benchmarks and the staging databases.
+#
+# "generate_dataset" creates users with their cash accounts, credits in every state and a history skewed as the real one:
+# - the activity of the accounts follows a Pareto distribution ( a fifth of the accounts make most of the operations )
+# - the popularity of the merchants follows a Zipf distribution, the amounts are log-normal
+# - the operations of an account are spread between its creation and the end of the dataset ( "days" days )
+# Everything, the ids included, is drawn from generators seeded by the seed and the number of the chunk of the users,
+# so a seed gives the same dataset for the same end date and chunk size. The emails carry the seed, "delete_dataset" removes the dataset.
+#
+# The rows are generated as NumPy columns a chunk of users at a time and inserted without model instances ( "insert_rows" ):
+# with COPY on PostgreSQL, with batches of multi-row inserts otherwise.
+
+DATASET_EMAIL_DOMAIN = 'dataset.local'
+CREDIT_STATES = ( 'new', 'paying', 'increased', 'overdue', 'blocked' )
+
+FIRST_NAMES = ( 'Alex', 'Maria', 'Ivan', 'Olga', 'John', 'Anna', 'Omar', 'Sofia', 'Liam', 'Yuki' )
+LAST_NAMES = ( 'Smith', 'Ivanova', 'Garcia', 'Kim', 'Novak', 'Rossi', 'Muller', 'Silva', 'Chen', 'Khan' )
+MESSAGE_CONTENTS = (
+    'Your account has been debited for part of the credit',
+    'Your cash account has been replenished',
+    'The PIN of your cash account has been changed',
+    'Your account has been logged in from a new device',
+)
+
+
+def _uuid7( timestamps : np.ndarray, generator : np.random.Generator ) -> np.ndarray:
+    # "generate_uuid7" with the times and the random bits of the dataset
+
+    counters = generator.integers( 0, 0x1000, len( timestamps ) )
+    random_bits = generator.integers( 0, 2 ** 62, len( timestamps ) )
+
+    return np.array( [
+        uuid.UUID( int = ( int( timestamp * 1000 ) & 0xFFFFFFFFFFFF ) << 80 | 0x7 << 76 | int( counter ) << 64 | 0x2 << 62 | int( bits ) )
+        for timestamp, counter, bits in zip( timestamps, counters, random_bits )
+    ], dtype = object )
+
+def _datetime( timestamp : float ) -> datetime.datetime:
+    return datetime.datetime.fromtimestamp( timestamp, tz = settings.TIME_ZONE_DATETIME_MODULE_FORMAT )
+
+def _datetime_column( timestamps, connection ) -> list:
+    # The values "adapt_datetimefield_value" gives for the dates ( timestamps or datetimes ), without converting the time zone of every value
+
+    utc = datetime.timezone.utc
+    timestamps = [ value.timestamp() if isinstance( value, datetime.datetime ) else value for value in timestamps ]
+
+    if connection.vendor == 'postgresql':
+        convert = lambda timestamp: datetime.datetime.fromtimestamp( timestamp, utc )
+    elif settings.USE_TZ and connection.timezone_name == 'UTC':
+        convert = lambda timestamp: str( datetime.datetime.fromtimestamp( timestamp, utc ).replace( tzinfo = None ) )
+    else:
+        convert = lambda timestamp: connection.ops.adapt_datetimefield_value( _datetime( timestamp ) )
+
+    return [ None if timestamp is None else convert( timestamp ) for timestamp in timestamps ]
+
+def _column( field : models.Field, values, connection ) -> list:
+    # The database values of a column: the dates are given as timestamps, the numbers, the flags and the texts are stored as they are
+
+    if isinstance( field, models.DateTimeField ):
+        return _datetime_column( values, connection )
+
+    if isinstance( field, ( models.IntegerField, models.BooleanField, models.FloatField, models.CharField, models.TextField ) ) and not field.is_relation:
+        return values.tolist() if isinstance( values, np.ndarray ) else list( values )
+
+    return [ field.get_db_prep_save( value, connection ) for value in values ]
+
+def insert_rows( model, columns : dict, using : str, batch_size : int = 5000 ) -> int:
+    """
+        Inserts the rows given as columns ( { attname : values } , the dates as timestamps ) into the table of the model,
+        the other fields get their defaults. With COPY on PostgreSQL, with inserts of "batch_size" rows otherwise.
+        Returns the number of the inserted rows
+    """
+
+    count = len( next( iter( columns.values() ) ) )
+
+    if not count:
+        return 0
+
+    connection = connections[ using ]
+    quote = connection.ops.quote_name
+
+    # The database generates the integer keys
+    fields = [ field for field in model._meta.concrete_fields if field is not model._meta.auto_field ]
+    values = [
+        _column( field, columns[ field.attname ], connection ) if field.attname in columns else
+        [ field.get_db_prep_save( field.get_default(), connection ) ] * count
+        for field in fields
+    ]
+
+    table = quote( model._meta.db_table )
+    column_names = ', '.join( quote( field.column ) for field in fields )
+
+    with transaction.atomic( using = using ), connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            buffer = io.StringIO()
+            writer = csv.writer( buffer )
+            writer.writerows( ( '' if value is None else value for value in row ) for row in zip( *values ) )
+            buffer.seek( 0 )
+
+            cursor.cursor.copy_expert( f'COPY {table} ( {column_names} ) FROM STDIN WITH ( FORMAT csv )', buffer )
+            return count
+
+        # A multi-row insert per batch, within the limit of the parameters of a query
+        batch_size = min( batch_size, ( connection.features.max_query_params or count * len( fields ) ) // len( fields ) )
+        rows = list( zip( *values ) )
+
+        for start in range( 0, count, batch_size ):
+            batch = rows[ start : start + batch_size ]
+            placeholders = ', '.join( [ f'( {", ".join( [ "%s" ] * len( fields ) )} )' ] * len( batch ) )
+
+            cursor.execute( f'INSERT INTO {table} ( {column_names} ) VALUES {placeholders}', [ value for row in batch for value in row ] )
+
+    return count
+
+def _merchant_ids( count : int, using : str ) -> np.ndarray:
+    # The merchants of the dataset, created once per database
+
+    names = [ f'Merchant store #{index} | Online payment' for index in range( count ) ]
+
+    Merchant.objects.using( using ).bulk_create( [ Merchant( name = name ) for name in names ], ignore_conflicts = True )
+    ids = dict( Merchant.objects.using( using ).filter( name__in = names ).values_list( 'name', 'id' ) )
+
+    return np.array( [ ids[ name ] for name in names ] )
+
+def _credit( cash_account_id : uuid.UUID, state : str, end : float, period : float, generator : np.random.Generator ) -> Credit:
+    # A credit in the state at the end of the dataset. The amounts are multiples of 1200, so every part is a whole number
+
+    credit = Credit(
+        cash_account_id = cash_account_id,
+        amount = 1200 * int( generator.integers( 1, 84 ) ),
+        loan_duration = int( generator.choice( ( 3, 6, 12 ) ) ),
+        is_increased_percentage = state in ( 'increased', 'blocked' ),
+    )
+
+    paid_parts = int( generator.integers( 1, credit.loan_duration ) ) if state != 'new' else 0
+    total = credit.amount + ( credit.amount / 100 ) * ( 1 + int( credit.is_increased_percentage ) )
+    credit.amount_returned = int( total / credit.loan_duration * paid_parts )
+
+    # The payment time is the creation date plus the paid parts, plus one part if the rate is doubled, plus one part
+    parts_to_payment = paid_parts + int( credit.is_increased_percentage ) + 1
+    offset = float( generator.random() )
+
+    if state in ( 'overdue', 'blocked' ):
+        creation_date = end - ( parts_to_payment + offset ) * period
+    else:
+        creation_date = end - ( parts_to_payment - 1 + offset ) * period
+
+    credit.creation_date = _datetime( creation_date )
+    credit.last_payment_date = _datetime( creation_date + paid_parts * period )
+
+    refresh_credit_status( credit )
+
+    return credit
+
+def _history( created : np.ndarray, databases : np.ndarray, end : float, counts : dict, merchants : int, generator : np.random.Generator ) -> dict:
+    # The purchases, transfers and messages of the accounts of one chunk as columns, with the index of the account of every row ( "owner" )
+
+    activity = generator.pareto( 1.16, len( created ) ) + 1
+    activity /= activity.sum()
+
+    popularity = 1 / np.arange( 1, merchants + 1 ) ** 1.1
+    popularity /= popularity.sum()
+
+    def draw( count : int ) -> dict:
+        owners = generator.choice( len( created ), count, p = activity )
+
+        return {
+            'owner' : owners,
+            'creation_date' : created[ owners ] + generator.random( count ) * ( end - created[ owners ] ),
+            'is_ignore' : generator.random( count ) < 0.02,
+        }
+
+    purchases = draw( counts['purchases'] )
+    purchases['merchant'] = generator.choice( merchants, len( purchases['owner'] ), p = popularity )
+    purchases['amount'] = np.clip( generator.lognormal( 6, 1.2, len( purchases['owner'] ) ), 1, 1000000 ).astype( int )
+
+    # The reciever is an account of the same database, a transfer to itself goes outside of the bank ( no reciever )
+    transfers = draw( counts['transfers'] )
+    transfers['amount'] = np.clip( generator.lognormal( 7, 1.5, len( transfers['owner'] ) ), 1, 1000000 ).astype( int )
+    transfers['reciever'] = np.empty( len( transfers['owner'] ), dtype = int )
+
+    for database in np.unique( databases ):
+        candidates = np.flatnonzero( databases == database )
+        senders = databases[ transfers['owner'] ] == database
+        transfers['reciever'][ senders ] = candidates[ generator.integers( 0, len( candidates ), senders.sum() ) ]
+
+    transfers['creation_date'] = np.maximum( transfers['creation_date'], created[ transfers['reciever'] ] )
+
+    messages = draw( counts['messages'] )
+    messages['content'] = np.array( MESSAGE_CONTENTS, dtype = object )[ generator.integers( 0, len( MESSAGE_CONTENTS ), len( messages['owner'] ) ) ]
+
+    return { 'purchases' : purchases, 'transfers' : transfers, 'messages' : messages }
+
+def generate_dataset(
+    users : int,
+    seed : int = 0,
+    purchases : int = 50,
+    transfers : int = 10,
+    messages : int = 5,
+    credit_rate : float = 0.2,
+    merchants : int = 1000,
+    days : int = 365,
+    end : datetime.datetime = None,
+    password : str = None,
+    chunk_size : int = 10000,
+    batch_size : int = 5000,
+    rollups : bool = True,
+) -> dict:
+    """
+        Generates a synthetic dataset: "users" users with cash accounts, "purchases", "transfers" and "messages" operations per user
+        on average, and credits of "credit_rate" of the accounts, evenly in every state of "CREDIT_STATES".
+        The history spans "days" days before "end" ( now by default ), every user has the "password" ( an unusable one by default ).
+        Rebuilds the spending rollups if "rollups". Returns the numbers of the created rows and the time of the generation
+    """
+
+    started = time.perf_counter()
+
+    end = ( end or clock_service.now() ).timestamp()
+    key = next( i for i in settings.UNIT_PAYMENT_CREDIT_TIME.keys() )
+    period = datetime.timedelta( **{ key : 1 } ).total_seconds()
+
+    # One hash for all the users, hashing is the slowest part of creating a user
+    password = make_password( password )
+    users_database = router.db_for_write( User )
+    merchant_ids = { using : _merchant_ids( merchants, using ) for using in get_account_databases() }
+
+    summary = { 'users' : 0, 'credits' : { state : 0 for state in CREDIT_STATES }, 'purchases' : 0, 'transfers' : 0, 'messages' : 0 }
+
+    for chunk_start in range( 0, users, chunk_size ):
+        generator = np.random.default_rng( ( seed, chunk_start // chunk_size ) )
+        count = min( chunk_size, users - chunk_start )
+
+        numbers = np.arange( chunk_start, chunk_start + count )
+        created = np.sort( generator.uniform( end - days * 86400, end - 86400, count ) )
+        first_names = np.array( FIRST_NAMES, dtype = object )[ generator.integers( 0, len( FIRST_NAMES ), count ) ]
+        last_names = [ f'{LAST_NAMES[ index ]}-{seed}-{number}' for index, number in zip( generator.integers( 0, len( LAST_NAMES ), count ), numbers ) ]
+
+        user_ids = _uuid7( created, generator )
+        account_ids = _uuid7( created, generator )
+        databases = np.array( [ get_account_database( account_id, default = users_database ) for account_id in account_ids ], dtype = object )
+
+        user_columns = {
+            'id' : user_ids,
+            'email' : [ f'user{number}.{seed}@{DATASET_EMAIL_DOMAIN}' for number in numbers ],
+            'first_name' : first_names,
+            'last_name' : last_names,
+            'full_name' : [ f'{first_name} {last_name}' for first_name, last_name in zip( first_names, last_names ) ],
+            'birth_date' : [ datetime.date( 1950, 1, 1 ) + datetime.timedelta( days = int( days_ ) ) for days_ in generator.integers( 0, 20000, count ) ],
+            'password' : [ password ] * count,
+            'date_joined' : created,
+            'cash_account_uuid' : account_ids,
+        }
+
+        account_columns = {
+            'id' : account_ids,
+            'user_id' : user_ids,
+            'pin' : generator.integers( 1000, 10000, count ),
+            'amount' : generator.lognormal( 8, 1.5, count ).astype( int ),
+            'creation_date' : created,
+            'is_blocked' : np.zeros( count, dtype = bool ),
+        }
+
+        # Credits in every state, the blocked ones block their accounts
+        credits = []
+        states = generator.integers( 0, len( CREDIT_STATES ), count )
+
+        for index in np.flatnonzero( generator.random( count ) < credit_rate ):
+            state = CREDIT_STATES[ states[ index ] ]
+            credits.append( ( index, _credit( account_ids[ index ], state, end, period, generator ) ) )
+            account_columns['is_blocked'][ index ] = state == 'blocked'
+            summary['credits'][ state ] += 1
+
+        history = _history(
+            created, databases, end,
+            { name : int( count * mean ) for name, mean in ( ( 'purchases', purchases ), ( 'transfers', transfers ), ( 'messages', messages ) ) },
+            merchants, generator,
+        )
+
+        summary['users'] += insert_rows( User, user_columns, users_database, batch_size )
+
+        # The accounts and their rows go to the database of the account ( every shard with account sharding )
+        for using in get_account_databases():
+            accounts = databases == using
+            insert_rows( CashAccount, { name : values[ accounts ] for name, values in account_columns.items() }, using, batch_size )
+
+            credit_objects = [ credit for index, credit in credits if databases[ index ] == using ]
+            insert_rows(
+                Credit,
+                { field.attname : [ getattr( credit, field.attname ) for credit in credit_objects ] for field in Credit._meta.concrete_fields if field is not Credit._meta.auto_field },
+                using, batch_size,
+            )
+
+            rows = history['purchases']
+            mask = databases[ rows['owner'] ] == using
+            summary['purchases'] += insert_rows( Purchase, {
+                'cash_account_id' : account_ids[ rows['owner'][ mask ] ],
+                'merchant_ref_id' : merchant_ids[ using ][ rows['merchant'][ mask ] ],
+                'amount' : rows['amount'][ mask ],
+                'creation_date' : rows['creation_date'][ mask ],
+                'is_ignore' : rows['is_ignore'][ mask ],
+            }, using, batch_size )
+
+            rows = history['transfers']
+            mask = databases[ rows['owner'] ] == using
+            summary['transfers'] += insert_rows( Transfer, {
+                'sender_id' : account_ids[ rows['owner'][ mask ] ],
+                'reciever_id' : [ None if reciever == sender else account_ids[ reciever ] for sender, reciever in zip( rows['owner'][ mask ], rows['reciever'][ mask ] ) ],
+                'amount' : rows['amount'][ mask ],
+                'creation_date' : rows['creation_date'][ mask ],
+                'is_ignore' : rows['is_ignore'][ mask ],
+            }, using, batch_size )
+
+            rows = history['messages']
+            mask = databases[ rows['owner'] ] == using
+            summary['messages'] += insert_rows( Message, {
+                'cash_account_id' : account_ids[ rows['owner'][ mask ] ],
+                'content' : rows['content'][ mask ],
+                'creation_date' : rows['creation_date'][ mask ],
+                'is_ignore' : rows['is_ignore'][ mask ],
+            }, using, batch_size )
+
+    if rollups:
+        for using in get_account_databases():
+            rebuild_spending_rollups( batch_size = batch_size, using = using )
+
+    summary['seconds'] = round( time.perf_counter() - started, 2 )
+    rows = summary['users'] * 2 + sum( summary['credits'].values() ) + summary['purchases'] + summary['transfers'] + summary['messages']
+    summary['rows_per_minute'] = round( rows / summary['seconds'] * 60 ) if summary['seconds'] else None
+
+    return summary
+
+def delete_dataset( seed : int = 0, batch_size : int = 1000 ) -> int:
+    """
+        Deletes the users of the dataset of the seed with their cash accounts, credits and history. Returns the number of the deleted users
+    """
+
+    users = User.objects.filter( email__endswith = f'.{seed}@{DATASET_EMAIL_DOMAIN}' )
+    account_ids = list( users.values_list( 'cash_account_uuid', flat = True ) )
+
+    for start in range( 0, len( account_ids ), batch_size ):
+        batch = account_ids[ start : start + batch_size ]
+
+        for using in get_account_databases():
+            Credit.objects.using( using ).filter( cash_account_id__in = batch ).delete()
+            Transfer.objects.using( using ).filter( sender_id__in = batch ).delete()
+            CashAccount.objects.using( using ).filter( pk__in = batch ).delete()
+
+    deleted = len( account_ids )
+    users.delete()
+
+    return deleted
@@ -0,0 +1,116 @@
+import datetime
+
+from django.conf import settings
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import transaction
+
+from bank_controller.models import EmailOutbox
+from bank_controller.services.general_service import dispatch_task
+
+
+
+# Asynchronous email delivery.
+#
+# The emails are not sent by the request that produces them: they are saved to the outbox ( in the transaction of the request )
+# and sent by the "flush_email_outbox" celery task, which sends all the pending emails in batches over one SMTP connection.
+# A failed email is retried with an exponential backoff, up to EMAIL_OUTBOX_MAX_ATTEMPTS attempts.
+
+
+def enqueue_email( message : EmailMultiAlternatives ) -> EmailOutbox:
+    """
+        Saves the rendered "message" to the outbox and schedules the sending of the outbox once the current transaction is committed
+    """
+
+    from bank_controller.tasks import flush_email_outbox
+
+    html = next( ( content for content, mimetype in message.alternatives if mimetype == 'text/html' ), '' )
+
+    email = EmailOutbox.objects.create(
+        subject = message.subject,
+        body = message.body,
+        html = html,
+        from_email = message.from_email,
+        to = list( message.to ),
+    )
+
+    # If the sending is not queued, the periodic flush sends the email
+    transaction.on_commit( lambda: dispatch_task( flush_email_outbox ) )
+
+    return email
+
+def build_message( email : EmailOutbox, connection = None ) -> EmailMultiAlternatives:
+    """
+        Builds the email message of the outbox entry
+    """
+
+    message = EmailMultiAlternatives( email.subject, email.body, email.from_email, email.to, connection = connection )
+
+    if email.html:
+        message.attach_alternative( email.html, 'text/html' )
+
+    return message
+
+def calc_next_attempt_date( attempts : int ) -> datetime.datetime:
+    """
+        Returns the time of the next attempt after "attempts" failed attempts: EMAIL_OUTBOX_RETRY_SECONDS, doubled after every attempt
+    """
+
+    delay = settings.EMAIL_OUTBOX_RETRY_SECONDS * 2 ** ( attempts - 1 )
+
+    return datetime.datetime.now( tz = settings.TIME_ZONE_DATETIME_MODULE_FORMAT ) + datetime.timedelta( seconds = delay )
+
+def get_pending_emails():
+    """
+        Returns the emails that are due to be sent, oldest first
+    """
+
+    return EmailOutbox.objects.filter(
+        is_sent = False,
+        attempts__lt = settings.EMAIL_OUTBOX_MAX_ATTEMPTS,
+        next_attempt_date__lte = datetime.datetime.now( tz = settings.TIME_ZONE_DATETIME_MODULE_FORMAT ),
+    ).order_by( 'next_attempt_date' )
+
+def record_failed_attempt( email : EmailOutbox, error : Exception ) -> None:
+    email.attempts += 1
+    email.next_attempt_date = calc_next_attempt_date( email.attempts )
+    email.last_error = repr( error )
+    email.save( update_fields = ( 'attempts', 'next_attempt_date', 'last_error' ) )
+
+def send_pending_emails( batch_size : int = None ) -> int:
+    """
+        Sends up to "batch_size" ( EMAIL_OUTBOX_BATCH_SIZE ) pending emails over one connection to the mail server.
+        Returns the number of sent emails
+    """
+
+    emails = list( get_pending_emails()[ :batch_size or settings.EMAIL_OUTBOX_BATCH_SIZE ] )
+
+    if not emails:
+        return 0
+
+    connection = get_connection()
+
+    # The mail server is not available, the whole batch is retried later
+    try:
+        connection.open()
+    except OSError as error:
+        for email in emails:
+            record_failed_attempt( email, error )
+
+        return 0
+
+    sent = 0
+
+    try:
+        for email in emails:
+            try:
+                build_message( email, connection ).send()
+            except OSError as error:
+                record_failed_attempt( email, error )
+                continue
+
+            EmailOutbox.objects.filter( pk = email.pk ).update( is_sent = True )
+            sent += 1
+    finally:
+        connection.close()
+
+    return sent
@@ -0,0 +1,186 @@
+import json
+
+import redis
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import router, transaction
+from django.db.models import Max
+
+from bank_controller.models import CashAccount, AccountEvent, Message
+from bank_controller.routers import get_account_databases
+from bank_controller.services.cash_management_service import get_balance
+from bank_controller.services.general_service import dispatch_task
+from bank_controller.services.redis_service import get_redis
+from bank_controller.services.version_service import bump_version
+
+
+
+# Change-data feed of the cash accounts.
+#
+# Every change of an account records an "AccountEvent" in the transaction of the change ( a transactional outbox ), on the database of the account.
+# The ids of the events are not the order of their commits ( a transaction can commit after a later one ), so a reader following the ids
+# could skip an event. Instead the relay ( "relay_account_events", one at a time per database ) numbers the committed events in the order
+# it sees them: an event that committed late gets the next "sequence", after the events already read. The numbered events are:
+# - served by the feed endpoint, from a cursor: the last seen sequence of every database ( "default:120,shard_1:77" ), long-polled on the ASGI application
+# - added to the ACCOUNT_EVENT_STREAM Redis stream
+# Every event is also published to the Redis channel of its account as soon as it is committed, for the push channel ( "bank_controller/push.py" ).
+
+# The events that change the money of the account, they carry its new balance
+BALANCE_EVENT_KINDS = (
+    'purchase',
+    'transfer_sent',
+    'transfer_recieved',
+    'credit_created',
+    'credit_payment',
+)
+
+
+def record_event( kind : str, cash_account : CashAccount, **payload ) -> AccountEvent:
+    """
+        Records an event of the cash account, publishes it and schedules the relay of its database once the current transaction is committed
+    """
+
+    using = router.db_for_write( AccountEvent, instance = cash_account )
+
+    if kind in BALANCE_EVENT_KINDS:
+        payload['balance'] = get_balance( cash_account )
+
+    event = AccountEvent.objects.using( using ).create(
+        cash_account = cash_account,
+        kind = kind,
+        payload = json.loads( json.dumps( payload, cls = DjangoJSONEncoder ) ),
+    )
+
+    transaction.on_commit( lambda: publish_account_update( event ), using = using )
+    schedule_relay( using )
+
+    return event
+
+def schedule_relay( using : str ) -> None:
+    """
+        Schedules the relay of the database once the current transaction is committed, once per transaction however many events it records.
+        If the relay is not queued, the periodic relay numbers the events
+    """
+
+    from bank_controller.tasks import relay_account_events
+
+    # The callbacks of a rolled back savepoint are discarded with it, so a relay in the list is always run on commit
+    if any( getattr( callback[1], 'relayed_database', None ) == using for callback in transaction.get_connection( using ).run_on_commit ):
+        return
+
+    def relay():
+        dispatch_task( relay_account_events, ( using, ) )
+
+    relay.relayed_database = using
+    transaction.on_commit( relay, using = using )
+
+def publish_account_update( event : AccountEvent ) -> None:
+    """
+        Publishes the event to the Redis channel of its cash account. The push channel is best effort ( the clients can always read the account ),
+        so a failure of Redis does not fail the committed change
+    """
+
+    try:
+        get_redis().publish( f'{settings.PUSH_CHANNEL_PREFIX}{event.cash_account_id}', json.dumps( { 'kind' : event.kind, 'payload' : event.payload } ) )
+    except redis.RedisError:
+        pass
+
+def send_message( cash_account : CashAccount, content : str ) -> Message:
+    """
+        Creates a message of the cash account and records it as an event
+    """
+
+    message = Message.objects.create( cash_account = cash_account, content = content )
+    record_event( 'message', cash_account, message_id = message.pk, content = content )
+    bump_version( cash_account )
+
+    return message
+
+
+
+def sequence_events( using : str, batch_size : int = 1000 ) -> int:
+    """
+        Numbers the committed events of the database that have no sequence yet, in the order of their ids. Returns the number of numbered events.
+        Must not run concurrently for the same database ( "relay_account_events" holds a lease )
+    """
+
+    with transaction.atomic( using = using ):
+        events = list( AccountEvent.objects.using( using ).filter( sequence__isnull = True ).order_by( 'id' ).values_list( 'id', flat = True )[ :batch_size ] )
+        last_sequence = AccountEvent.objects.using( using ).aggregate( last = Max( 'sequence' ) )['last'] or 0
+
+        for sequence, event_id in enumerate( events, start = last_sequence + 1 ):
+            AccountEvent.objects.using( using ).filter( pk = event_id ).update( sequence = sequence )
+
+    return len( events )
+
+def publish_events( using : str, client, batch_size : int = 1000 ) -> int:
+    """
+        Adds the numbered events of the database that are not published yet to the ACCOUNT_EVENT_STREAM Redis stream, in the order of the sequence.
+        Returns the number of published events
+    """
+
+    events = list( AccountEvent.objects.using( using ).filter( is_published = False, sequence__isnull = False ).order_by( 'sequence' )[ :batch_size ] )
+
+    for event in events:
+        client.xadd(
+            settings.ACCOUNT_EVENT_STREAM,
+            { 'event' : serialize_event( event, using ) },
+            maxlen = settings.ACCOUNT_EVENT_STREAM_MAX_LENGTH,
+            approximate = True,
+        )
+        AccountEvent.objects.using( using ).filter( pk = event.pk ).update( is_published = True )
+
+    return len( events )
+
+
+
+def parse_cursor( cursor : str ) -> dict:
+    """
+        Parses the cursor of the feed ( "default:120,shard_1:77" ) into { database : last seen sequence }. Raises ValueError if it is invalid
+    """
+
+    positions = { using : 0 for using in get_account_databases() }
+
+    for position in filter( None, ( cursor or '' ).split( ',' ) ):
+        using, separator, sequence = position.partition( ':' )
+
+        if not separator or using not in positions or not sequence.isdigit():
+            raise ValueError( f'Invalid cursor position "{position}"' )
+
+        positions[ using ] = int( sequence )
+
+    return positions
+
+def format_cursor( positions : dict ) -> str:
+    return ','.join( f'{using}:{sequence}' for using, sequence in positions.items() )
+
+def serialize_event( event : AccountEvent, using : str ) -> str:
+    return json.dumps( {
+        'database' : using,
+        'sequence' : event.sequence,
+        'kind' : event.kind,
+        'cash_account' : str( event.cash_account_id ),
+        'payload' : event.payload,
+        'creation_date' : event.creation_date.isoformat(),
+    } )
+
+def get_feed( since : str, limit : int ) -> tuple[ list[ str ], str ]:
+    """
+        Returns up to "limit" serialized events after the cursor "since" ( the oldest first in every database ) and the cursor after them.
+        Does not wait for new events, the long polling waits on the Redis stream ( see "bank_controller/feed.py" )
+    """
+
+    positions = parse_cursor( since )
+    lines = []
+
+    for using, last_sequence in positions.items():
+        events = AccountEvent.objects.using( using ).filter( sequence__gt = last_sequence ).order_by( 'sequence' )[ :limit - len( lines ) ]
+
+        for event in events:
+            lines.append( serialize_event( event, using ) )
+            positions[ using ] = event.sequence
+
+        if len( lines ) >= limit:
+            break
+
+    return lines, format_cursor( positions )
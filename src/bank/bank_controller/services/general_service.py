@@ -1,7 +1,18 @@
 from django.db.models.query import QuerySet
 from django.db.models import Model
 
+import logging
+import os
 import random
+import time
+import uuid
+from threading import Lock
+
+import kombu.exceptions
+import redis
+
+
+logger = logging.getLogger( __name__ )
 
 
 def generate_pin() -> int:
@@ -11,6 +22,82 @@ def generate_pin() -> int:
 
     return random.randint( 1000, 9999 )
 
+# State of "generate_uuid7": the last used millisecond and the counter of the UUIDs generated in it
+
+_uuid7_lock = Lock()
+_uuid7_last_timestamp = 0
+_uuid7_counter = 0
+
+def generate_uuid7() -> uuid.UUID:
+    """
+        Generates a time-ordered UUID ( version 7, RFC 9562 ): 48 bits of unix time in milliseconds, a 12 bit counter and 62 random bits.
+        New keys are appended to the end of the primary key index instead of being scattered over it like uuid4 keys.
+        The UUIDs generated by one process are strictly increasing, the counter orders the UUIDs of the same millisecond.
+    """
+
+    global _uuid7_last_timestamp, _uuid7_counter
+
+    with _uuid7_lock:
+        timestamp = time.time_ns() // 1_000_000
+
+        if timestamp > _uuid7_last_timestamp:
+            # The counter starts from a random value in the lower half, so it rarely overflows
+            _uuid7_last_timestamp = timestamp
+            _uuid7_counter = random.getrandbits( 11 )
+        else:
+            # The same millisecond ( or the clock went back ): the counter continues, on overflow the next millisecond is borrowed
+            _uuid7_counter += 1
+
+            if _uuid7_counter > 0xFFF:
+                _uuid7_last_timestamp += 1
+                _uuid7_counter = random.getrandbits( 11 )
+
+        timestamp, counter = _uuid7_last_timestamp, _uuid7_counter
+
+    value = ( timestamp & 0xFFFFFFFFFFFF ) << 80
+    value |= 0x7 << 76
+    value |= counter << 64
+    value |= 0x2 << 62
+    value |= int.from_bytes( os.urandom( 8 ), 'big' ) & 0x3FFFFFFFFFFFFFFF
+
+    return uuid.UUID( int = value )
+
+def dispatch_task( task, args : tuple = (), **options ) -> bool:
+    """
+        Queues the celery task with "apply_async". Called once a change is committed, so a failure of the broker is only logged:
+        the periodic tasks pick up the work that was not queued. Returns True if the task was queued
+    """
+
+    try:
+        task.apply_async( args, **options )
+    except ( kombu.exceptions.OperationalError, redis.RedisError ):
+        logger.warning( 'The task "%s" was not queued, the broker is unavailable', task.name, exc_info = True )
+        return False
+
+    return True
+
+def init_hashing_process( settings_module : str ) -> None:
+    """
+        Initializer of the processes of a password hashing pool.
+        Forked processes already have Django configured, spawned ones have to set it up.
+    """
+
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        os.environ.setdefault( 'DJANGO_SETTINGS_MODULE', settings_module )
+        django.setup()
+
+def hash_password( password : str | None ) -> str:
+    """
+        Returns the hash of the password ( an unusable password for None ). Can be run in a process pool
+    """
+
+    from django.contrib.auth.hashers import make_password
+
+    return make_password( password )
+
 def _set_ignore_status( value : bool, obj : Model ) -> None:
     """
         Sets the value 'True' for the field 'is_ignor'.
@@ -0,0 +1,95 @@
+import datetime
+
+from django.db import connections
+from django.db.models.query import QuerySet
+from django.utils import timezone
+
+from bank_controller.models import CashAccount, Merchant
+
+
+
+def _day_start( value : datetime.date ) -> datetime.datetime:
+    """
+        Returns the aware datetime of the beginning of the given day in the current time zone
+    """
+
+    return timezone.make_aware( datetime.datetime.combine( value, datetime.time.min ) )
+
+def _prefix_upper_bound( prefix : str ) -> str | None:
+    """
+        Returns the smallest string that is greater ( by code points ) than every string starting with "prefix",
+        or None if there is no such string ( the prefix consists of U+10FFFF only )
+    """
+
+    prefix = prefix.rstrip( chr( 0x10FFFF ) )
+
+    if not prefix:
+        return None
+
+    code = ord( prefix[-1] ) + 1
+
+    # Surrogates cannot be encoded, the next encodable code point is U+E000
+    if 0xD800 <= code <= 0xDFFF:
+        code = 0xE000
+
+    return prefix[ :-1 ] + chr( code )
+
+def filter_merchant_prefix( queryset : QuerySet, prefix : str ) -> QuerySet:
+    """
+        Filters a queryset of merchants by the prefix of the name ( case-sensitive ) so that the merchant name index is used
+    """
+
+    if connections[ queryset.db ].vendor != 'sqlite':
+        # LIKE 'prefix%', on PostgreSQL through the "varchar_pattern_ops" index Django creates for the unique name
+        return queryset.filter( name__startswith = prefix )
+
+    # The LIKE of SQLite is case-insensitive and skips the index, but its default collation compares the code points,
+    # so the prefix is a range of the unique name index
+    upper_bound = _prefix_upper_bound( prefix )
+    queryset = queryset.filter( name__gte = prefix )
+
+    return queryset if upper_bound is None else queryset.filter( name__lt = upper_bound )
+
+def filter_history_queryset( queryset : QuerySet, amount_min : int = None, amount_max : int = None, date_from : datetime.date = None, date_to : datetime.date = None ) -> QuerySet:
+    """
+        Applies the amount and date filters ( both ranges are inclusive ) to a queryset of purchases or transfers.
+        Dates are turned into "creation_date" ranges, so the filters can use the history indexes ( and partition pruning ).
+    """
+
+    if amount_min is not None:
+        queryset = queryset.filter( amount__gte = amount_min )
+    if amount_max is not None:
+        queryset = queryset.filter( amount__lte = amount_max )
+    if date_from is not None:
+        queryset = queryset.filter( creation_date__gte = _day_start( date_from ) )
+    if date_to is not None:
+        queryset = queryset.filter( creation_date__lt = _day_start( date_to + datetime.timedelta( days = 1 ) ) )
+
+    return queryset
+
+def get_history_querysets( cash_account : CashAccount, merchant : str = None, direction : str = None, **filters ) -> dict[ str, QuerySet ]:
+    """
+        Returns the querysets of the not ignored purchases, sent and recieved transfers of the cash account, filtered by the search parameters:
+        - merchant - prefix of the merchant name ( case-sensitive, see "filter_merchant_prefix" ). Transfers have no merchant, so they are excluded
+        - direction - 'purchases', 'sent' or 'recieved', the other querysets are empty
+        - amount_min, amount_max, date_from, date_to - see "filter_history_queryset"
+    """
+
+    querysets = {
+        'purchases' : cash_account.purchases.filter( is_ignore = False ),
+        'sent' : cash_account.sent_transfers.filter( is_ignore = False ),
+        'recieved' : cash_account.recieved_transfers.filter( is_ignore = False ),
+    }
+
+    if merchant:
+        merchants = filter_merchant_prefix( Merchant.objects.using( querysets['purchases'].db ), merchant )
+        querysets['purchases'] = querysets['purchases'].filter( merchant_ref__in = merchants )
+        querysets['sent'] = querysets['sent'].none()
+        querysets['recieved'] = querysets['recieved'].none()
+
+    if direction:
+        for key in querysets:
+            if key != direction:
+                querysets[ key ] = querysets[ key ].none()
+
+    return { key : filter_history_queryset( queryset, **filters ) for key, queryset in querysets.items() }
@@ -0,0 +1,174 @@
+import datetime
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from django.conf import settings
+
+from bank_controller.models import Credit
+from bank_controller.routers import get_account_databases
+from bank_controller.services import clock_service
+
+
+
+# Forecast of the cash flows of the loan book.
+#
+# The credits are simulated period by period ( a period is one UNIT_PAYMENT_CREDIT_TIME, the sweep of the credits runs once a period )
+# by the rules of "checking_payment_part_credit", on NumPy arrays of all the simulated credits at once:
+# - a due credit pays its next part ( the whole remaining amount if the account is blocked ), a payment unblocks the account
+# - the first miss doubles the rate of the credit, a miss with the doubled rate blocks the account
+# - the payment time is the creation date plus the paid parts, plus one part if the rate is doubled, plus one part ( "calc_payment_time_limit" )
+# The amounts are computed by the same float operations as of the "calc_*" functions, so a simulated credit follows the sweep exactly.
+#
+# A scenario is the probability that a borrower misses a due payment. Every scenario is simulated "runs" times ( Monte-Carlo ),
+# the portfolio is split into chunks simulated by a process pool, the results are the sums of every period over the credits.
+
+PORTFOLIO_FIELDS = ( 'amount', 'loan_duration', 'amount_returned', 'is_increased_percentage', 'cash_account__is_blocked', 'creation_date' )
+METRICS = ( 'repayments', 'escalations', 'blockings', 'repaid', 'outstanding' )
+
+
+def get_period() -> datetime.timedelta:
+    """
+        Returns the length of one period, the unit of the payment time of the credits
+    """
+
+    key = next( i for i in settings.UNIT_PAYMENT_CREDIT_TIME.keys() )
+
+    return datetime.timedelta( **{ key : 1 } )
+
+def load_portfolio( now : datetime.datetime = None ) -> dict:
+    """
+        Returns the credits of all databases as arrays: { 'amount', 'loan_duration', 'amount_returned', 'increased', 'blocked', 'created' },
+        "created" is the creation date in periods relative to "now"
+    """
+
+    now = now or clock_service.now()
+    period = get_period()
+
+    rows = [
+        row
+        for using in get_account_databases()
+        for row in Credit.objects.using( using ).order_by( 'pk' ).values_list( *PORTFOLIO_FIELDS ).iterator( chunk_size = 10000 )
+    ]
+    columns = list( zip( *rows ) ) or [ () ] * len( PORTFOLIO_FIELDS )
+
+    return {
+        'amount' : np.array( columns[0], dtype = np.float64 ),
+        'loan_duration' : np.array( columns[1], dtype = np.float64 ),
+        'amount_returned' : np.array( columns[2], dtype = np.float64 ),
+        'increased' : np.array( columns[3], dtype = bool ),
+        'blocked' : np.array( columns[4], dtype = bool ),
+        'created' : np.array( [ ( creation_date - now ) / period for creation_date in columns[5] ], dtype = np.float64 ),
+    }
+
+def simulate( portfolio : dict, periods : int, runs : int, misses ) -> dict:
+    """
+        Simulates the credits of the portfolio ( see "load_portfolio" ) for "periods" periods, "runs" independent runs at once.
+        "misses( period )" returns the missed payments of the period, a boolean array ( runs, credits ).
+        Returns { metric : array ( runs, periods ) } of the sums over the credits:
+        - repayments - the money paid, escalations - the doubled rates, blockings - the blocked accounts, repaid - the repaid credits
+        - outstanding - the amount remaining to repay at the end of the period
+    """
+
+    shape = ( runs, len( portfolio['amount'] ) )
+
+    amount = np.broadcast_to( portfolio['amount'], shape )
+    loan_duration = np.broadcast_to( portfolio['loan_duration'], shape )
+    created = np.broadcast_to( portfolio['created'], shape )
+    amount_returned = np.array( np.broadcast_to( portfolio['amount_returned'], shape ) )
+    increased = np.array( np.broadcast_to( portfolio['increased'], shape ) )
+    blocked = np.array( np.broadcast_to( portfolio['blocked'], shape ) )
+    active = np.ones( shape, dtype = bool )
+
+    results = { metric : np.zeros( ( runs, periods ) ) for metric in METRICS }
+
+    for period in range( periods ):
+        # calc_credit_amount_with_percent, calc_remaining_amount_to_repay_credit, calc_amount_required_to_pay_one_credit_part
+        total = amount + ( amount / 100 ) * ( 1 + increased )
+        remaining = total - amount_returned
+        part = np.minimum( total / loan_duration, remaining )
+
+        # calc_number_paid_credit_parts and calc_payment_time_limit, the repaid credits ( 0 / 0 ) are not active
+        with np.errstate( divide = 'ignore', invalid = 'ignore' ):
+            paid_parts = loan_duration - np.ceil( remaining / part )
+
+        due = active & ( created + paid_parts + increased + 1 < period + 1 )
+        missed = due & misses( period )
+        paid = due & ~missed
+
+        # checking_payment_part_credit
+        payment = np.where( paid, np.where( blocked, remaining, part ), 0 )
+        amount_returned += payment
+
+        repaid = paid & ( amount_returned >= total )
+        escalated = missed & ~increased
+        newly_blocked = missed & increased & ~blocked
+
+        increased |= escalated
+        blocked = ( blocked & ~paid ) | newly_blocked
+        active &= ~repaid
+
+        results['repayments'][ :, period ] = payment.sum( axis = 1 )
+        results['escalations'][ :, period ] = escalated.sum( axis = 1 )
+        results['blockings'][ :, period ] = newly_blocked.sum( axis = 1 )
+        results['repaid'][ :, period ] = repaid.sum( axis = 1 )
+        results['outstanding'][ :, period ] = np.where( active, amount + ( amount / 100 ) * ( 1 + increased ) - amount_returned, 0 ).sum( axis = 1 )
+
+    return results
+
+def _simulate_scenario_chunk( task : tuple ) -> dict:
+    # A task of the process pool: one scenario over one chunk of the portfolio, with its own random generator
+
+    portfolio, periods, runs, miss_rate, seed = task
+
+    generator = np.random.default_rng( seed )
+    shape = ( runs, len( portfolio['amount'] ) )
+
+    return simulate( portfolio, periods, runs, lambda period: generator.random( shape ) < miss_rate )
+
+def forecast_loan_book( portfolio : dict, scenarios : dict, periods : int, runs : int, seed : int = 0, workers : int = 1, chunk_size : int = 10000 ) -> dict:
+    """
+        Runs the Monte-Carlo simulation of the portfolio for every scenario ( { name : probability of a missed payment } ).
+        The chunks of "chunk_size" credits are simulated by a pool of "workers" processes, the results depend on the seed and the chunk size only.
+        Returns { scenario : [ the aggregates of every period ] }: the mean, the 5th and the 95th percentiles over the runs of every metric
+    """
+
+    count = len( portfolio['amount'] )
+    chunks = [ { name : array[ start : start + chunk_size ] for name, array in portfolio.items() } for start in range( 0, count, chunk_size ) ]
+
+    tasks = [
+        ( chunk, periods, runs, miss_rate, ( seed, scenario_index, chunk_index ) )
+        for scenario_index, miss_rate in enumerate( scenarios.values() )
+        for chunk_index, chunk in enumerate( chunks )
+    ]
+
+    if workers > 1:
+        with ProcessPoolExecutor( max_workers = workers ) as pool:
+            chunk_results = list( pool.map( _simulate_scenario_chunk, tasks ) )
+    else:
+        chunk_results = list( map( _simulate_scenario_chunk, tasks ) )
+
+    forecast = {}
+
+    for scenario_index, name in enumerate( scenarios ):
+        totals = { metric : np.zeros( ( runs, periods ) ) for metric in METRICS }
+
+        for result in chunk_results[ scenario_index * len( chunks ) : ( scenario_index + 1 ) * len( chunks ) ]:
+            for metric in METRICS:
+                totals[ metric ] += result[ metric ]
+
+        forecast[ name ] = [
+            {
+                'period' : period + 1,
+                **{
+                    metric : {
+                        'mean' : round( float( totals[ metric ][ :, period ].mean() ), 2 ),
+                        'p5' : round( float( np.percentile( totals[ metric ][ :, period ], 5 ) ), 2 ),
+                        'p95' : round( float( np.percentile( totals[ metric ][ :, period ], 95 ) ), 2 ),
+                    }
+                    for metric in METRICS
+                },
+            }
+            for period in range( periods )
+        ]
+
+    return forecast
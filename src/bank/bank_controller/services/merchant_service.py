@@ -0,0 +1,145 @@
+from collections import OrderedDict
+from threading import Lock
+
+from django.conf import settings
+from django.db import router, transaction
+
+from bank_controller.models import Merchant, Purchase
+
+
+
+class MerchantCache:
+    """
+        In-process LRU cache of merchant name <-> id pairs, separate for every database alias.
+
+        Only ids that are known to be committed are stored ( see "_remember" ), so a rolled back
+        transaction can never leave an id of a merchant that does not exist in the cache.
+    """
+
+    def __init__( self, max_size : int ):
+        self.max_size = max_size
+        self._ids = OrderedDict()
+        self._names = OrderedDict()
+        self._lock = Lock()
+
+    def get_id( self, using : str, name : str ) -> int | None:
+        with self._lock:
+            key = ( using, name )
+
+            if key not in self._ids:
+                return None
+
+            self._ids.move_to_end( key )
+            return self._ids[ key ]
+
+    def get_name( self, using : str, merchant_id : int ) -> str | None:
+        with self._lock:
+            key = ( using, merchant_id )
+
+            if key not in self._names:
+                return None
+
+            self._names.move_to_end( key )
+            return self._names[ key ]
+
+    def put( self, using : str, name : str, merchant_id : int ) -> None:
+        with self._lock:
+            self._ids[ ( using, name ) ] = merchant_id
+            self._names[ ( using, merchant_id ) ] = name
+            self._ids.move_to_end( ( using, name ) )
+            self._names.move_to_end( ( using, merchant_id ) )
+
+            while len( self._ids ) > self.max_size:
+                self._ids.popitem( last = False )
+            while len( self._names ) > self.max_size:
+                self._names.popitem( last = False )
+
+    def clear( self ) -> None:
+        with self._lock:
+            self._ids.clear()
+            self._names.clear()
+
+
+merchant_cache = MerchantCache( settings.MERCHANT_CACHE_SIZE )
+
+
+def _remember( using : str, pairs : dict[ str, int ] ) -> None:
+    """
+        Puts the name -> id pairs in the cache once the current transaction is committed ( immediately outside a transaction )
+    """
+
+    def put_pairs():
+        for name, merchant_id in pairs.items():
+            merchant_cache.put( using, name, merchant_id )
+
+    transaction.on_commit( put_pairs, using = using )
+
+def resolve_merchant_ids( names, using : str = None ) -> dict[ str, int ]:
+    """
+        Returns a dictionary of merchant name -> id for the given names.
+        Cached names cost nothing, the rest is resolved with one query, missing merchants are created with one bulk insert.
+    """
+
+    using = using or router.db_for_write( Merchant )
+    result = {}
+    missing = set()
+
+    for name in names:
+        merchant_id = merchant_cache.get_id( using, name )
+
+        if merchant_id is None:
+            missing.add( name )
+        else:
+            result[ name ] = merchant_id
+
+    if not missing:
+        return result
+
+    found = dict( Merchant.objects.using( using ).filter( name__in = missing ).values_list( 'name', 'id' ) )
+
+    if len( found ) < len( missing ):
+        # "ignore_conflicts" makes concurrent creation of the same merchant harmless, the ids are read back afterwards
+        Merchant.objects.using( using ).bulk_create(
+            [ Merchant( name = name ) for name in missing if name not in found ],
+            ignore_conflicts = True,
+        )
+        found = dict( Merchant.objects.using( using ).filter( name__in = missing ).values_list( 'name', 'id' ) )
+
+    _remember( using, found )
+    result.update( found )
+
+    return result
+
+def resolve_merchant_id( name : str, using : str = None ) -> int:
+    """
+        Returns the id of the merchant with the given name, creating the merchant if it does not exist
+    """
+
+    return resolve_merchant_ids( ( name, ), using = using )[ name ]
+
+def get_merchant_name( merchant_id : int, using : str = None ) -> str:
+    """
+        Returns the name of the merchant with the given id
+    """
+
+    using = using or router.db_for_read( Merchant )
+    name = merchant_cache.get_name( using, merchant_id )
+
+    if name is None:
+        name = Merchant.objects.using( using ).values_list( 'name', flat = True ).get( pk = merchant_id )
+        _remember( using, { name : merchant_id } )
+
+    return name
+
+def bulk_create_purchases( purchases : list[ Purchase ], using : str = None, batch_size : int = 1000 ) -> list[ Purchase ]:
+    """
+        Creates the purchases with "bulk_create", resolving all their merchant names through the cache first
+    """
+
+    using = using or router.db_for_write( Purchase )
+    merchant_ids = resolve_merchant_ids( { purchase.merchant for purchase in purchases }, using = using )
+
+    for purchase in purchases:
+        purchase.merchant_ref_id = merchant_ids[ purchase.merchant ]
+
+    return Purchase.objects.using( using ).bulk_create( purchases, batch_size = batch_size )
@@ -0,0 +1,225 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, Executor
+
+from django.contrib.auth.hashers import identify_hasher
+from django.db import transaction, IntegrityError, DatabaseError
+from django.utils.dateparse import parse_date
+
+from bank_controller.models import User
+from bank_controller.services.general_service import hash_password, init_hashing_process
+
+
+
+ONBOARDING_FIELDS = ( 'email', 'first_name', 'last_name', 'birth_date' )
+REQUIRED_ONBOARDING_FIELDS = ( 'email', 'first_name', 'last_name' )
+
+
+def read_user_rows( stream, file_format : str ):
+    """
+        Yields ( line number, row dictionary ) pairs from a CSV ( with a header ) or NDJSON stream, without reading it whole
+    """
+
+    if file_format == 'csv':
+        reader = csv.DictReader( stream )
+
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate( stream, start = 1 ):
+        if not line.strip():
+            continue
+
+        try:
+            row = json.loads( line )
+        except ValueError:
+            row = None
+
+        yield line_number, row if isinstance( row, dict ) else { '_error' : 'The line is not a JSON object' }
+
+def create_hashing_executor( workers : int ) -> Executor | None:
+    """
+        Returns a process pool of "workers" processes ( None - one per CPU ) for password hashing,
+        or None to hash in the current process ( workers == 0 )
+    """
+
+    if workers == 0:
+        return None
+
+    return ProcessPoolExecutor(
+        max_workers = workers,
+        initializer = init_hashing_process,
+        initargs = ( os.environ.get( 'DJANGO_SETTINGS_MODULE' ), ),
+    )
+
+def _validate_rows( rows : list[ tuple[ int, dict ] ], pre_hashed : bool ) -> tuple[ list, list ]:
+    """
+        Splits the rows into valid ones ( line number, user fields, password ) and errors ( line number, email, message ).
+        Checks the types and the presence of the required fields, the password hashes and the uniqueness of the emails and full names ( in the chunk and in the database ).
+    """
+
+    valid = []
+    errors = []
+    seen_emails = set()
+    seen_full_names = set()
+
+    for line_number, row in rows:
+        email = row.get( 'email' ).strip() if isinstance( row.get( 'email' ), str ) else ''
+
+        if '_error' in row:
+            errors.append( ( line_number, email, row['_error'] ) )
+            continue
+
+        # The values of an NDJSON row may be of any JSON type
+        not_strings = [ field for field in ( *ONBOARDING_FIELDS, 'password' ) if row.get( field ) is not None and not isinstance( row[ field ], str ) ]
+        if not_strings:
+            errors.append( ( line_number, email, f'The fields must be strings: {", ".join( not_strings )}' ) )
+            continue
+
+        missing = [ field for field in REQUIRED_ONBOARDING_FIELDS if not ( row.get( field ) or '' ).strip() ]
+        if missing:
+            errors.append( ( line_number, email, f'Missing required fields: {", ".join( missing )}' ) )
+            continue
+
+        fields = { field : row[ field ].strip() for field in ONBOARDING_FIELDS if ( row.get( field ) or '' ).strip() }
+        fields['email'] = User.objects.normalize_email( fields['email'] )
+
+        if 'birth_date' in fields:
+            try:
+                fields['birth_date'] = parse_date( fields['birth_date'] )
+            except ValueError:
+                fields['birth_date'] = None
+
+            if fields['birth_date'] is None:
+                errors.append( ( line_number, email, 'The birth date must be in the YYYY-MM-DD format' ) )
+                continue
+
+        full_name = f'{fields["first_name"]} {fields["last_name"]}'
+        password = row.get( 'password' ) or None
+
+        if pre_hashed and password is not None:
+            try:
+                identify_hasher( password )
+            except ValueError:
+                errors.append( ( line_number, email, 'The password is not a valid password hash' ) )
+                continue
+
+        if fields['email'] in seen_emails or full_name in seen_full_names:
+            errors.append( ( line_number, email, 'Duplicate email or full name in the input' ) )
+            continue
+
+        seen_emails.add( fields['email'] )
+        seen_full_names.add( full_name )
+        valid.append( ( line_number, fields, password ) )
+
+    existing_emails = set( User.objects.filter( email__in = seen_emails ).values_list( 'email', flat = True ) )
+    existing_full_names = set( User.objects.filter( full_name__in = seen_full_names ).values_list( 'full_name', flat = True ) )
+
+    if existing_emails or existing_full_names:
+        still_valid = []
+
+        for line_number, fields, password in valid:
+            if fields['email'] in existing_emails or f'{fields["first_name"]} {fields["last_name"]}' in existing_full_names:
+                errors.append( ( line_number, fields['email'], 'A user with this email or full name already exists' ) )
+            else:
+                still_valid.append( ( line_number, fields, password ) )
+
+        valid = still_valid
+        errors.sort()
+
+    return valid, errors
+
+def onboard_chunk( rows : list[ tuple[ int, dict ] ], pre_hashed : bool = False, executor : Executor = None ) -> tuple[ int, list ]:
+    """
+        Creates the users ( and their cash accounts ) of one chunk of rows in one transaction.
+        Returns the number of created users and the list of errors ( line number, email, message ).
+    """
+
+    valid, errors = _validate_rows( rows, pre_hashed )
+
+    if not valid:
+        return 0, errors
+
+    passwords = [ password for _, _, password in valid ]
+
+    if not pre_hashed:
+        if executor is None:
+            passwords = [ hash_password( password ) for password in passwords ]
+        else:
+            passwords = list( executor.map( hash_password, passwords, chunksize = max( 1, len( passwords ) // 64 ) ) )
+    else:
+        # Rows of a pre-hashed file without a password get an unusable one, which is cheap to create
+        passwords = [ password or hash_password( None ) for password in passwords ]
+
+    users = [ dict( fields, password = password ) for ( _, fields, _ ), password in zip( valid, passwords ) ]
+
+    try:
+        with transaction.atomic():
+            User.objects.bulk_create_users( users )
+        return len( users ), errors
+    except IntegrityError:
+        pass
+
+    # A concurrent writer created a conflicting user after the validation: rows are inserted one by one to find the failing ones
+    created = 0
+
+    with transaction.atomic():
+        for ( line_number, fields, _ ), user in zip( valid, users ):
+            try:
+                with transaction.atomic():
+                    User.objects.bulk_create_users( [ user ] )
+                created += 1
+            except DatabaseError as error:
+                errors.append( ( line_number, fields['email'], str( error ) ) )
+
+    return created, errors
+
+def onboard_users( stream, file_format : str, chunk_size : int = 1000, pre_hashed : bool = False, workers : int = 0, on_chunk = None ) -> dict:
+    """
+        Creates users from a CSV / NDJSON stream in chunks of "chunk_size" rows, each chunk in its own transaction.
+        "on_chunk( report )" is called after every chunk with the running report:
+        - rows, created, errors ( list of ( line number, email, message ) ), seconds, rows_per_second
+    """
+
+    report = {
+        'rows' : 0,
+        'created' : 0,
+        'errors' : [],
+        'seconds' : 0.0,
+        'rows_per_second' : 0.0,
+    }
+    start = time.perf_counter()
+    executor = None if pre_hashed else create_hashing_executor( workers )
+
+    def process( chunk ):
+        created, errors = onboard_chunk( chunk, pre_hashed = pre_hashed, executor = executor )
+
+        report['rows'] += len( chunk )
+        report['created'] += created
+        report['errors'].extend( errors )
+        report['seconds'] = time.perf_counter() - start
+        report['rows_per_second'] = report['rows'] / report['seconds'] if report['seconds'] else 0.0
+
+        if on_chunk:
+            on_chunk( report )
+
+    try:
+        chunk = []
+
+        for row in read_user_rows( stream, file_format ):
+            chunk.append( row )
+
+            if len( chunk ) >= chunk_size:
+                process( chunk )
+                chunk = []
+
+        if chunk:
+            process( chunk )
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    return report
@@ -0,0 +1,368 @@
+import datetime
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection as default_connection, transaction
+
+
+
+# Names and boundaries
+
+def month_start( value : datetime.date ) -> datetime.date:
+    """
+        Returns the first day of the month of the given date
+    """
+
+    return datetime.date( value.year, value.month, 1 )
+
+def add_months( value : datetime.date, months : int ) -> datetime.date:
+    """
+        Returns the first day of the month that is "months" months away from the month of the given date
+    """
+
+    month_index = value.year * 12 + value.month - 1 + months
+
+    return datetime.date( month_index // 12, month_index % 12 + 1, 1 )
+
+def partition_name( table : str, month : datetime.date ) -> str:
+    """
+        Returns the name of the partition of the "table" that stores the rows of the given month
+    """
+
+    return f'{table}_p{month:%Y_%m}'
+
+def default_partition_name( table : str ) -> str:
+    """
+        Returns the name of the partition of the "table" that stores the rows that did not fall into any monthly partition
+    """
+
+    return f'{table}_default'
+
+def parse_partition_month( table : str, name : str ) -> datetime.date | None:
+    """
+        Returns the month stored by the partition with the given name, or None if it is not a monthly partition of the "table"
+    """
+
+    prefix = f'{table}_p'
+
+    if not name.startswith( prefix ):
+        return None
+
+    try:
+        return datetime.datetime.strptime( name[ len( prefix ): ], '%Y_%m' ).date()
+    except ValueError:
+        return None
+
+
+# Settings
+
+def get_partitioned_tables() -> list[ str ]:
+    """
+        Returns the names of the tables listed in settings.HISTORY_PARTITIONING['MODELS']
+    """
+
+    return [ apps.get_model( label )._meta.db_table for label in settings.HISTORY_PARTITIONING['MODELS'] ]
+
+def is_partitioning_supported( connection = default_connection ) -> bool:
+    """
+        Returns True if partitioning is enabled in the settings and the database supports it ( PostgreSQL only )
+    """
+
+    return settings.HISTORY_PARTITIONING['ENABLED'] and connection.vendor == 'postgresql'
+
+
+# Introspection
+
+def is_table_partitioned( cursor, table : str ) -> bool:
+    """
+        Returns True if the "table" is a partitioned table
+    """
+
+    cursor.execute( 'SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass( %s )', [ table ] )
+
+    return cursor.fetchone() is not None
+
+def list_partitions( cursor, table : str ) -> list[ str ]:
+    """
+        Returns the names of all partitions attached to the "table"
+    """
+
+    cursor.execute(
+        '''
+            SELECT child.relname FROM pg_inherits
+            JOIN pg_class child ON child.oid = pg_inherits.inhrelid
+            WHERE pg_inherits.inhparent = to_regclass( %s )
+        ''',
+        [ table ],
+    )
+
+    return [ row[0] for row in cursor.fetchall() ]
+
+
+# Partition management
+
+def create_partition( cursor, table : str, month : datetime.date ) -> str:
+    """
+        Creates ( if it does not exist ) the partition of the "table" for the given month. Returns the partition name.
+        The rows of the month that are already in the default partition are moved into the new partition
+    """
+
+    month = month_start( month )
+    name = partition_name( table, month )
+    default = default_partition_name( table )
+
+    # Boundaries are generated from dates, so they are safe to inline ( bounds must be literals on older PostgreSQL )
+    start, end = f'{month.isoformat()} 00:00:00+00', f'{add_months( month, 1 ).isoformat()} 00:00:00+00'
+    bounds = f"FOR VALUES FROM ( '{start}' ) TO ( '{end}' )"
+
+    cursor.execute( 'SELECT to_regclass( %s ), to_regclass( %s )', [ name, default ] )
+    partition_exists, default_exists = ( value is not None for value in cursor.fetchone() )
+
+    if partition_exists:
+        return name
+
+    if not default_exists:
+        cursor.execute( f'CREATE TABLE "{name}" PARTITION OF "{table}" {bounds}' )
+        return name
+
+    # A partition cannot be attached while the default partition holds rows of its month ( a late run of the maintenance ),
+    # so the partition is filled as a separate table first. The lock keeps new rows of the month out of the default partition meanwhile
+    with transaction.atomic( using = cursor.db.alias ):
+        cursor.execute( f'LOCK TABLE "{default}" IN SHARE ROW EXCLUSIVE MODE' )
+        cursor.execute( f'CREATE TABLE "{name}" ( LIKE "{table}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS )' )
+        cursor.execute(
+            f'WITH moved AS ( DELETE FROM "{default}" WHERE creation_date >= %s AND creation_date < %s RETURNING * ) '
+            f'INSERT INTO "{name}" SELECT * FROM moved',
+            [ start, end ],
+        )
+        cursor.execute( f'ALTER TABLE "{table}" ATTACH PARTITION "{name}" {bounds}' )
+
+    return name
+
+def detach_partition( cursor, table : str, name : str, drop : bool = True ) -> None:
+    """
+        Detaches the partition from the "table". If "drop" is True, the detached table is dropped as well.
+        Both operations only touch catalog data, so they are cheap regardless of the partition size.
+    """
+
+    cursor.execute( f'ALTER TABLE "{table}" DETACH PARTITION "{name}"' )
+
+    if drop:
+        cursor.execute( f'DROP TABLE "{name}"' )
+
+def ensure_future_partitions( months_ahead : int = None, today : datetime.date = None, connection = default_connection ) -> list[ str ]:
+    """
+        Creates monthly partitions from the current month up to "months_ahead" months ahead for every partitioned table.
+        Returns the names of the partitions that were checked/created, or an empty list if partitioning is not used.
+    """
+
+    if not is_partitioning_supported( connection ):
+        return []
+
+    months_ahead = settings.HISTORY_PARTITIONING['MONTHS_AHEAD'] if months_ahead is None else months_ahead
+    current_month = month_start( today or datetime.datetime.now( tz = settings.TIME_ZONE_DATETIME_MODULE_FORMAT ).date() )
+
+    partitions = []
+
+    with connection.cursor() as cursor:
+        for table in get_partitioned_tables():
+            if not is_table_partitioned( cursor, table ):
+                continue
+
+            for months in range( months_ahead + 1 ):
+                partitions.append( create_partition( cursor, table, add_months( current_month, months ) ) )
+
+    return partitions
+
+def drop_partitions_older_than( retention_months : int = None, today : datetime.date = None, connection = default_connection ) -> list[ str ]:
+    """
+        Detaches and drops monthly partitions whose month ended more than "retention_months" months ago.
+        Returns the names of the dropped partitions. Does nothing if the retention is not set or partitioning is not used.
+    """
+
+    retention_months = settings.HISTORY_PARTITIONING['RETENTION_MONTHS'] if retention_months is None else retention_months
+
+    if not is_partitioning_supported( connection ) or not retention_months:
+        return []
+
+    current_month = month_start( today or datetime.datetime.now( tz = settings.TIME_ZONE_DATETIME_MODULE_FORMAT ).date() )
+    oldest_kept_month = add_months( current_month, -retention_months )
+
+    dropped = []
+
+    with connection.cursor() as cursor:
+        for table in get_partitioned_tables():
+            if not is_table_partitioned( cursor, table ):
+                continue
+
+            for name in list_partitions( cursor, table ):
+                month = parse_partition_month( table, name )
+
+                if month is not None and month < oldest_kept_month:
+                    detach_partition( cursor, table, name )
+                    dropped.append( name )
+
+    return dropped
+
+
+# Conversion ( used by the "partition_history_tables" command, the migration "0004_history_partitioning" keeps its own copy )
+
+def _collect_rebuild_statements( cursor, table : str, new_table : str ) -> list[ str ]:
+    """
+        Returns the statements that recreate the secondary indexes and foreign keys of the "table" on the "new_table".
+        The primary key and unique indexes are skipped, because a partitioned table requires them to include the partition key.
+    """
+
+    statements = []
+
+    cursor.execute(
+        '''
+            SELECT pg_get_indexdef( index.indexrelid ) FROM pg_index index
+            WHERE index.indrelid = to_regclass( %s ) AND NOT index.indisprimary AND NOT index.indisunique
+        ''',
+        [ table ],
+    )
+    for ( definition, ) in cursor.fetchall():
+        # "CREATE INDEX name ON [ONLY] schema.table USING ..." -> "CREATE INDEX name ON new_table USING ..."
+        head, tail = definition.split( ' USING ', 1 )
+        statements.append( f'{ head.split( " ON " )[0] } ON "{new_table}" USING {tail}' )
+
+    cursor.execute(
+        '''
+            SELECT conname, pg_get_constraintdef( oid ) FROM pg_constraint
+            WHERE conrelid = to_regclass( %s ) AND contype = 'f'
+        ''',
+        [ table ],
+    )
+    for name, definition in cursor.fetchall():
+        statements.append( f'ALTER TABLE "{new_table}" ADD CONSTRAINT "{name}" {definition}' )
+
+    return statements
+
+def _move_id_sequence( cursor, old_table : str, new_table : str ) -> None:
+    """
+        Makes the "id" column of the "new_table" use ( and own ) a sequence that continues the ids of the "old_table"
+    """
+
+    cursor.execute(
+        "SELECT attidentity FROM pg_attribute WHERE attrelid = to_regclass( %s ) AND attname = 'id'",
+        [ old_table ],
+    )
+    is_identity = bool( cursor.fetchone()[0] )
+
+    if not is_identity:
+        # "serial" column: the default was copied with the table, only the ownership has to be moved
+        cursor.execute( "SELECT pg_get_serial_sequence( %s, 'id' )", [ old_table ] )
+        sequence = cursor.fetchone()[0]
+        cursor.execute( f'ALTER SEQUENCE {sequence} OWNED BY "{new_table}".id' )
+        return
+
+    # Identity column: the identity sequence dies with the old table, so a plain sequence takes its place
+    sequence = f'{new_table}_id_partitioned_seq'
+    cursor.execute( f'CREATE SEQUENCE IF NOT EXISTS "{sequence}" OWNED BY "{new_table}".id' )
+    cursor.execute( f'''SELECT setval( '"{sequence}"', COALESCE( ( SELECT MAX( id ) FROM "{new_table}" ), 0 ) + 1, false )''' )
+    cursor.execute( f'''ALTER TABLE "{new_table}" ALTER COLUMN id SET DEFAULT nextval( '"{sequence}"' )''' )
+
+def partition_table( cursor, table : str, months_ahead : int = 0, today : datetime.date = None ) -> None:
+    """
+        Converts a regular "table" into a table partitioned by month on "creation_date", keeping all rows, indexes and foreign keys.
+        The primary key becomes ( id, creation_date ), as PostgreSQL requires the partition key in every unique constraint.
+    """
+
+    if is_table_partitioned( cursor, table ):
+        return
+
+    legacy = f'{table}_legacy'
+
+    cursor.execute( f'ALTER TABLE "{table}" RENAME TO "{legacy}"' )
+    cursor.execute(
+        f'CREATE TABLE "{table}" ( LIKE "{legacy}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS ) '
+        'PARTITION BY RANGE ( creation_date )'
+    )
+
+    # Partitions for every month that already has rows, up to "months_ahead" months ahead, plus a default partition
+    cursor.execute( f'SELECT MIN( creation_date ) FROM "{legacy}"' )
+    first_row_date = cursor.fetchone()[0]
+
+    current_month = month_start( today or datetime.datetime.now( tz = settings.TIME_ZONE_DATETIME_MODULE_FORMAT ).date() )
+    month = month_start( first_row_date.date() ) if first_row_date else current_month
+    last_month = add_months( current_month, months_ahead )
+
+    while month <= last_month:
+        create_partition( cursor, table, month )
+        month = add_months( month, 1 )
+
+    cursor.execute( f'CREATE TABLE "{default_partition_name( table )}" PARTITION OF "{table}" DEFAULT' )
+
+    cursor.execute( f'INSERT INTO "{table}" SELECT * FROM "{legacy}"' )
+
+    rebuild_statements = _collect_rebuild_statements( cursor, legacy, table )
+    _move_id_sequence( cursor, legacy, table )
+
+    cursor.execute( f'DROP TABLE "{legacy}"' )
+    cursor.execute( f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY ( id, creation_date )' )
+
+    for statement in rebuild_statements:
+        cursor.execute( statement )
+
+def unpartition_table( cursor, table : str ) -> None:
+    """
+        Converts a partitioned "table" back into a regular table with "id" as the primary key
+    """
+
+    if not is_table_partitioned( cursor, table ):
+        return
+
+    partitioned = f'{table}_partitioned'
+
+    cursor.execute( f'ALTER TABLE "{table}" RENAME TO "{partitioned}"' )
+    cursor.execute( f'CREATE TABLE "{table}" ( LIKE "{partitioned}" INCLUDING DEFAULTS INCLUDING CONSTRAINTS )' )
+    cursor.execute( f'INSERT INTO "{table}" SELECT * FROM "{partitioned}"' )
+
+    rebuild_statements = _collect_rebuild_statements( cursor, partitioned, table )
+    _move_id_sequence( cursor, partitioned, table )
+
+    cursor.execute( f'DROP TABLE "{partitioned}" CASCADE' )
+    cursor.execute( f'ALTER TABLE "{table}" ADD CONSTRAINT "{table}_pkey" PRIMARY KEY ( id )' )
+
+    for statement in rebuild_statements:
+        cursor.execute( statement )
+
+def partition_history_tables( months_ahead : int = None, connection = default_connection ) -> list[ str ]:
+    """
+        Converts the tables of settings.HISTORY_PARTITIONING['MODELS'] that are not partitioned yet into partitioned tables.
+        Returns the names of the converted tables, or an empty list if partitioning is not used
+    """
+
+    if not is_partitioning_supported( connection ):
+        return []
+
+    months_ahead = settings.HISTORY_PARTITIONING['MONTHS_AHEAD'] if months_ahead is None else months_ahead
+    converted = []
+
+    with transaction.atomic( using = connection.alias ), connection.cursor() as cursor:
+        for table in get_partitioned_tables():
+            if not is_table_partitioned( cursor, table ):
+                partition_table( cursor, table, months_ahead = months_ahead )
+                converted.append( table )
+
+    return converted
+
+def unpartition_history_tables( connection = default_connection ) -> list[ str ]:
+    """
+        Converts the partitioned tables of settings.HISTORY_PARTITIONING['MODELS'] back into regular tables.
+        Returns the names of the converted tables
+    """
+
+    if connection.vendor != 'postgresql':
+        return []
+
+    converted = []
+
+    with transaction.atomic( using = connection.alias ), connection.cursor() as cursor:
+        for table in get_partitioned_tables():
+            if is_table_partitioned( cursor, table ):
+                unpartition_table( cursor, table )
+                converted.append( table )
+
+    return converted
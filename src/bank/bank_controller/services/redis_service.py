@@ -0,0 +1,172 @@
+import threading
+import time
+import uuid
+
+import redis
+import redis.asyncio
+from django.conf import settings
+
+
+
+_client = None
+_async_client = None
+
+def get_redis() -> redis.Redis:
+    """
+        Returns the Redis client of the process ( REDIS_URL ), created on first use
+    """
+
+    global _client
+
+    if _client is None:
+        _client = redis.Redis.from_url( settings.REDIS_URL )
+
+    return _client
+
+def get_async_redis() -> redis.asyncio.Redis:
+    """
+        Returns the asyncio Redis client of the process ( REDIS_URL ), created on first use. Used by the ASGI application only
+    """
+
+    global _async_client
+
+    if _async_client is None:
+        _async_client = redis.asyncio.Redis.from_url( settings.REDIS_URL )
+
+    return _async_client
+
+
+
+# Distributed leases.
+#
+# A lease is a Redis key with a random token as its value and an expiry. Only the holder of the token can renew or release it,
+# and if the holder dies the key simply expires. While the lease is used as a context manager, a heartbeat thread renews it
+# every third of its time, so a long piece of work keeps it however long it takes.
+
+RENEW_SCRIPT = '''
+if redis.call( 'get', KEYS[1] ) == ARGV[1] then
+    return redis.call( 'pexpire', KEYS[1], ARGV[2] )
+end
+return 0
+'''
+
+RELEASE_SCRIPT = '''
+if redis.call( 'get', KEYS[1] ) == ARGV[1] then
+    return redis.call( 'del', KEYS[1] )
+end
+return 0
+'''
+
+
+class RedisLease():
+    """
+        Distributed lease "name", held for "seconds" after every acquisition or renewal.
+
+        with RedisLease( 'credit-sweep:default', 60 ) as lease:
+            if lease.acquired:
+                ...  # Checks "lease.lost" between the units of work
+
+        The metrics of the lease ( acquired and skipped runs, lost leases, hold time ) are kept in the "lease-metrics:<name>" hash
+    """
+
+    def __init__( self, name : str, seconds : float, client : redis.Redis = None, heartbeat : bool = True ):
+        self.name = name
+        self.key = f'lease:{name}'
+        self.milliseconds = int( seconds * 1000 )
+        self.client = client or get_redis()
+        self.token = uuid.uuid4().hex
+        self.heartbeat = heartbeat
+
+        self.acquired = False
+        self.lost = False
+        self.acquired_at = None
+
+        self._stop = threading.Event()
+        self._thread = None
+
+    def acquire( self ) -> bool:
+        """
+            Tries to take the lease, returns True if it is taken. Does not wait for the current holder
+        """
+
+        self.acquired = bool( self.client.set( self.key, self.token, nx = True, px = self.milliseconds ) )
+
+        if self.acquired:
+            self.acquired_at = time.monotonic()
+
+        return self.acquired
+
+    def renew( self ) -> bool:
+        """
+            Extends the lease by its time. Returns False, and marks the lease as lost, if it expired or was taken by another holder
+        """
+
+        if not self.client.eval( RENEW_SCRIPT, 1, self.key, self.token, self.milliseconds ):
+            self.lost = True
+
+        return not self.lost
+
+    def release( self ) -> bool:
+        """
+            Gives up the lease, returns False if it was not held anymore
+        """
+
+        self.acquired = False
+
+        return bool( self.client.eval( RELEASE_SCRIPT, 1, self.key, self.token ) )
+
+    def held_seconds( self ) -> float:
+        return time.monotonic() - self.acquired_at
+
+    def _renew_periodically( self ) -> None:
+        while not self._stop.wait( self.milliseconds / 3000 ):
+            if not self.renew():
+                return
+
+    def __enter__( self ):
+        if not self.acquire():
+            self.client.hincrby( f'lease-metrics:{self.name}', 'skipped', 1 )
+            return self
+
+        self.client.hincrby( f'lease-metrics:{self.name}', 'acquired', 1 )
+
+        if self.heartbeat:
+            self._thread = threading.Thread( target = self._renew_periodically, name = f'lease-heartbeat:{self.name}', daemon = True )
+            self._thread.start()
+
+        return self
+
+    def __exit__( self, *args ):
+        if not self.acquired:
+            return
+
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+
+        held_seconds = self.held_seconds()
+
+        if not self.release():
+            self.lost = True
+
+        metrics = f'lease-metrics:{self.name}'
+        self.client.hincrbyfloat( metrics, 'held_seconds_total', held_seconds )
+        self.client.hset( metrics, 'last_held_seconds', held_seconds )
+        if self.lost:
+            self.client.hincrby( metrics, 'lost', 1 )
+
+def get_lease_metrics( name : str, client : redis.Redis = None ) -> dict:
+    """
+        Returns the metrics of the lease "name": { 'acquired', 'skipped', 'lost', 'held_seconds_total', 'last_held_seconds' }
+    """
+
+    metrics = ( client or get_redis() ).hgetall( f'lease-metrics:{name}' )
+    metrics = { key.decode() if isinstance( key, bytes ) else key : float( value ) for key, value in metrics.items() }
+
+    return {
+        'acquired' : int( metrics.get( 'acquired', 0 ) ),
+        'skipped' : int( metrics.get( 'skipped', 0 ) ),
+        'lost' : int( metrics.get( 'lost', 0 ) ),
+        'held_seconds_total' : metrics.get( 'held_seconds_total', 0.0 ),
+        'last_held_seconds' : metrics.get( 'last_held_seconds', 0.0 ),
+    }
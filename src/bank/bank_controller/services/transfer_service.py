@@ -0,0 +1,90 @@
+from django.db import router, transaction, IntegrityError
+
+from bank_controller.models import CashAccount, Transfer, TransferOutbox, TransferInbox
+from bank_controller.routers import get_account_database
+from bank_controller.services.cash_management_service import cash_withdrawal, cash_replenishment
+from bank_controller.services.analytics_service import record_sent_transfer_in_rollups, record_recieved_transfer_in_rollups
+from bank_controller.services.event_service import record_event
+from bank_controller.services.general_service import dispatch_task
+
+
+
+# Transfers between cash accounts on different shards ( see "bank_controller/routers.py" ).
+#
+# A single transaction cannot span two databases, so a cross-shard transfer is done with a transactional outbox:
+# 1. On the shard of the sender, in one transaction: the withdrawal, the transfer and an outbox entry
+# 2. On the shard of the reciever, in one transaction: the replenishment, a copy of the transfer and an inbox entry
+# 3. The outbox entry is marked as delivered
+# The inbox entry makes step 2 idempotent, so a relay that failed after step 2 can simply be repeated.
+
+
+def create_cross_shard_transfer( sender : CashAccount, reciever : CashAccount, amount : int ) -> Transfer | None:
+    """
+        Withdraws the money from the sender and records the transfer and its outbox entry on the shard of the sender.
+        The money is credited to the reciever by "relay_transfer_outbox" once the transaction is committed.
+        Returns None if the sender does not have the money ( it was spent concurrently )
+    """
+
+    from bank_controller.tasks import relay_transfer_outbox
+
+    using = router.db_for_write( Transfer, instance = sender )
+
+    with transaction.atomic( using = using ):
+        if not cash_withdrawal( amount, sender ):
+            return None
+
+        instance = Transfer.objects.using( using ).create( sender = sender, reciever = reciever, amount = amount )
+        record_sent_transfer_in_rollups( instance )
+        record_event( 'transfer_sent', sender, transfer_id = instance.pk, amount = amount, reciever = reciever.pk )
+
+        TransferOutbox.objects.using( using ).create( transfer = instance )
+
+        # The outbox entry is committed, if the relay is not queued the periodic relay delivers it
+        transaction.on_commit( lambda: dispatch_task( relay_transfer_outbox, ( using, ) ), using = using )
+
+    return instance
+
+def deliver_transfer( outbox : TransferOutbox ) -> None:
+    """
+        Credits the transfer of the outbox entry to the reciever on the shard of the reciever, then marks the entry as delivered.
+        Does not credit the money again if the entry was already delivered ( even if it was not marked as delivered ).
+    """
+
+    transfer = outbox.transfer
+    using = get_account_database( transfer.reciever_id )
+
+    try:
+        with transaction.atomic( using = using ):
+            if not TransferInbox.objects.using( using ).filter( pk = outbox.pk ).exists():
+                reciever = CashAccount.objects.using( using ).select_for_update().get( pk = transfer.reciever_id )
+                cash_replenishment( transfer.amount, reciever )
+
+                # The copy keeps the date of the original transfer, so both accounts show the same history
+                instance = Transfer.objects.using( using ).create( sender_id = transfer.sender_id, reciever = reciever, amount = transfer.amount )
+                Transfer.objects.using( using ).filter( pk = instance.pk ).update( creation_date = transfer.creation_date )
+                instance.creation_date = transfer.creation_date
+
+                record_recieved_transfer_in_rollups( instance )
+                record_event( 'transfer_recieved', reciever, transfer_id = instance.pk, amount = instance.amount, sender = instance.sender_id )
+
+                TransferInbox.objects.using( using ).create( outbox_id = outbox.pk, transfer = instance )
+    except IntegrityError:
+        # A concurrent relay delivered the same entry first
+        pass
+
+    TransferOutbox.objects.using( outbox._state.db ).filter( pk = outbox.pk ).update( is_delivered = True )
+
+def deliver_pending_transfers( using : str, batch_size : int = 100 ) -> int:
+    """
+        Delivers the not delivered outbox entries of the "using" shard, oldest first. Returns the number of delivered entries
+    """
+
+    pending = TransferOutbox.objects.using( using ).filter( is_delivered = False ).select_related( 'transfer' ).order_by( 'creation_date' )
+
+    delivered = 0
+
+    for outbox in pending[ :batch_size ]:
+        deliver_transfer( outbox )
+        delivered += 1
+
+    return delivered
@@ -0,0 +1,94 @@
+from django.conf import settings
+from django.db import router, transaction
+from django.db.models import F, Sum
+
+from bank_controller.models import CashAccount, CashAccountVersionConflict
+from bank_controller.routers import get_account_database
+
+
+
+# Versions of the cash accounts.
+#
+# Every change of what the account resources show ( "retrieve-cash_account", "retrieve-user" ) increments the version of the cash account,
+# in the database and in the transaction of the change:
+# - the money and the PIN, by "CashAccount.save"
+# - the credit operations, they always change the money or send a message
+# - the messages ( "send_message" ), the history clears and the user ( "User.save" ), by "bump_version"
+# The replenishments of a hot account increment the version of their sub-balance instead, so they still do not lock the row of the account:
+# the version of a hot account is its own version plus the versions of its sub-balances.
+# The version is served as the ETag of the account resources, see "ConditionalGetMixin".
+#
+# The version is also the optimistic lock of the account: "CashAccount.save" writes the account only if its version in the database
+# is still the version of the instance. The changes of the services go through "update_cash_account", which re-reads the account
+# and applies the change again after a conflict, so an account written by one request at a time is never locked.
+
+
+def bump_version( cash_account ) -> None:
+    """
+        Increments the version of the cash account ( an instance or an id )
+    """
+
+    if isinstance( cash_account, CashAccount ):
+        using = router.db_for_write( CashAccount, instance = cash_account )
+        cash_account_id = cash_account.pk
+    else:
+        using = get_account_database( cash_account )
+        cash_account_id = cash_account
+
+    CashAccount.objects.using( using ).filter( pk = cash_account_id ).update( version = F( 'version' ) + 1 )
+
+    # A stale instance stays behind the database, a current one stays current
+    if isinstance( cash_account, CashAccount ):
+        cash_account.version += 1
+
+def get_version( cash_account : CashAccount ) -> int:
+    """
+        Returns the version of the cash account, including the versions of the sub-balances of a hot account
+    """
+
+    if not cash_account.hot_account_slots:
+        return cash_account.version
+
+    # Both parts only grow, so every change gives a greater sum
+    return cash_account.version + ( cash_account.sub_balances.aggregate( total = Sum( 'version' ) )['total'] or 0 )
+
+def update_cash_account( cash_account : CashAccount, change = None, **values ) -> bool:
+    """
+        Sets "values" on the cash account, calls "change( cash_account )" ( which changes the instance, computing from its current fields,
+        or returns False to change nothing ) and saves the account with the version check.
+        After a conflict the account is re-read and changed again, up to CASH_ACCOUNT_OCC_RETRIES times, then the last attempt
+        locks the row of the account. Returns False if "change" did, True when the change is saved
+    """
+
+    def apply_change() -> bool:
+        for name, value in values.items():
+            setattr( cash_account, name, value )
+
+        return change is None or change( cash_account ) is not False
+
+    using = router.db_for_write( CashAccount, instance = cash_account )
+
+    for _ in range( settings.CASH_ACCOUNT_OCC_RETRIES ):
+        if not apply_change():
+            return False
+
+        # A savepoint, the conflict must not break the transaction of the caller
+        try:
+            with transaction.atomic( using = using ):
+                cash_account.save()
+
+            return True
+        except CashAccountVersionConflict:
+            cash_account.refresh_from_db( using = using )
+
+    # A contended account: the row is locked, so the last attempt cannot conflict
+    with transaction.atomic( using = using ):
+        CashAccount.objects.using( using ).select_for_update().filter( pk = cash_account.pk ).values_list( 'pk' ).get()
+        cash_account.refresh_from_db( using = using )
+
+        if not apply_change():
+            return False
+
+        cash_account.save()
+
+    return True
@@ -1,10 +1,105 @@
+import datetime
+
+from django.conf import settings
+
 from config.celery import app
 
-from .services.credit_service import checking_credits_status
+from .routers import get_account_databases
+from .services.credit_service import checking_credits_status, check_scheduled_credit, claim_credit
+from .services.redis_service import RedisLease, get_redis
+
 
+# The services of the rarely run tasks are imported by the tasks themselves, so the workers start without them
 
-# Starts a task to check the status of credits
+
+# Starts a task to check the status of credits ( with account sharding - one task per shard ).
+# Every minute in the 'beat' credit scheduling mode, once per CREDIT_SCHEDULING_HORIZON_SECONDS in the 'eta' mode
 
 @app.task
 def periodic_check_credit_status():
-    checking_credits_status()
\ No newline at end of file
+    for using in get_account_databases():
+        check_credits_status_on_database.delay( using )
+
+# A sweep of a database is skipped while the previous one still holds its lease, so the workers never check the same credits twice
+
+@app.task
+def check_credits_status_on_database( using ):
+    with RedisLease( f'credit-sweep:{using}', settings.CREDIT_SWEEP_LEASE_SECONDS ) as lease:
+        if lease.acquired:
+            checking_credits_status( using = using, lease = lease )
+
+# Starts a task to check one credit at its payment time ( the 'eta' credit scheduling mode, see "schedule_credit_check" )
+
+@app.task
+def check_credit_status( credit_pk, due_at, using = None ):
+    # A credit claimed by another worker is being checked by it, which makes this check stale
+    with claim_credit( credit_pk, using, get_redis() ) as claimed:
+        if claimed:
+            check_scheduled_credit( credit_pk, datetime.datetime.fromisoformat( due_at ), using = using )
+
+# Starts a task to fold the sub-balances of the hot cash accounts into their amounts ( with account sharding - one task per shard )
+
+@app.task
+def periodic_compact_hot_accounts():
+    for using in get_account_databases():
+        compact_hot_accounts_on_database.delay( using )
+
+@app.task
+def compact_hot_accounts_on_database( using ):
+    from .services.cash_management_service import compact_hot_accounts
+
+    compact_hot_accounts( using = using )
+
+# Starts a task to number the new account events of a database and publish them to the Redis stream ( see "services/event_service.py" ).
+# Scheduled when an event is committed, the periodic task picks up the events whose relay failed
+
+@app.task
+def relay_account_events( using ):
+    from .services.event_service import sequence_events, publish_events
+
+    with RedisLease( f'account-event-relay:{using}', settings.ACCOUNT_EVENT_RELAY_LEASE_SECONDS ) as lease:
+        if lease.acquired:
+            sequence_events( using )
+            publish_events( using, lease.client )
+
+@app.task
+def periodic_relay_account_events():
+    for using in get_account_databases():
+        relay_account_events.delay( using )
+
+# Starts a task to create the upcoming monthly partitions of the history tables and drop the expired ones
+
+@app.task
+def maintain_history_partitions():
+    from .services.partition_service import ensure_future_partitions, drop_partitions_older_than
+
+    ensure_future_partitions()
+    drop_partitions_older_than()
+
+# Starts a task to credit the cross-shard transfers of a shard to their recievers.
+# Scheduled when such a transfer is committed, the periodic task picks up the transfers whose relay failed
+
+@app.task
+def relay_transfer_outbox( using ):
+    from .services.transfer_service import deliver_pending_transfers
+
+    deliver_pending_transfers( using )
+
+@app.task
+def periodic_relay_transfer_outbox():
+    if len( get_account_databases() ) > 1:
+        for using in get_account_databases():
+            relay_transfer_outbox.delay( using )
+
+# Starts a task to send the emails of the outbox ( see "services/email_service.py" ), batch after batch.
+# Scheduled when an email is saved, the periodic task sends the retried emails.
+# One sender at a time, an email is never sent twice by concurrent tasks
+
+@app.task
+def flush_email_outbox():
+    from .services.email_service import send_pending_emails
+
+    with RedisLease( 'email-outbox', settings.EMAIL_OUTBOX_LEASE_SECONDS ) as lease:
+        if lease.acquired:
+            while not lease.lost and send_pending_emails() == settings.EMAIL_OUTBOX_BATCH_SIZE:
+                pass
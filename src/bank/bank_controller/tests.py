@@ -1,27 +1,252 @@
+import asyncio
 import datetime
+import itertools
+import json
+import os
+import socketserver
+import tempfile
+import threading
+import time
+import uuid
+from decimal import Decimal
+from io import StringIO
 from time import sleep
+from unittest import mock
 
-from django.urls import reverse
+import kombu.exceptions
+import msgpack
+import numpy as np
+import redis
+
+from django.urls import reverse, get_resolver
 from rest_framework import status
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 from rest_framework.authtoken.models import Token
 from django.db.utils import IntegrityError
-from django.test import TestCase
+from django.db import connection, transaction
+from django.test import TestCase, SimpleTestCase, override_settings
+from django.core.management import call_command, CommandError
 from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Sum
+from django.utils import timezone
+from asgiref.sync import sync_to_async
 
 from bank_controller.models import *
 from bank_controller.serializers import *
 from bank_controller.services.cash_management_service import *
 from bank_controller.services.general_service import *
 from bank_controller.services.credit_service import *
+from bank_controller.services.partition_service import *
+from bank_controller.services.analytics_service import *
+from bank_controller.services.merchant_service import *
+from bank_controller.services.history_service import *
+from bank_controller.services.transfer_service import *
 from bank_controller.mixins.serializer_mixins import *
 from bank_controller.mixins.view_mixins import *
+from bank_controller.services.email_service import *
+from bank_controller.services.event_service import *
+from bank_controller.services.version_service import *
+from bank_controller.services.loan_book_service import *
+from bank_controller.services.dataset_service import generate_dataset, delete_dataset, CREDIT_STATES
+from bank_controller.services.clock_service import SystemClock, SimulatedClock, get_clock, use_clock
+from bank_controller.services.redis_service import RedisLease, get_lease_metrics, RENEW_SCRIPT
+from bank_controller.routers import *
+from bank_controller.push import RedisBroadcaster, stream, push_application, create_ticket, redeem_ticket
+from bank_controller.feed import feed_application
+from bank_controller.tasks import check_credit_status, check_credits_status_on_database, relay_account_events, relay_transfer_outbox, flush_email_outbox
+from bank_controller.benchmarks.startup import boot, API_ONLY_MODULES, WORKER_STARTUP_BUDGET
+from config.warmup import warm_up_application, warm_up_connections
 
 
 class PseudoRequest():
     user = None
     data = None
 
+class FakeSMTPHandler( socketserver.StreamRequestHandler ):
+    """
+        One connection to "FakeSMTPServer": greets after the delay of the server and accepts the messages
+    """
+
+    def reply( self, line ):
+        self.wfile.write( f'{line}\r\n'.encode() )
+
+    def handle( self ):
+        self.server.connections += 1
+        sleep( self.server.delay )
+        self.reply( '220 fake' )
+
+        while line := self.rfile.readline():
+            command = line.decode().strip().upper()
+
+            if command.startswith( 'MAIL' ):
+                self.reply( self.server.mail_reply )
+            elif command == 'DATA':
+                self.reply( '354 End data with <CR><LF>.<CR><LF>' )
+                data = b''.join( iter( self.rfile.readline, b'.\r\n' ) )
+                self.server.messages.append( data )
+                self.reply( '250 OK' )
+            elif command == 'QUIT':
+                self.reply( '221 Bye' )
+                return
+            else:
+                self.reply( '250 OK' )
+
+class FakeSMTPServer( socketserver.ThreadingTCPServer ):
+    """
+        Local SMTP server of the email tests, that answers every new connection after "delay" seconds ( a slow mail server )
+    """
+
+    daemon_threads = True
+
+    def __init__( self, delay = 0 ):
+        super().__init__( ( '127.0.0.1', 0 ), FakeSMTPHandler )
+        self.delay = delay
+        self.connections = 0
+        self.messages = []
+        self.mail_reply = '250 OK'
+
+    def __enter__( self ):
+        threading.Thread( target = self.serve_forever, daemon = True ).start()
+        return self
+
+    def __exit__( self, *args ):
+        self.shutdown()
+        self.server_close()
+
+    def settings( self ):
+        return override_settings(
+            EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend',
+            EMAIL_HOST = '127.0.0.1',
+            EMAIL_PORT = self.server_address[1],
+            EMAIL_USE_TLS = False,
+            EMAIL_HOST_USER = '',
+            EMAIL_HOST_PASSWORD = '',
+        )
+
+class FakeRedis():
+    """
+        In-memory double of the Redis commands used by the leases ( "services/redis_service.py" )
+    """
+
+    def __init__( self ):
+        self.values = {}
+        self.expires = {}
+        self.hashes = {}
+
+    def get( self, key ):
+        if key in self.expires and self.expires[ key ] <= time.monotonic():
+            del self.values[ key ], self.expires[ key ]
+
+        return self.values.get( key )
+
+    def set( self, key, value, nx = False, px = None ):
+        if nx and self.get( key ) is not None:
+            return None
+
+        self.values[ key ] = value.encode()
+        self.expires[ key ] = time.monotonic() + px / 1000
+        return True
+
+    def eval( self, script, numkeys, key, token, *args ):
+        if self.get( key ) != token.encode():
+            return 0
+
+        if script == RENEW_SCRIPT:
+            self.expires[ key ] = time.monotonic() + int( args[0] ) / 1000
+        else:
+            del self.values[ key ], self.expires[ key ]
+
+        return 1
+
+    def hincrby( self, name, key, amount ):
+        values = self.hashes.setdefault( name, {} )
+        values[ key ] = float( values.get( key, 0 ) ) + amount
+
+    hincrbyfloat = hincrby
+
+    def hset( self, name, key, value ):
+        self.hashes.setdefault( name, {} )[ key ] = value
+
+    def hgetall( self, name ):
+        return dict( self.hashes.get( name, {} ) )
+
+    def xadd( self, name, fields, maxlen = None, approximate = True ):
+        self.streams = getattr( self, 'streams', {} )
+        self.streams.setdefault( name, [] ).append( fields )
+
+    def getdel( self, key ):
+        value = self.get( key )
+        self.values.pop( key, None )
+        self.expires.pop( key, None )
+        return value
+
+    def publish( self, channel, message ):
+        self.published = getattr( self, 'published', [] )
+        self.published.append( ( channel, message ) )
+
+class FakePubSub():
+    """
+        In-memory double of the asyncio Redis pub/sub connection used by the push channel ( "bank_controller/push.py" )
+    """
+
+    def __init__( self ):
+        self.channels = set()
+        self.messages = asyncio.Queue()
+
+    async def subscribe( self, *channels ):
+        self.channels.update( channels )
+
+    async def unsubscribe( self, *channels ):
+        self.channels.difference_update( channels )
+
+    def publish( self, channel, data ):
+        if channel in self.channels:
+            self.messages.put_nowait( { 'type' : 'message', 'channel' : channel.encode(), 'data' : data } )
+
+    async def reset( self ):
+        self.channels.clear()
+
+    def disconnect( self ):
+        self.messages.put_nowait( None )
+
+    async def listen( self ):
+        while True:
+            message = await self.messages.get()
+
+            if message is None:
+                raise redis.ConnectionError( 'Connection closed by server.' )
+
+            yield message
+
+class FakeAsyncStream():
+    """
+        In-memory double of the asyncio Redis stream commands used by the long polling of the feed ( "bank_controller/feed.py" ),
+        "xadd" is called by the relay ( "publish_events" )
+    """
+
+    def __init__( self ):
+        self.entries = []
+
+    def xadd( self, name, fields, maxlen = None, approximate = True ):
+        self.entries.append( ( f'{len( self.entries ) + 1}-0'.encode(), fields ) )
+
+    async def xrevrange( self, name, count = None ):
+        return self.entries[ ::-1 ][ :count ]
+
+    async def xread( self, streams, count = None, block = None ):
+        last = int( next( iter( streams.values() ) ).split( b'-' )[0] )
+        deadline = time.monotonic() + block / 1000
+
+        while time.monotonic() < deadline:
+            if len( self.entries ) > last:
+                return [ [ next( iter( streams ) ).encode(), self.entries[ last: ][ :count ] ] ]
+
+            await asyncio.sleep( 0.01 )
+
+        return []
+
 # View tests
 
 class CustomAPITestCase( APITestCase ):
@@ -123,6 +348,152 @@ class TestCashAccountAPIViews( CustomAPITestCase ):
         # Checking the code status for an unauthorized user
         self.assertEqual( response.status_code, status.HTTP_401_UNAUTHORIZED )
 
+    def test_retrieve_snapshot( self ):
+        # The fast read path gives the same bytes as the serializers ( see "cash_account_representation" )
+
+        cash_account = self.user_first.cash_account
+        self.authenticate_user( self.user_first )
+
+        for merchant, amount in ( ( 'Shop', 100 ), ( 'Cafe', 10 ) ):
+            Purchase.objects.create( merchant = merchant, amount = amount, cash_account = cash_account )
+        Transfer.objects.create( sender = cash_account, reciever = self.user_second.cash_account, amount = 200 )
+        Transfer.objects.create( sender = self.user_second.cash_account, reciever = cash_account, amount = 300 )
+        Transfer.objects.create( sender = cash_account, reciever = None, amount = 50 )
+        send_message( cash_account, 'Hello' )
+        Credit.objects.create( cash_account = cash_account, amount = 3000, loan_duration = 3, amount_returned = 1001, is_increased_percentage = True )
+
+        for filters, params in ( ( {}, {} ), ( { 'merchant' : 'Sh' }, { 'merchant' : 'Sh' } ), ( { 'amount_min' : 100 }, { 'amount_min' : 100 } ) ):
+            serializer = RetrieveCashAccountSerializer( instance = CashAccount.objects.get( pk = cash_account.pk ), context = { 'history_filters' : filters } )
+
+            self.assertEqual( JSONRenderer().render( serializer.data ), self.client.get( reverse('retrieve-cash_account'), params ).content )
+            self.assertEqual(
+                JSONRenderer().render( serialize_history( cash_account, filters ) ),
+                self.client.get( reverse('retrieve-history'), params ).content,
+            )
+
+        # An account without a credit and messages
+        self.authenticate_user( self.user_second )
+        serializer = RetrieveCashAccountSerializer( instance = self.user_second.cash_account )
+
+        self.assertEqual( JSONRenderer().render( serializer.data ), self.client.get( reverse('retrieve-cash_account') ).content )
+
+    def test_conditional_get( self ):
+        url = reverse('retrieve-cash_account')
+        cash_account = self.user_first.cash_account
+        self.authenticate_user( self.user_first )
+        self.set_amount_to_cash_account( cash_account, 5000 )
+
+        etag = self.client.get( url )['ETag']
+
+        # A not modified response costs the token lookup and the cash account lookup
+        with self.assertNumQueries( 2 ):
+            response = self.client.get( url, HTTP_IF_NONE_MATCH = etag )
+
+        self.assertEqual( response.status_code, status.HTTP_304_NOT_MODIFIED )
+        self.assertEqual( b'', response.content )
+        self.assertEqual( etag, response['ETag'] )
+
+        # Every change of the account gives a new ETag
+        changes = (
+            lambda: self.client.post( reverse('create-purchase'), { 'pin' : cash_account.pin, 'merchant' : 'Shop', 'amount' : 100 }, format='json' ),
+            lambda: self.client.put( reverse('update-purchase-is_ignore'), {}, format='json' ),
+            lambda: self.client.put( reverse('update-cash_account-pin'), { 'old_pin' : cash_account.pin, 'new_pin' : 1000 }, format='json' ),
+            lambda: send_message( cash_account, 'Hello' ),
+            lambda: set_hot_account_slots( cash_account, 2 ) or cash_replenishment( 100, cash_account ),
+            lambda: User.objects.filter( pk = self.user_first.pk ).get().save(),
+        )
+
+        for change in changes:
+            change()
+            cash_account.refresh_from_db()
+
+            response = self.client.get( url, HTTP_IF_NONE_MATCH = etag )
+
+            self.assertEqual( response.status_code, status.HTTP_200_OK )
+            self.assertNotEqual( etag, response['ETag'] )
+            etag = response['ETag']
+
+        # The login time is not a part of the resources
+        self.user_first.save( update_fields = ( 'last_login', ) )
+        self.assertEqual( status.HTTP_304_NOT_MODIFIED, self.client.get( url, HTTP_IF_NONE_MATCH = etag ).status_code )
+
+        # The user resource has the version of the cash account, every format of a resource has its own ETag
+        self.assertEqual( status.HTTP_304_NOT_MODIFIED, self.client.get( reverse('retrieve-user'), HTTP_IF_NONE_MATCH = etag ).status_code )
+        self.assertEqual( status.HTTP_200_OK, self.client.get( url, HTTP_IF_NONE_MATCH = etag, HTTP_ACCEPT = 'application/msgpack' ).status_code )
+
+    def test_sparse_fieldsets( self ):
+        url = reverse('retrieve-cash_account')
+        cash_account = self.user_first.cash_account
+        self.set_amount_to_cash_account( cash_account, 5000 )
+
+        Purchase.objects.create( merchant = 'Shop', amount = 100, cash_account = cash_account )
+        send_message( cash_account, 'Hello' )
+        Credit.objects.create( cash_account = cash_account, amount = 3000, loan_duration = 3 )
+
+        # Without the token lookup, a balance-only request reads the cash account only
+        self.client.force_authenticate( User.objects.get( pk = self.user_first.pk ) )
+
+        with self.assertNumQueries( 1 ):
+            response = self.client.get( url, { 'fields' : 'amount' } )
+
+        self.assertEqual( { 'amount' : get_balance( cash_account ) }, response.data )
+
+        self.client.force_authenticate( None )
+        self.authenticate_user( self.user_first )
+        full = self.client.get( url ).data
+
+        response = self.client.get( url, { 'fields' : 'id,credit' } )
+        self.assertEqual( { 'id' : full['id'], 'credit' : full['credit'] }, response.data )
+
+        # The expanded resources
+        response = self.client.get( url, { 'fields' : 'amount,user.email', 'expand' : 'user' } )
+        self.assertEqual( { 'amount' : full['amount'], 'user' : { 'email' : self.user_first.email } }, response.data )
+
+        response = self.client.get( url, { 'expand' : 'user' } )
+        self.assertEqual( dict( full, user = self.client.get( reverse('retrieve-user') ).data ), response.data )
+
+        response = self.client.get( reverse('retrieve-user'), { 'fields' : 'email,cash_account.amount,cash_account.messages', 'expand' : 'cash_account' } )
+        self.assertEqual( { 'email' : self.user_first.email, 'cash_account' : { 'amount' : full['amount'], 'messages' : full['messages'] } }, response.data )
+
+        response = self.client.get( reverse('retrieve-user'), { 'fields' : 'full_name' } )
+        self.assertEqual( { 'full_name' : self.user_first.full_name }, response.data )
+
+        # Unknown fields and resources
+        for path, params in (
+            ( url, { 'fields' : 'secret' } ),
+            ( url, { 'expand' : 'history' } ),
+            ( url, { 'fields' : 'user.email' } ),
+            ( reverse('retrieve-user'), { 'fields' : 'cash_account.pin,email' } ),
+        ):
+            self.assertEqual( status.HTTP_400_BAD_REQUEST, self.client.get( path, params ).status_code )
+
+    def test_retrieve_renderers( self ):
+        url = reverse('retrieve-cash_account')
+
+        self.authenticate_user( self.user_first )
+        Purchase.objects.create( merchant = 'Shop', cash_account = self.user_first.cash_account, amount = 100 )
+        Transfer.objects.create( sender = self.user_first.cash_account, reciever = self.user_second.cash_account, amount = 100 )
+        Message.objects.create( cash_account = self.user_first.cash_account, content = 'Line\u2028separator\u2029Привіт' )
+
+        response = self.client.get( url )
+
+        # JSON by default, the same bytes as the stock renderer of REST framework ( the line separators escaped )
+        self.assertEqual( 'application/json', response['Content-Type'] )
+        self.assertIn( b'Line\\u2028separator\\u2029', response.content )
+        self.assertEqual( JSONRenderer().render( response.data ), response.content )
+
+        # The indented JSON of the stock renderer
+        response = self.client.get( url, HTTP_ACCEPT = 'application/json; indent=4' )
+
+        self.assertEqual( JSONRenderer().render( response.data, 'application/json; indent=4' ), response.content )
+        self.assertIn( b'\n    ', response.content )
+
+        response = self.client.get( url, HTTP_ACCEPT = 'application/msgpack' )
+
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertEqual( 'application/msgpack', response['Content-Type'] )
+        self.assertEqual( json.loads( JSONRenderer().render( response.data ) ), msgpack.unpackb( response.content ) )
+
 
     def test_update_pin( self ):
         url = reverse('update-cash_account-pin')
@@ -150,6 +521,54 @@ class TestCashAccountAPIViews( CustomAPITestCase ):
         # Checking the code status for an unauthorized user
         self.assertEqual( response.status_code, status.HTTP_401_UNAUTHORIZED )
 
+class TestHistoryAPIViews( CustomAPITestCase ):
+
+    def test_search( self ):
+        url = reverse('retrieve-history')
+        self.authenticate_user( self.user_first )
+
+        cash_account = self.user_first.cash_account
+        for merchant, amount in ( ( 'Shop', 100 ), ( 'Shopping mall', 500 ), ( 'Cafe', 10 ) ):
+            Purchase.objects.create( merchant = merchant, amount = amount, cash_account = cash_account )
+        Transfer.objects.create( sender = cash_account, reciever = self.user_second.cash_account, amount = 200 )
+        Transfer.objects.create( sender = self.user_second.cash_account, reciever = cash_account, amount = 300 )
+
+        def search( **params ):
+            response = self.client.get( url, params )
+            self.assertEqual( response.status_code, status.HTTP_200_OK )
+
+            return (
+                sorted( purchase['amount'] for purchase in response.data['purchases'] ),
+                sorted( transfer['amount'] for transfer in response.data['transfers']['sent'] ),
+                sorted( transfer['amount'] for transfer in response.data['transfers']['recieved'] ),
+            )
+
+        today = timezone.localdate()
+
+        # Checking every search parameter
+        self.assertEqual( ( [ 10, 100, 500 ], [ 200 ], [ 300 ] ), search() )
+        self.assertEqual( ( [ 100, 500 ], [], [] ), search( merchant = 'Shop' ) )
+        self.assertEqual( ( [ 100 ], [ 200 ], [] ), search( amount_min = 100, amount_max = 200 ) )
+        self.assertEqual( ( [], [ 200 ], [] ), search( direction = 'sent' ) )
+        self.assertEqual( ( [ 10, 100, 500 ], [ 200 ], [ 300 ] ), search( date_from = today, date_to = today ) )
+        self.assertEqual( ( [], [], [] ), search( date_from = today + datetime.timedelta( days = 1 ) ) )
+
+        # The same parameters are accepted by the cash account view
+        response = self.client.get( reverse('retrieve-cash_account'), { 'merchant' : 'Ca' } )
+        self.assertEqual( [ 10 ], [ purchase['amount'] for purchase in response.data['history']['purchases'] ] )
+
+        # Checking the validation of the parameters
+        response = self.client.get( url, { 'amount_min' : 10, 'amount_max' : 1 } )
+        self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+        response = self.client.get( url, { 'direction' : 'up' } )
+        self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+
+        self.unauthenticated()
+        response = self.client.get( url )
+
+        # Checking the code status for an unauthorized user
+        self.assertEqual( response.status_code, status.HTTP_401_UNAUTHORIZED )
+
 class TestPurchaseAPIViews( CustomAPITestCase ):
 
     def test_create( self ):
@@ -239,6 +658,555 @@ class TestTransferAPIViews( CustomAPITestCase ):
         # Checking the code status for an unauthorized user
         self.assertEqual( response.status_code, status.HTTP_401_UNAUTHORIZED )
 
+class TestAnalyticsAPIViews( CustomAPITestCase ):
+
+    def test_spending_report( self ):
+        url = reverse('retrieve-spending_report')
+        self.authenticate_user( self.user_first )
+        self.set_amount_to_cash_account( self.user_first.cash_account, amount = 1000 )
+
+        for merchant, amount in ( ( 'Shop', 100 ), ( 'Shop', 50 ), ( 'Cafe', 10 ) ):
+            data = { 'pin' : self.user_first.cash_account.pin, 'merchant' : merchant, 'amount' : amount }
+            self.client.post( reverse('create-purchase'), data, format='json' )
+
+        data = { 'pin' : self.user_first.cash_account.pin, 'reciever' : self.user_second.cash_account.pk, 'amount' : 200 }
+        self.client.post( reverse('create-transfer'), data, format='json' )
+
+        response = self.client.get( url, { 'period' : 'month' } )
+        today = timezone.localdate()
+
+        # Checking code status
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        # Checking that the operations were grouped by category and merchant
+        self.assertEqual( [
+            { 'period' : str( today.replace( day = 1 ) ), 'category' : 'purchase', 'merchant' : 'Cafe', 'total' : 10, 'count' : 1 },
+            { 'period' : str( today.replace( day = 1 ) ), 'category' : 'purchase', 'merchant' : 'Shop', 'total' : 150, 'count' : 2 },
+            { 'period' : str( today.replace( day = 1 ) ), 'category' : 'transfer_sent', 'merchant' : '', 'total' : 200, 'count' : 1 },
+        ], response.data )
+
+        # Checking the validation of the report window
+        response = self.client.get( url, { 'date_from' : '2022-10-02', 'date_to' : '2022-10-01' } )
+        self.assertEqual( response.status_code, status.HTTP_400_BAD_REQUEST )
+
+        self.unauthenticated()
+        response = self.client.get( url )
+
+        # Checking the code status for an unauthorized user
+        self.assertEqual( response.status_code, status.HTTP_401_UNAUTHORIZED )
+
+@override_settings( DATABASE_REPLICAS = [ 'replica' ] )
+class TestReplicaReadAPIViews( CustomAPITestCase ):
+    databases = { 'default', 'replica' }
+
+    def setUp( self ) -> None:
+        super().setUp()
+        cache.clear()
+
+        # The replica lags behind: it has the user, but not the last balance change
+        self.user_first.save( using = 'replica', force_insert = True )
+        self.user_first.cash_account.save( using = 'replica', force_insert = True )
+        self.set_amount_to_cash_account( self.user_first.cash_account, amount = 1000 )
+
+    def test_read_your_writes( self ):
+        url = reverse('retrieve-cash_account')
+        self.authenticate_user( self.user_first )
+
+        # Checking that read-only views read from the replica
+        response = self.client.get( url )
+        self.assertEqual( response.status_code, status.HTTP_200_OK )
+        self.assertEqual( response.data['amount'], 0 )
+
+        data = { 'pin' : self.user_first.cash_account.pin, 'merchant' : 'Shop', 'amount' : 100 }
+        response = self.client.post( reverse('create-purchase'), data, format='json' )
+        self.assertEqual( response.status_code, status.HTTP_201_CREATED )
+
+        # Checking that after a write the user reads from the primary
+        response = self.client.get( url )
+        self.assertEqual( response.data['amount'], 900 )
+        self.assertEqual( len( response.data['history']['purchases'] ), 1 )
+
+        # Checking that once the pin expires, the reads go back to the replica
+        cache.clear()
+        response = self.client.get( url )
+        self.assertEqual( response.data['amount'], 0 )
+
+    def test_routing_is_reset( self ):
+        self.authenticate_user( self.user_first )
+        self.client.get( reverse('retrieve-user') )
+
+        # Checking that the replica routing does not leak out of the request
+        self.assertIsNone( get_read_database() )
+
+        self.user_first.cash_account.amount = 1
+        self.user_first.cash_account.save()
+        self.assertEqual( CashAccount.objects.get( pk = self.user_first.cash_account.pk ).amount, 1 )
+
+
+@override_settings( ACCOUNT_SHARDS = [ 'shard_0', 'shard_1' ] )
+class TestAccountShardingAPIViews( CustomAPITestCase ):
+    databases = { 'default', 'shard_0', 'shard_1' }
+
+    def setUp( self ) -> None:
+        super().setUp()
+
+        # Creates users until there are two accounts on different shards
+        users = { get_account_database( self.user_first.cash_account_uuid ) : self.user_first }
+        number = 0
+
+        while len( users ) < 2:
+            user = User.objects.create_user( f'user{number}@gmail.com', '123456', first_name = 'User', last_name = str( number ) )
+            users.setdefault( get_account_database( user.cash_account_uuid ), user )
+            number += 1
+
+        self.sender, self.reciever = users['shard_0'], users['shard_1']
+        self.set_amount_to_cash_account( self.sender.cash_account, amount = 1000 )
+
+    def test_accounts_are_sharded( self ):
+        for user, shard in ( ( self.sender, 'shard_0' ), ( self.reciever, 'shard_1' ) ):
+            # Checking that the account lives only on its shard, and is found from the user and by the primary key
+            self.assertEqual( User.objects.get( pk = user.pk ).cash_account._state.db, shard )
+            self.assertEqual( CashAccount.objects.get( pk = user.cash_account_uuid )._state.db, shard )
+            self.assertEqual( [ db for db in get_account_databases() if CashAccount.objects.using( db ).filter( user = user ).exists() ], [ shard ] )
+            self.assertFalse( CashAccount.objects.using( 'default' ).filter( user = user ).exists() )
+
+    def test_purchase( self ):
+        self.authenticate_user( self.sender )
+
+        data = { 'pin' : self.sender.cash_account.pin, 'merchant' : 'Shop', 'amount' : 100 }
+        response = self.client.post( reverse('create-purchase'), data, format='json' )
+        self.assertEqual( response.status_code, status.HTTP_201_CREATED )
+
+        # Checking that the purchase and its merchant are stored on the shard of the account
+        self.assertEqual( Purchase.objects.using( 'shard_0' ).get().merchant, 'Shop' )
+        self.assertFalse( Purchase.objects.using( 'shard_1' ).exists() )
+
+        response = self.client.get( reverse('retrieve-cash_account') )
+        self.assertEqual( response.data['amount'], 900 )
+        self.assertEqual( len( response.data['history']['purchases'] ), 1 )
+
+    def test_cross_shard_transfer( self ):
+        self.authenticate_user( self.sender )
+
+        data = { 'pin' : self.sender.cash_account.pin, 'reciever' : self.reciever.cash_account.pk, 'amount' : 200 }
+        response = self.client.post( reverse('create-transfer'), data, format='json' )
+        self.assertEqual( response.status_code, status.HTTP_201_CREATED )
+
+        # Checking that the money is withdrawn at once and credited only by the relay
+        self.assertEqual( CashAccount.objects.get( pk = self.sender.cash_account_uuid ).amount, 800 )
+        self.assertEqual( CashAccount.objects.get( pk = self.reciever.cash_account_uuid ).amount, 0 )
+
+        outbox = TransferOutbox.objects.using( 'shard_0' ).get()
+        self.assertEqual( deliver_pending_transfers( 'shard_0' ), 1 )
+        self.assertEqual( CashAccount.objects.get( pk = self.reciever.cash_account_uuid ).amount, 200 )
+
+        # Checking that a repeated delivery ( a relay that failed before marking the entry ) does not credit the money twice
+        deliver_transfer( outbox )
+        self.assertEqual( deliver_pending_transfers( 'shard_0' ), 0 )
+        self.assertEqual( CashAccount.objects.get( pk = self.reciever.cash_account_uuid ).amount, 200 )
+
+        # Checking that both accounts see the transfer in their history
+        response = self.client.get( reverse('retrieve-history') )
+        self.assertEqual( response.data['transfers']['sent'][0]['amount'], 200 )
+
+        self.authenticate_user( self.reciever )
+        response = self.client.get( reverse('retrieve-history') )
+        self.assertEqual( response.data['transfers']['recieved'][0]['amount'], 200 )
+
+    def test_cross_shard_transfer_without_broker( self ):
+        self.authenticate_user( self.sender )
+        data = { 'pin' : self.sender.cash_account.pin, 'reciever' : self.reciever.cash_account.pk, 'amount' : 200 }
+
+        # Checking that a committed transfer succeeds when the relay cannot be queued, the periodic relay delivers it
+        with mock.patch.object( relay_transfer_outbox, 'apply_async', side_effect = kombu.exceptions.OperationalError ) as apply_async, \
+             mock.patch.object( relay_account_events, 'apply_async' ):
+            with self.assertLogs( 'bank_controller.services.general_service', 'WARNING' ), self.captureOnCommitCallbacks( using = 'shard_0', execute = True ):
+                response = self.client.post( reverse('create-transfer'), data, format='json' )
+
+        self.assertEqual( response.status_code, status.HTTP_201_CREATED )
+        apply_async.assert_called_once_with( ( 'shard_0', ) )
+        self.assertEqual( deliver_pending_transfers( 'shard_0' ), 1 )
+
+
+class TestAccountEventFeedAPIViews( CustomAPITestCase ):
+
+    def setUp( self ):
+        super().setUp()
+        self.admin = User.objects.create_superuser( 'admin@gmail.com', '123456', first_name = 'Ad', last_name = 'Min' )
+
+    def read_feed( self, **params ):
+        response = self.client.get( reverse( 'retrieve-account_event_feed' ), params )
+        return response, [ json.loads( line ) for line in response.content.decode().splitlines() ]
+
+    def test_feed( self ):
+        self.set_amount_to_cash_account( self.user_first.cash_account, amount = 1000 )
+        self.authenticate_user( self.user_first )
+
+        self.client.post( reverse( 'create-purchase' ), { 'pin' : self.user_first.cash_account.pin, 'merchant' : 'Shop', 'amount' : 100 }, format = 'json' )
+        self.client.post( reverse( 'create-transfer' ), { 'pin' : self.user_first.cash_account.pin, 'reciever' : self.user_second.cash_account.pk, 'amount' : 200 }, format = 'json' )
+
+        # Only admins read the feed
+        response, _ = self.read_feed()
+        self.assertEqual( status.HTTP_403_FORBIDDEN, response.status_code )
+
+        self.authenticate_user( self.admin )
+
+        # The events are in the feed once the relay numbered them
+        response, events = self.read_feed()
+        self.assertEqual( [], events )
+
+        self.assertEqual( 3, sequence_events( 'default' ) )
+
+        response, events = self.read_feed()
+        self.assertEqual( status.HTTP_200_OK, response.status_code )
+        self.assertEqual( 'application/x-ndjson', response['Content-Type'] )
+        self.assertEqual( [ 'purchase', 'transfer_sent', 'transfer_recieved' ], [ event['kind'] for event in events ] )
+        self.assertEqual( [ str( self.user_first.cash_account.pk ), str( self.user_first.cash_account.pk ), str( self.user_second.cash_account.pk ) ], [ event['cash_account'] for event in events ] )
+        self.assertEqual( 'default:3', response['X-Next-Cursor'] )
+
+        # Resuming from a cursor
+        response, events = self.read_feed( since = 'default:1', limit = 1 )
+        self.assertEqual( [ 'transfer_sent' ], [ event['kind'] for event in events ] )
+        self.assertEqual( 'default:2', response['X-Next-Cursor'] )
+
+        # Without new events the feed returns at once with the same cursor
+        response, events = self.read_feed( since = 'default:3' )
+        self.assertEqual( [], events )
+        self.assertEqual( 'default:3', response['X-Next-Cursor'] )
+
+        response, _ = self.read_feed( since = 'unknown:1' )
+        self.assertEqual( status.HTTP_400_BAD_REQUEST, response.status_code )
+
+    def test_one_relay_per_transaction( self ):
+        # The events of one transaction schedule one relay, a failure of the broker does not fail the committed change
+        with mock.patch( 'bank_controller.services.event_service.get_redis', return_value = FakeRedis() ), \
+             mock.patch.object( relay_account_events, 'apply_async', side_effect = kombu.exceptions.OperationalError ) as apply_async:
+            with self.assertLogs( 'bank_controller.services.general_service', 'WARNING' ), self.captureOnCommitCallbacks( execute = True ):
+                for content in ( 'First', 'Second', 'Third' ):
+                    send_message( self.user_first.cash_account, content )
+
+        apply_async.assert_called_once_with( ( 'default', ) )
+
+    def test_relay_publishes_events_once( self ):
+        record_event( 'message', self.user_first.cash_account, content = 'First' )
+        sequence_events( 'default' )
+        record_event( 'message', self.user_first.cash_account, content = 'Second' )
+        sequence_events( 'default' )
+
+        client = FakeRedis()
+        self.assertEqual( 2, publish_events( 'default', client ) )
+        self.assertEqual( 0, publish_events( 'default', client ) )
+
+        stream = [ json.loads( entry['event'] ) for entry in client.streams[ settings.ACCOUNT_EVENT_STREAM ] ]
+        self.assertEqual( [ ( 1, 'First' ), ( 2, 'Second' ) ], [ ( event['sequence'], event['payload']['content'] ) for event in stream ] )
+
+
+class TestAccountEventFeedLongPolling( TestCase ):
+
+    def setUp( self ):
+        self.user = User.objects.create_user( 'mrloking11@gmail.com', '123456', first_name = 'Oleg', last_name = 'Zdorov' )
+        self.admin = User.objects.create_superuser( 'admin@gmail.com', '123456', first_name = 'Ad', last_name = 'Min' )
+        self.stream = FakeAsyncStream()
+        self.disconnected = asyncio.Event()
+
+    async def receive( self ):
+        await self.disconnected.wait()
+        return { 'type' : 'http.disconnect' }
+
+    async def request( self, user, query : str, messages : list ):
+        token, _ = await sync_to_async( Token.objects.get_or_create )( user = user )
+        scope = {
+            'type' : 'http',
+            'path' : settings.ACCOUNT_EVENT_FEED_PATH,
+            'headers' : [ ( b'authorization', f'Token {token.key}'.encode() ) ],
+            'query_string' : query.encode(),
+        }
+
+        async def send( message ):
+            messages.append( message )
+
+        return asyncio.ensure_future( feed_application( scope, self.receive, send ) )
+
+    def relay( self, content : str ) -> None:
+        record_event( 'message', self.user.cash_account, content = content )
+        sequence_events( 'default' )
+        publish_events( 'default', self.stream )
+
+    async def test_long_polling( self ):
+        with mock.patch( 'bank_controller.feed.get_async_redis', return_value = self.stream ):
+            await sync_to_async( self.relay )( 'First' )
+
+            # The events after the cursor are returned at once
+            messages = []
+            await ( await self.request( self.admin, 'since=default:0&wait=5', messages ) )
+            self.assertEqual( 200, messages[0]['status'] )
+            self.assertIn( ( b'x-next-cursor', b'default:1' ), messages[0]['headers'] )
+            self.assertEqual( [ 'First' ], [ json.loads( line )['payload']['content'] for line in messages[1]['body'].decode().splitlines() ] )
+
+            # Without new events the request waits for the relay
+            messages = []
+            request = await self.request( self.admin, 'since=default:1&wait=5', messages )
+            await asyncio.sleep( 0.1 )
+            self.assertEqual( [], messages )
+
+            await sync_to_async( self.relay )( 'Second' )
+            await asyncio.wait_for( request, 1 )
+            self.assertIn( ( b'x-next-cursor', b'default:2' ), messages[0]['headers'] )
+            self.assertEqual( [ 'Second' ], [ json.loads( line )['payload']['content'] for line in messages[1]['body'].decode().splitlines() ] )
+
+            # Up to "wait" seconds
+            messages = []
+            start = time.monotonic()
+            await ( await self.request( self.admin, 'since=default:2&wait=0.2', messages ) )
+            self.assertGreaterEqual( time.monotonic() - start, 0.2 )
+            self.assertEqual( ( b'', [ ( b'content-type', b'application/x-ndjson' ), ( b'x-next-cursor', b'default:2' ) ] ), ( messages[1]['body'], messages[0]['headers'] ) )
+
+            # A client that disconnects stops waiting
+            messages = []
+            request = await self.request( self.admin, 'since=default:2&wait=5', messages )
+            await asyncio.sleep( 0.1 )
+            self.disconnected.set()
+            await asyncio.wait_for( request, 1 )
+            self.assertEqual( [], messages )
+
+    async def test_errors( self ):
+        async def status_of( user, query ):
+            messages = []
+            await ( await self.request( user, query, messages ) )
+            return messages[0]['status']
+
+        with mock.patch( 'bank_controller.feed.get_async_redis', return_value = self.stream ):
+            self.assertEqual( 403, await status_of( self.user, '' ) )
+            self.assertEqual( 400, await status_of( self.admin, 'since=unknown:1' ) )
+            self.assertEqual( 400, await status_of( self.admin, f'wait={settings.ACCOUNT_EVENT_FEED_MAX_WAIT_SECONDS + 1}' ) )
+
+        # Without Redis the request returns at once
+        client = mock.Mock( xrevrange = mock.AsyncMock( side_effect = redis.ConnectionError ) )
+
+        with mock.patch( 'bank_controller.feed.get_async_redis', return_value = client ), self.assertLogs( 'bank_controller.feed', 'WARNING' ):
+            self.assertEqual( 200, await asyncio.wait_for( status_of( self.admin, 'since=default:0&wait=5' ), 1 ) )
+
+
+class TestPushTicketAPIViews( CustomAPITestCase ):
+
+    def test_create_push_ticket( self ):
+        url = reverse( 'create-push_ticket' )
+        client = FakeRedis()
+        self.authenticate_user( self.user_first )
+
+        with mock.patch( 'bank_controller.push.get_redis', return_value = client ):
+            response = self.client.post( url )
+
+            # Checking that the ticket belongs to the user and is redeemed once
+            self.assertEqual( status.HTTP_201_CREATED, response.status_code )
+            self.assertEqual( settings.PUSH_TICKET_SECONDS, response.data['expires_in'] )
+            self.assertEqual( str( self.user_first.pk ), redeem_ticket( response.data['ticket'] ) )
+            self.assertEqual( None, redeem_ticket( response.data['ticket'] ) )
+
+        with mock.patch( 'bank_controller.push.get_redis', return_value = mock.Mock( set = mock.Mock( side_effect = redis.RedisError ) ) ):
+            self.assertEqual( status.HTTP_503_SERVICE_UNAVAILABLE, self.client.post( url ).status_code )
+
+        self.unauthenticated()
+        self.assertEqual( status.HTTP_401_UNAUTHORIZED, self.client.post( url ).status_code )
+
+
+class TestPushChannel( TestCase ):
+
+    def setUp( self ):
+        self.pubsub = FakePubSub()
+        self.broadcaster = RedisBroadcaster( lambda: self.pubsub )
+        self.disconnected = asyncio.Event()
+
+    async def receive( self ):
+        await self.disconnected.wait()
+        return { 'type' : 'http.disconnect' }
+
+    def sender( self, messages ):
+        async def send( message ):
+            messages.append( message )
+
+        return send
+
+    async def test_idle_subscribers( self ):
+        messages = [ [] for _ in range( 2000 ) ]
+        subscribers = [
+            asyncio.ensure_future( stream( f'account-updates:{index}', self.receive, self.sender( messages[ index ] ), self.broadcaster ) )
+            for index in range( len( messages ) )
+        ]
+        await asyncio.sleep( 0.2 )
+        self.assertEqual( 2000, len( self.pubsub.channels ) )
+
+        # Waiting subscribers cost no CPU
+        start = time.process_time()
+        await asyncio.sleep( 1 )
+        self.assertLess( time.process_time() - start, 0.1 )
+
+        # An update reaches the subscribers of its channel only
+        self.pubsub.publish( 'account-updates:7', json.dumps( { 'kind' : 'message', 'payload' : { 'content' : 'Hi' } } ).encode() )
+        await asyncio.sleep( 0.05 )
+
+        self.assertEqual( b'event: message\ndata: {"content": "Hi"}\n\n', messages[7][-1]['body'] )
+        self.assertEqual( 2, len( messages[8] ) )
+
+        self.disconnected.set()
+        await asyncio.gather( *subscribers )
+
+        self.assertEqual( set(), self.pubsub.channels )
+        self.assertEqual( {}, self.broadcaster.subscribers )
+
+    @override_settings( PUSH_RECONNECT_SECONDS = 0.01 )
+    async def test_reconnect( self ):
+        pubsubs = [ self.pubsub, FakePubSub() ]
+        self.broadcaster.pubsub_factory = lambda: pubsubs.pop( 0 )
+
+        messages = [ [], [] ]
+        subscribers = [
+            asyncio.ensure_future( stream( f'account-updates:{index}', self.receive, self.sender( messages[ index ] ), self.broadcaster ) )
+            for index in range( len( messages ) )
+        ]
+        await asyncio.sleep( 0.05 )
+
+        # The reader survives a lost connection and subscribes to the channels again
+        with self.assertLogs( 'bank_controller.push', 'WARNING' ):
+            self.pubsub.disconnect()
+            await asyncio.sleep( 0.1 )
+
+        pubsub = self.broadcaster.pubsub
+        self.assertIsNot( self.pubsub, pubsub )
+        self.assertEqual( { 'account-updates:0', 'account-updates:1' }, pubsub.channels )
+        self.assertFalse( self.broadcaster.reader.done() )
+
+        pubsub.publish( 'account-updates:1', json.dumps( { 'kind' : 'message', 'payload' : { 'content' : 'Hi' } } ).encode() )
+        await asyncio.sleep( 0.05 )
+
+        self.assertEqual( b'event: message\ndata: {"content": "Hi"}\n\n', messages[1][-1]['body'] )
+
+        self.disconnected.set()
+        await asyncio.gather( *subscribers )
+
+        self.assertEqual( set(), pubsub.channels )
+
+    async def test_push_application_authentication( self ):
+        user = await sync_to_async( User.objects.create_user )( 'mrloking11@gmail.com', '123456', first_name = 'Oleg', last_name = 'Zdorov' )
+        token = await sync_to_async( Token.objects.create )( user = user )
+        scope = { 'type' : 'http', 'path' : settings.PUSH_PATH, 'headers' : [], 'query_string' : b'' }
+
+        async def status_of( scope ):
+            messages = []
+            await push_application( scope, self.receive, self.sender( messages ) )
+            return messages[0]['status']
+
+        with mock.patch( 'bank_controller.push.get_broadcaster', return_value = self.broadcaster ), mock.patch( 'bank_controller.push.get_redis', return_value = FakeRedis() ):
+            self.assertEqual( 401, await status_of( scope ) )
+
+            # The token is not accepted in the query string, it would get into the access logs
+            self.assertEqual( 401, await status_of( dict( scope, query_string = f'token={token.key}'.encode() ) ) )
+
+            ticket = await sync_to_async( create_ticket )( user )
+            ticket_scope = dict( scope, query_string = f'ticket={ticket}'.encode() )
+
+            messages = []
+            subscriber = asyncio.ensure_future( push_application( ticket_scope, self.receive, self.sender( messages ) ) )
+            await asyncio.sleep( 0.1 )
+
+            self.assertEqual( 200, messages[0]['status'] )
+            self.assertEqual( { f'{settings.PUSH_CHANNEL_PREFIX}{user.cash_account_uuid}' }, self.pubsub.channels )
+
+            # A ticket opens one connection
+            self.assertEqual( 401, await status_of( ticket_scope ) )
+
+            self.disconnected.set()
+            await subscriber
+
+            # The header works without a ticket
+            self.assertEqual( 200, await status_of( dict( scope, headers = [ ( b'authorization', f'Token {token.key}'.encode() ) ] ) ) )
+
+    def test_committed_events_are_published( self ):
+        user = User.objects.create_user( 'mrloking11@gmail.com', '123456', first_name = 'Oleg', last_name = 'Zdorov' )
+        client = FakeRedis()
+
+        with mock.patch( 'bank_controller.services.event_service.get_redis', return_value = client ), mock.patch.object( relay_account_events, 'apply_async' ):
+            with self.captureOnCommitCallbacks( execute = True ):
+                cash_replenishment( 300, user.cash_account )
+                record_event( 'transfer_recieved', user.cash_account, amount = 300 )
+
+                self.assertEqual( [], getattr( client, 'published', [] ) )
+
+        channel, message = client.published[0]
+        self.assertEqual( f'{settings.PUSH_CHANNEL_PREFIX}{user.cash_account.pk}', channel )
+        self.assertEqual( { 'kind' : 'transfer_recieved', 'payload' : { 'amount' : 300, 'balance' : 300 } }, json.loads( message ) )
+
+
+# Command tests
+
+@override_settings( PASSWORD_HASHERS = [ 'django.contrib.auth.hashers.MD5PasswordHasher' ] )
+class TestOnboardUsersCommand( TestCase ):
+
+    def run_command( self, content : str, suffix : str, *args ) -> str:
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join( directory, f'users{suffix}' )
+            errors_path = os.path.join( directory, 'errors.ndjson' )
+
+            with open( path, 'w', encoding = 'utf-8' ) as file:
+                file.write( content )
+
+            call_command( 'onboard_users', path, '--errors-file', errors_path, '--chunk-size', '2', *args, stdout = StringIO() )
+
+            with open( errors_path, encoding = 'utf-8' ) as file:
+                return [ json.loads( line ) for line in file ]
+
+    def test_csv( self ):
+        errors = self.run_command(
+            'email,first_name,last_name,password,birth_date\n'
+            'first@gmail.com,Oleg,Zdorov,123456,1990-01-01\n'
+            'second@gmail.com,Serhiy,Zdorov,123456,\n'
+            'first@gmail.com,Other,Name,123456,\n'
+            'third@gmail.com,Lo,,123456,\n'
+            'fourth@gmail.com,Lo,Ha,123456,01.01.1990\n',
+            '.csv',
+            '--workers', '0',
+        )
+
+        # Checking that the valid users were created with cash accounts and usable passwords
+        self.assertEqual( 2, User.objects.count() )
+        self.assertEqual( 2, CashAccount.objects.count() )
+        self.assertEqual( True, User.objects.get( email = 'first@gmail.com' ).check_password( '123456' ) )
+        self.assertEqual( datetime.date( 1990, 1, 1 ), User.objects.get( email = 'first@gmail.com' ).birth_date )
+        self.assertEqual( 'Serhiy Zdorov', User.objects.get( email = 'second@gmail.com' ).full_name )
+
+        # Checking the per-row errors ( the duplicate is found in the database, as it belongs to the second chunk )
+        self.assertEqual( [ 4, 5, 6 ], [ error['line'] for error in errors ] )
+
+    def test_ndjson_pre_hashed( self ):
+        password_hash = hash_password( '123456' )
+
+        errors = self.run_command(
+            json.dumps( { 'email' : 'first@gmail.com', 'first_name' : 'Oleg', 'last_name' : 'Zdorov', 'password' : password_hash } ) + '\n' +
+            json.dumps( { 'email' : 'second@gmail.com', 'first_name' : 'Lo', 'last_name' : 'Ha', 'password' : '123456' } ) + '\n' +
+            'not json\n',
+            '.ndjson',
+            '--pre-hashed',
+        )
+
+        self.assertEqual( True, User.objects.get( email = 'first@gmail.com' ).check_password( '123456' ) )
+        self.assertEqual( 1, CashAccount.objects.count() )
+        self.assertEqual( [ 2, 3 ], [ error['line'] for error in errors ] )
+
+    def test_ndjson_not_string_values( self ):
+        # A row with values of other JSON types is an error of its line, the rows around it are imported
+        errors = self.run_command(
+            json.dumps( { 'email' : 'first@gmail.com', 'first_name' : 'Oleg', 'last_name' : 'Zdorov', 'password' : '123456' } ) + '\n' +
+            json.dumps( { 'email' : 'second@gmail.com', 'first_name' : 5, 'last_name' : 'Ha', 'password' : '123456' } ) + '\n' +
+            json.dumps( { 'email' : [ 'third@gmail.com' ], 'first_name' : 'Lo', 'last_name' : 'Ha', 'password' : 123456 } ) + '\n' +
+            json.dumps( { 'email' : 'fourth@gmail.com', 'first_name' : 'Serhiy', 'last_name' : 'Zdorov', 'password' : '123456' } ) + '\n',
+            '.ndjson',
+            '--workers', '0',
+        )
+
+        self.assertEqual( { 'first@gmail.com', 'fourth@gmail.com' }, set( User.objects.values_list( 'email', flat = True ) ) )
+        self.assertEqual( [ 2, 3 ], [ error['line'] for error in errors ] )
+        self.assertIn( 'first_name', errors[0]['error'] )
+        self.assertIn( 'email, password', errors[1]['error'] )
+
 # View mixins tests
 
 class TestClearHistoryMixinAPIView( TestCase ):
@@ -581,6 +1549,86 @@ class TestCashManagementService( TestCase ):
 
         self.assertEqual( 2000, user.cash_account.amount )
 
+    def test_hot_account( self ):
+        user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
+        set_hot_account_slots( user.cash_account, 4 )
+
+        for _ in range( 10 ):
+            cash_replenishment( 100, user.cash_account )
+
+        # The replenishments do not touch the row of the account, the money is summed on read
+        self.assertEqual( 0, CashAccount.objects.get( pk = user.cash_account.pk ).amount )
+        self.assertEqual( 1000, get_balance( user.cash_account ) )
+        self.assertEqual( 1000, RetrieveCashAccountSerializer( instance = user.cash_account ).data['amount'] )
+        self.assertEqual( True, checking_availability_money( 1000, user.cash_account ) )
+
+        # A withdrawal can spend the money of the sub-balances
+        self.assertEqual( True, cash_withdrawal( 600, user.cash_account ) )
+        self.assertEqual( False, cash_withdrawal( 500, user.cash_account ) )
+        self.assertEqual( 400, CashAccount.objects.get( pk = user.cash_account.pk ).amount )
+        self.assertEqual( 0, user.cash_account.sub_balances.aggregate( total = Sum( 'amount' ) )['total'] )
+
+        cash_replenishment( 100, user.cash_account )
+        self.assertEqual( 1, compact_hot_accounts() )
+        self.assertEqual( 500, CashAccount.objects.get( pk = user.cash_account.pk ).amount )
+        self.assertEqual( 0, compact_hot_accounts() )
+
+        # Turning the mode off keeps the money of the sub-balances
+        cash_replenishment( 100, user.cash_account )
+        set_hot_account_slots( user.cash_account, 0 )
+        cash_replenishment( 100, user.cash_account )
+
+        self.assertEqual( 700, CashAccount.objects.get( pk = user.cash_account.pk ).amount )
+        self.assertEqual( 700, get_balance( user.cash_account ) )
+
+        # A replenishment through an instance read while the mode was on does not credit a removed sub-balance
+        set_hot_account_slots( user.cash_account, 4 )
+        stale = CashAccount.objects.get( pk = user.cash_account.pk )
+        set_hot_account_slots( user.cash_account, 0 )
+        cash_replenishment( 100, stale )
+
+        self.assertEqual( 800, get_balance( CashAccount.objects.get( pk = user.cash_account.pk ) ) )
+        self.assertEqual( False, user.cash_account.sub_balances.exists() )
+
+    def test_optimistic_concurrency( self ):
+        user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
+        cash_replenishment( 1000, user.cash_account )
+
+        account = CashAccount.objects.get( pk = user.cash_account_uuid )
+        stale_account = CashAccount.objects.get( pk = user.cash_account_uuid )
+
+        self.assertEqual( True, cash_withdrawal( 300, account ) )
+
+        # The services re-read the account after a conflict and apply their change to the current values
+        self.assertEqual( True, cash_withdrawal( 200, stale_account ) )
+        self.assertEqual( 500, CashAccount.objects.get( pk = account.pk ).amount )
+
+        # A stale instance cannot overwrite the change
+        account.pin = 1234
+
+        with self.assertRaises( CashAccountVersionConflict ), transaction.atomic():
+            account.save()
+
+        # A change that is not possible anymore after the re-read is not applied ( the stale instance still has 700 )
+        self.assertEqual( False, cash_withdrawal( 600, account ) )
+        self.assertEqual( 500, account.amount )
+
+        # A contended account: every optimistic attempt conflicts with another writer, the last attempt locks the row
+        attempts = []
+
+        def change( account ):
+            attempts.append( account.version )
+
+            if len( attempts ) <= settings.CASH_ACCOUNT_OCC_RETRIES:
+                bump_version( account.pk )
+
+            account.amount += 1
+
+        self.assertEqual( True, update_cash_account( account, change ) )
+        self.assertEqual( settings.CASH_ACCOUNT_OCC_RETRIES + 1, len( attempts ) )
+        self.assertEqual( 501, CashAccount.objects.get( pk = account.pk ).amount )
+        self.assertEqual( account.version, CashAccount.objects.get( pk = account.pk ).version )
+
 class TestGeneralService( TestCase ):
 
     def test_generate_pin( self ):
@@ -590,6 +1638,26 @@ class TestGeneralService( TestCase ):
             self.assertEqual( True, type(pin) == int )
             self.assertEqual( True, True if pin >= 1000 and pin <= 9999 else False )
 
+    def test_generate_uuid7( self ):
+        before = time.time_ns() // 1_000_000
+        keys = [ generate_uuid7() for _ in range( 10000 ) ]
+        after = time.time_ns() // 1_000_000
+
+        # Checking the version, the variant and the timestamp of the keys
+        for key in keys[ :: 1000 ]:
+            self.assertEqual( key.version, 7 )
+            self.assertEqual( key.variant, uuid.RFC_4122 )
+            self.assertTrue( before <= key.int >> 80 <= after + 1 )
+
+        # Checking that the keys are unique and strictly increasing, in the same millisecond as well
+        self.assertEqual( keys, sorted( set( keys ) ) )
+
+        # Checking that the new keys are used by the models
+        user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
+        self.assertEqual( user.pk.version, 7 )
+        self.assertEqual( user.cash_account.pk.version, 7 )
+        self.assertEqual( user.cash_account_uuid, user.cash_account.pk )
+
     def test_CurrentCashAccount( self ):
         user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
         user.save()
@@ -615,6 +1683,327 @@ class TestGeneralService( TestCase ):
         set_ignore_status_for_queryset( True, user.cash_account.purchases.all() )
         self.assertEqual( True, Purchase.objects.get(pk = 1).is_ignore )
 
+class TestRedisLease( SimpleTestCase ):
+
+    def setUp( self ):
+        self.client = FakeRedis()
+
+    def test_lease( self ):
+        first = RedisLease( 'sweep', 60, client = self.client )
+        second = RedisLease( 'sweep', 60, client = self.client )
+
+        self.assertEqual( True, first.acquire() )
+        self.assertEqual( False, second.acquire() )
+
+        # Only the holder of the token can renew or release the lease
+        self.assertEqual( False, second.renew() )
+        self.assertEqual( False, second.release() )
+        self.assertEqual( True, first.renew() )
+        self.assertEqual( True, first.release() )
+
+        self.assertEqual( True, second.acquire() )
+
+    def test_lease_expiry( self ):
+        first = RedisLease( 'sweep', 0.05, client = self.client )
+        first.acquire()
+        sleep( 0.1 )
+
+        self.assertEqual( True, RedisLease( 'sweep', 60, client = self.client ).acquire() )
+        self.assertEqual( False, first.renew() )
+        self.assertEqual( True, first.lost )
+
+    def test_lease_heartbeat( self ):
+        with RedisLease( 'sweep', 0.15, client = self.client ) as lease:
+            sleep( 0.4 )
+
+            with RedisLease( 'sweep', 60, client = self.client ) as overlapping:
+                self.assertEqual( False, overlapping.acquired )
+
+            self.assertEqual( True, lease.acquired )
+            self.assertEqual( False, lease.lost )
+
+        metrics = get_lease_metrics( 'sweep', client = self.client )
+
+        self.assertEqual( 1, metrics['acquired'] )
+        self.assertEqual( 1, metrics['skipped'] )
+        self.assertEqual( 0, metrics['lost'] )
+        self.assertEqual( True, metrics['held_seconds_total'] >= 0.4 )
+
+class TestCreditSweepLease( TestCase ):
+
+    def setUp( self ):
+        self.client = FakeRedis()
+        self.user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
+        self.user.cash_account.amount = 505
+        self.user.cash_account.save()
+
+        key = next( i for i in settings.UNIT_PAYMENT_CREDIT_TIME.keys() )
+        self.credit = Credit.objects.create( amount = 1500, loan_duration = 3, cash_account = self.user.cash_account )
+        self.credit.creation_date = self.credit.creation_date - datetime.timedelta( **{ key : 1 }, seconds = 1 )
+        self.credit.save()
+
+    def test_overlapping_sweep_is_skipped( self ):
+        running = RedisLease( 'credit-sweep:default', 60, client = self.client )
+        running.acquire()
+
+        with mock.patch( 'bank_controller.services.redis_service.get_redis', return_value = self.client ):
+            check_credits_status_on_database( 'default' )
+            self.assertEqual( 0, Credit.objects.get( pk = self.credit.pk ).amount_returned )
+
+            running.release()
+            check_credits_status_on_database( 'default' )
+            self.assertEqual( 505, Credit.objects.get( pk = self.credit.pk ).amount_returned )
+
+        metrics = get_lease_metrics( 'credit-sweep:default', client = self.client )
+        self.assertEqual( 1, metrics['acquired'] )
+        self.assertEqual( 1, metrics['skipped'] )
+
+    def test_claimed_credit_is_skipped( self ):
+        claim = RedisLease( f'credit-check:default:{self.credit.pk}', 60, client = self.client )
+        claim.acquire()
+
+        with mock.patch( 'bank_controller.services.redis_service.get_redis', return_value = self.client ):
+            check_credits_status_on_database( 'default' )
+
+        self.assertEqual( 0, Credit.objects.get( pk = self.credit.pk ).amount_returned )
+        self.assertEqual( 505, CashAccount.objects.get( pk = self.user.cash_account.pk ).amount )
+
+class TestEmailService( APITestCase ):
+
+    def register( self, email, last_name = 'ha' ):
+        data = { 'email' : email, 'first_name' : 'Lo', 'last_name' : last_name, 'password' : 'Sup3r-secret-pass' }
+        return self.client.post( reverse( 'user-list' ), data, format = 'json' )
+
+    def test_registration_does_not_wait_for_smtp( self ):
+        with FakeSMTPServer( delay = 2 ) as server, server.settings():
+            start = time.perf_counter()
+            response = self.register( 'first@example.com' )
+            elapsed = time.perf_counter() - start
+
+            self.assertEqual( status.HTTP_201_CREATED, response.status_code )
+            self.assertEqual( True, elapsed < server.delay )
+            self.assertEqual( 0, server.connections )
+
+            self.register( 'second@example.com', last_name = 'Ha' )
+            self.assertEqual( 2, get_pending_emails().count() )
+
+            # Both emails are sent over one connection
+            self.assertEqual( 2, send_pending_emails() )
+            self.assertEqual( 1, server.connections )
+            self.assertEqual( 2, len( server.messages ) )
+            self.assertEqual( 0, get_pending_emails().count() )
+
+    def test_registration_without_broker( self ):
+        # The email is saved to the outbox, a failure of the broker does not fail the registration
+        with mock.patch.object( flush_email_outbox, 'apply_async', side_effect = kombu.exceptions.OperationalError ) as apply_async:
+            with self.assertLogs( 'bank_controller.services.general_service', 'WARNING' ), self.captureOnCommitCallbacks( execute = True ):
+                response = self.register( 'first@example.com' )
+
+        self.assertEqual( status.HTTP_201_CREATED, response.status_code )
+        self.assertEqual( 1, apply_async.call_count )
+        self.assertEqual( 1, get_pending_emails().count() )
+
+    def test_failed_email_is_retried( self ):
+        self.register( 'first@example.com' )
+
+        with FakeSMTPServer() as server, server.settings():
+            server.mail_reply = '451 Try again later'
+            self.assertEqual( 0, send_pending_emails() )
+
+            email = EmailOutbox.objects.get()
+            self.assertEqual( 1, email.attempts )
+            self.assertEqual( True, email.next_attempt_date > timezone.now() )
+            self.assertEqual( 0, get_pending_emails().count() )
+
+            # The backoff is doubled after every attempt
+            self.assertEqual( True, calc_next_attempt_date( 3 ) - calc_next_attempt_date( 2 ) > datetime.timedelta( seconds = settings.EMAIL_OUTBOX_RETRY_SECONDS * 2 - 1 ) )
+
+            EmailOutbox.objects.update( next_attempt_date = timezone.now() )
+            server.mail_reply = '250 OK'
+            self.assertEqual( 1, send_pending_emails() )
+            self.assertEqual( True, EmailOutbox.objects.get().is_sent )
+            self.assertEqual( 1, len( server.messages ) )
+
+class TestWarmup( TestCase ):
+
+    def test_warm_up( self ):
+        result = warm_up_application()
+
+        # Checking that the URLs and the serializers were warmed up
+        self.assertIn( 'retrieve-cash_account', list( get_resolver().reverse_dict ) )
+        self.assertGreater( result['urls'], 0 )
+        self.assertGreater( result['serializers'], 0 )
+
+        # Checking that only the databases in use are connected
+        self.assertEqual( warm_up_connections(), [ 'default' ] )
+
+class TestStartup( SimpleTestCase ):
+
+    def test_worker_startup( self ):
+        # A fresh worker process sets up, imports the tasks and executes the first one
+        report = boot( 'worker' )
+
+        # Checking that the worker does not import the modules of the API
+        self.assertEqual( [ name for name in API_ONLY_MODULES if name in report['modules'] ], [] )
+        # Checking the time to the first task
+        self.assertLess( report['seconds'], WORKER_STARTUP_BUDGET )
+
+class TestAnalyticsService( TestCase ):
+
+    def test_rebuild_spending_rollups( self ):
+        user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
+        user2 = User.objects.create_user( email = 'mrloking12@gmail.com', first_name = 'Lor', last_name = 'ha', password = '123456' )
+
+        for merchant, amount in ( ( 'Shop', 100 ), ( 'Shop', 50 ), ( 'Cafe', 10 ) ):
+            record_purchase_in_rollups( Purchase.objects.create( merchant = merchant, amount = amount, cash_account = user.cash_account ) )
+
+        record_transfer_in_rollups( Transfer.objects.create( sender = user.cash_account, reciever = user2.cash_account, amount = 30 ) )
+
+        fields = ( 'cash_account', 'day', 'category', 'merchant_ref', 'total', 'count' )
+        incremental = sorted( SpendingRollup.objects.values_list( *fields ) )
+
+        self.assertEqual( 4, len( incremental ) )
+
+        # Checking that the rebuild from the history gives the same rows as the incremental updates
+        self.assertEqual( 4, rebuild_spending_rollups() )
+        self.assertEqual( incremental, sorted( SpendingRollup.objects.values_list( *fields ) ) )
+
+        # The rollups refer to the merchants of the purchases, a renamed merchant keeps its rollups
+        Merchant.objects.filter( name = 'Shop' ).update( name = 'Shop & Co' )
+        report = get_spending_report( user.cash_account, timezone.localdate(), timezone.localdate(), category = 'purchase' )
+
+        self.assertEqual( [ ( 'Cafe', 10 ), ( 'Shop & Co', 150 ) ], [ ( row['merchant'], row['total'] ) for row in report ] )
+
+class TestMerchantService( TestCase ):
+
+    def setUp( self ) -> None:
+        merchant_cache.clear()
+        self.user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
+
+    def test_purchase_merchant( self ):
+        first = Purchase.objects.create( merchant = 'Shop', amount = 10, cash_account = self.user.cash_account )
+        second = Purchase.objects.create( merchant = 'Shop', amount = 20, cash_account = self.user.cash_account )
+
+        # Checking that the merchant name is stored once and read back by name
+        self.assertEqual( 1, Merchant.objects.filter( name = 'Shop' ).count() )
+        self.assertEqual( first.merchant_ref_id, second.merchant_ref_id )
+        self.assertEqual( 'Shop', Purchase.objects.get( pk = first.pk ).merchant )
+
+    def test_cache_holds_only_committed_ids( self ):
+        # Inside a transaction that is not committed, nothing is cached
+        merchant_id = resolve_merchant_id( 'Shop' )
+        self.assertEqual( None, merchant_cache.get_id( 'default', 'Shop' ) )
+
+        with self.captureOnCommitCallbacks( execute = True ):
+            resolve_merchant_id( 'Shop' )
+
+        self.assertEqual( merchant_id, merchant_cache.get_id( 'default', 'Shop' ) )
+        self.assertEqual( 'Shop', merchant_cache.get_name( 'default', merchant_id ) )
+
+        # Cached names are resolved without queries
+        with self.assertNumQueries( 0 ):
+            self.assertEqual( { 'Shop' : merchant_id }, resolve_merchant_ids( [ 'Shop' ] ) )
+
+    def test_lru_eviction( self ):
+        cache = MerchantCache( max_size = 2 )
+        cache.put( 'default', 'a', 1 )
+        cache.put( 'default', 'b', 2 )
+        cache.get_id( 'default', 'a' )
+        cache.put( 'default', 'c', 3 )
+
+        self.assertEqual( 1, cache.get_id( 'default', 'a' ) )
+        self.assertEqual( None, cache.get_id( 'default', 'b' ) )
+        self.assertEqual( 3, cache.get_id( 'default', 'c' ) )
+
+    def test_bulk_create_purchases( self ):
+        purchases = [ Purchase( merchant = str( i % 3 ), amount = i, cash_account = self.user.cash_account ) for i in range( 1, 10 ) ]
+
+        # One query to find the merchants, one to create them, one to read their ids and one to insert the purchases
+        with self.assertNumQueries( 4 ):
+            bulk_create_purchases( purchases )
+
+        self.assertEqual( 3, Merchant.objects.count() )
+        self.assertEqual( 3, Purchase.objects.filter( merchant_ref__name = '1' ).count() )
+
+class TestHistoryService( TestCase ):
+
+    def assertUsesIndex( self, queryset ) -> None:
+        """
+            Checks with EXPLAIN that every table of the query is read through an index search
+        """
+
+        if connection.vendor == 'postgresql':
+            # On small test tables PostgreSQL prefers sequential scans, so they are only allowed as the last resort
+            with connection.cursor() as cursor:
+                cursor.execute( 'SET enable_seqscan = off' )
+
+            plan = queryset.explain()
+            self.assertNotIn( 'Seq Scan', plan, plan )
+            return
+
+        # Every table is searched through an index, a "SCAN" reads the whole table or the whole index
+        plan = queryset.explain()
+        for line in plan.splitlines():
+            self.assertNotIn( 'SCAN', line, plan )
+
+    def test_every_filter_combination_uses_index( self ):
+        user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
+        Purchase.objects.create( merchant = 'Shop', amount = 100, cash_account = user.cash_account )
+
+        filter_values = {
+            'merchant' : 'Sh',
+            'amount_min' : 10,
+            'amount_max' : 1000,
+            'date_from' : datetime.date( 2022, 10, 1 ),
+            'date_to' : datetime.date( 2022, 10, 31 ),
+        }
+
+        for size in range( len( filter_values ) + 1 ):
+            for keys in itertools.combinations( filter_values, size ):
+                for direction in ( None, 'purchases', 'sent', 'recieved' ):
+                    filters = { key : filter_values[ key ] for key in keys }
+                    querysets = get_history_querysets( user.cash_account, direction = direction, **filters )
+
+                    for queryset in querysets.values():
+                        if not queryset.query.is_empty():
+                            self.assertUsesIndex( queryset )
+
+    def test_merchant_prefix( self ):
+        names = ( 'Sh', 'Shop', 'shop', 'SHOP', 'Si', 'S', 'Sh\U0010ffff', '\U0010ffff', '\U0010ffff!', '\ud7ffa', '\ue000' )
+        Merchant.objects.bulk_create( [ Merchant( name = name ) for name in names ] )
+
+        def matches( prefix ):
+            return sorted( filter_merchant_prefix( Merchant.objects.all(), prefix ).values_list( 'name', flat = True ) )
+
+        self.assertEqual( sorted( [ 'Sh', 'Shop', 'Sh\U0010ffff' ] ), matches( 'Sh' ) )
+        self.assertEqual( [ 'Sh\U0010ffff' ], matches( 'Sh\U0010ffff' ) )
+        self.assertEqual( sorted( [ '\U0010ffff', '\U0010ffff!' ] ), matches( '\U0010ffff' ) )
+        self.assertEqual( [ '\ud7ffa' ], matches( '\ud7ff' ) )
+
+class TestPartitionService( TestCase ):
+
+    def test_month_arithmetic( self ):
+        self.assertEqual( datetime.date( 2022, 10, 1 ), month_start( datetime.date( 2022, 10, 17 ) ) )
+        self.assertEqual( datetime.date( 2023, 1, 1 ), add_months( datetime.date( 2022, 10, 17 ), 3 ) )
+        self.assertEqual( datetime.date( 2021, 12, 1 ), add_months( datetime.date( 2022, 1, 31 ), -1 ) )
+
+    def test_partition_names( self ):
+        name = partition_name( 'bank_controller_purchase', datetime.date( 2022, 3, 1 ) )
+
+        self.assertEqual( 'bank_controller_purchase_p2022_03', name )
+        self.assertEqual( datetime.date( 2022, 3, 1 ), parse_partition_month( 'bank_controller_purchase', name ) )
+        self.assertEqual( None, parse_partition_month( 'bank_controller_purchase', default_partition_name( 'bank_controller_purchase' ) ) )
+        self.assertEqual( None, parse_partition_month( 'bank_controller_transfer', name ) )
+
+    def test_maintenance_is_noop_without_postgresql( self ):
+        # The test database is SQLite, so partition maintenance must not touch it
+        self.assertEqual( [], ensure_future_partitions() )
+        self.assertEqual( [], drop_partitions_older_than( retention_months = 1 ) )
+        self.assertEqual( [], partition_history_tables() )
+
+        with self.assertRaises( CommandError ):
+            call_command( 'partition_history_tables', stdout = StringIO() )
+
 class TestCreditService( TestCase ):
 
     def test_calc_credit_amount_with_percent( self ):
@@ -684,10 +2073,27 @@ class TestCreditService( TestCase ):
 
         self.assertEqual( 1, calc_number_paid_credit_parts( credit ) )
     
-    def test_calc_payment_time_limit( self ):
+    def test_credit_events( self ):
         user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
         credit = Credit.objects.create( amount = 1500, loan_duration = 3, cash_account = user.cash_account )
 
+        checking_payment_part_credit( credit )
+        checking_payment_part_credit( credit )
+        cash_replenishment( 1530, user.cash_account )
+        checking_payment_part_credit( credit )
+
+        self.assertEqual(
+            [ 'credit_escalated', 'message', 'account_blocked', 'message', 'credit_payment', 'account_unblocked', 'message', 'credit_repaid' ],
+            list( user.cash_account.events.order_by( 'id' ).values_list( 'kind', flat = True ) ),
+        )
+
+    def test_calc_payment_time_limit( self ):
+        user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
+
+        # The creation date and the last payment date are the same time
+        with use_clock( SimulatedClock() ):
+            credit = Credit.objects.create( amount = 1500, loan_duration = 3, cash_account = user.cash_account )
+
         key = next( i for i in settings.UNIT_PAYMENT_CREDIT_TIME.keys() )
         plus_to_credit_time = {
             key : 1
@@ -722,9 +2128,11 @@ class TestCreditService( TestCase ):
         credit = Credit.objects.create( amount = 1500, loan_duration = 3, cash_account = user.cash_account )
 
         last_payment = credit.last_payment_date
-        print('Wait one minute, for showing correct test result')
-        sleep( 60 )
-        self.assertEqual( True, payment_part_credit( credit, calc_amount_required_to_pay_one_credit_part(credit) ) )
+        clock = SimulatedClock()
+
+        with use_clock( clock ):
+            clock.advance( datetime.timedelta( minutes = 1 ) )
+            self.assertEqual( True, payment_part_credit( credit, calc_amount_required_to_pay_one_credit_part(credit) ) )
 
         self.assertEqual( user.cash_account.amount, 0 )
         self.assertEqual( credit.amount_returned, 505 )
@@ -769,3 +2177,291 @@ class TestCreditService( TestCase ):
         self.assertEqual( 1, CashAccount.objects.get( user = user ).messages.count() )
         self.assertEqual( 0, CashAccount.objects.get( user = user ).amount )
         self.assertEqual( 505, Credit.objects.get( cash_account = user.cash_account ).amount_returned )
+
+    def test_status_columns( self ):
+        user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
+        user.cash_account.amount = 505
+        user.cash_account.save()
+        credit = Credit.objects.create( amount = 1500, loan_duration = 3, cash_account = user.cash_account )
+
+        def assert_consistent():
+            stored = Credit.objects.get( pk = credit.pk )
+
+            self.assertEqual( calc_payment_time_limit( stored ), stored.next_payment_date )
+            self.assertEqual( calc_amount_required_to_pay_one_credit_part( stored ), stored.next_installment_amount )
+            self.assertEqual( calc_remaining_amount_to_repay_credit( stored ), stored.remaining_amount )
+            self.assertEqual( calc_parts_remaining_to_pay_credit( stored ), stored.remaining_parts )
+
+        # The columns follow the payments and the non-payments
+        assert_consistent()
+        checking_payment_part_credit( credit )
+        assert_consistent()
+        checking_payment_part_credit( credit )
+        assert_consistent()
+        self.assertEqual( 3, Credit.objects.get( pk = credit.pk ).remaining_parts )
+
+        # The portfolio queries are SQL
+        week = datetime.datetime.now( tz = settings.TIME_ZONE_DATETIME_MODULE_FORMAT ) + datetime.timedelta( days = 7 )
+        self.assertEqual( [ credit.pk ], list( Credit.objects.filter( remaining_amount__gt = 1000, next_payment_date__lt = week ).values_list( 'pk', flat = True ) ) )
+        self.assertEqual( [], list( Credit.objects.filter( remaining_amount__gt = 2000 ).values_list( 'pk', flat = True ) ) )
+
+        # The sweep does not read the credits that are not due
+        with self.assertNumQueries( 1 ):
+            checking_credits_status()
+
+        # The consistency checker
+        Credit.objects.filter( pk = credit.pk ).update( remaining_amount = 1, next_payment_date = None )
+
+        with self.assertRaises( CommandError ):
+            call_command( 'check_credit_status', stdout = StringIO() )
+
+        out = StringIO()
+        call_command( 'check_credit_status', '--fix', stdout = out )
+        self.assertIn( 'remaining_amount is 1.00, expected 1025.00', out.getvalue() )
+        assert_consistent()
+        call_command( 'check_credit_status', stdout = StringIO() )
+
+        # The amounts are rounded to the cents, the stored values are the computed ones
+        credit.amount = 1000
+        credit.is_increased_percentage = False
+        credit.save()
+        stored = Credit.objects.get( pk = credit.pk )
+
+        self.assertEqual( Decimal( '336.67' ), stored.next_installment_amount )
+        self.assertEqual( Decimal( '505.00' ), stored.remaining_amount )
+        self.assertEqual( [], list( find_inconsistent_credits() ) )
+
+        # The API shows the computed amounts, not the rounded columns
+        self.assertEqual( 1010 / 3, CreditSerializer( instance = stored ).data['amount_to_pay_the_next_installment_of_the_loan'] )
+        self.assertEqual( 1010 / 3, credit_representation( user.cash_account )['amount_to_pay_the_next_installment_of_the_loan'] )
+
+    def test_fast_forward_credits( self ):
+        # The whole lifecycle of a credit of 12 parts in the simulated time
+        clock = SimulatedClock()
+        period = datetime.timedelta( **{ next( i for i in settings.UNIT_PAYMENT_CREDIT_TIME.keys() ) : 1 } )
+
+        with use_clock( clock ):
+            payer, debtor = (
+                User.objects.create_user( email = f'{name}@gmail.com', first_name = 'Lo', last_name = name, password = '123456' ) for name in ( 'payer', 'debtor' )
+            )
+            cash_replenishment( 10000, payer.cash_account )
+            Credit.objects.create( amount = 6000, loan_duration = 12, cash_account = payer.cash_account )
+            Credit.objects.create( amount = 3000, loan_duration = 3, cash_account = debtor.cash_account )
+
+        states = fast_forward_credits( clock, 14, sweeps_per_period = 4 )
+
+        self.assertEqual( [ clock.now() - period * ( 13 - i ) for i in range( 14 ) ], [ state['time'] for state in states ] )
+        # The debtor misses the first part ( the rate is doubled ) and the second one ( the account is blocked )
+        counts = [ ( state['credits'], state['increased_percentage'], state['blocked_accounts'] ) for state in states ]
+        self.assertEqual( [ ( 2, 0, 0 ), ( 2, 1, 0 ), ( 2, 1, 1 ) ], counts[ :3 ] )
+        # The payer has repaid the credit in 12 parts
+        self.assertEqual( ( 1, 1, 1 ), counts[-1] )
+        self.assertEqual( 10000 - 6060, CashAccount.objects.get( pk = payer.cash_account.pk ).amount )
+        self.assertEqual( 12, Purchase.objects.filter( cash_account = payer.cash_account ).count() )
+
+        # The clock of the process is the system clock again
+        self.assertIsInstance( get_clock(), SystemClock )
+
+
+@override_settings( CREDIT_SCHEDULING_MODE = 'eta' )
+class TestCreditScheduling( TestCase ):
+
+    def setUp( self ):
+        self.user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
+        self.credit = Credit.objects.create( amount = 1500, loan_duration = 3, cash_account = self.user.cash_account )
+
+        # The executed on-commit callbacks also schedule the relay of the recorded account events
+        relay = mock.patch.object( relay_account_events, 'apply_async' )
+        relay.start()
+        self.addCleanup( relay.stop )
+
+    def tearDown( self ):
+        # The executed on-commit callbacks cached the merchants of the payments, which are rolled back with the test
+        merchant_cache.clear()
+
+    def make_credit_overdue( self ):
+        key = next( i for i in settings.UNIT_PAYMENT_CREDIT_TIME.keys() )
+        units = 1 + int( self.credit.is_increased_percentage )
+        self.credit.creation_date = self.credit.creation_date - datetime.timedelta( **{ key : units }, seconds = 1 )
+        self.credit.save()
+
+    def test_schedule_credit_check( self ):
+        with mock.patch.object( check_credit_status, 'apply_async' ) as apply_async:
+            with override_settings( CREDIT_SCHEDULING_MODE = 'beat' ), self.captureOnCommitCallbacks( execute = True ):
+                schedule_credit_check( self.credit )
+
+            self.assertEqual( 0, apply_async.call_count )
+
+            with self.captureOnCommitCallbacks( execute = True ):
+                schedule_credit_check( self.credit )
+
+            due_at = calc_payment_time_limit( self.credit )
+            apply_async.assert_called_once_with( ( self.credit.pk, due_at.isoformat(), 'default' ), eta = due_at )
+
+            # The checks further than the horizon are left to the periodic task
+            with override_settings( CREDIT_SCHEDULING_HORIZON_SECONDS = 0 ), self.captureOnCommitCallbacks( execute = True ):
+                schedule_credit_check( self.credit )
+
+            self.assertEqual( 1, apply_async.call_count )
+
+            # A failure of the broker is logged and does not fail the committed credit
+            apply_async.side_effect = kombu.exceptions.OperationalError
+
+            with self.assertLogs( 'bank_controller.services.general_service', 'WARNING' ), self.captureOnCommitCallbacks( execute = True ):
+                schedule_credit_check( self.credit )
+
+            self.assertEqual( 2, apply_async.call_count )
+
+    def test_check_scheduled_credit( self ):
+        self.user.cash_account.amount = 505
+        self.user.cash_account.save()
+        self.make_credit_overdue()
+        due_at = calc_payment_time_limit( self.credit )
+
+        with mock.patch.object( check_credit_status, 'apply_async' ) as apply_async:
+            # A check scheduled for another payment time is stale
+            self.assertEqual( False, check_scheduled_credit( self.credit.pk, due_at - datetime.timedelta( seconds = 1 ) ) )
+            self.assertEqual( 0, Credit.objects.get( pk = self.credit.pk ).amount_returned )
+
+            with self.captureOnCommitCallbacks( execute = True ):
+                self.assertEqual( True, check_scheduled_credit( self.credit.pk, due_at ) )
+
+            credit = Credit.objects.get( pk = self.credit.pk )
+            self.assertEqual( 505, credit.amount_returned )
+
+            # The payment moved the payment time, the check of the next part is scheduled and the executed check is stale now
+            apply_async.assert_called_once_with( ( credit.pk, calc_payment_time_limit( credit ).isoformat(), 'default' ), eta = calc_payment_time_limit( credit ) )
+            self.assertEqual( False, check_scheduled_credit( self.credit.pk, due_at ) )
+
+    def test_check_scheduled_credit_of_blocked_account( self ):
+        self.credit.is_increased_percentage = True
+        self.make_credit_overdue()
+        due_at = calc_payment_time_limit( self.credit )
+
+        with mock.patch.object( check_credit_status, 'apply_async' ) as apply_async:
+            with self.captureOnCommitCallbacks( execute = True ):
+                self.assertEqual( True, check_scheduled_credit( self.credit.pk, due_at ) )
+
+            self.assertEqual( True, CashAccount.objects.get( pk = self.user.cash_account.pk ).is_blocked )
+
+            # The payment in full is retried later with the same payment time
+            args, kwargs = apply_async.call_args
+            self.assertEqual( due_at.isoformat(), args[0][1] )
+            self.assertEqual( True, kwargs['eta'] > timezone.now() )
+
+            # And at once when money arrives on the account
+            with self.captureOnCommitCallbacks( execute = True ):
+                cash_replenishment( 1530, CashAccount.objects.get( pk = self.user.cash_account.pk ) )
+
+            args, kwargs = apply_async.call_args
+            self.assertEqual( True, kwargs['eta'] <= timezone.now() )
+
+            check_scheduled_credit( self.credit.pk, due_at )
+
+        self.assertEqual( False, CashAccount.objects.get( pk = self.user.cash_account.pk ).is_blocked )
+        self.assertEqual( False, Credit.objects.filter( pk = self.credit.pk ).exists() )
+
+
+class TestLoanBookService( TestCase ):
+
+    def test_single_credit_follows_the_sweep( self ):
+        # Pays, misses ( the rate is doubled ), pays, misses twice ( the account is blocked ), pays the rest
+        pattern = ( False, True, False, True, True, False )
+
+        user = User.objects.create_user( email = 'mrloking11@gmail.com', first_name = 'Lo', last_name = 'ha', password = '123456' )
+        credit = Credit.objects.create( amount = 1500, loan_duration = 3, cash_account = user.cash_account )
+        creation_date = credit.creation_date
+
+        forecast = simulate( load_portfolio(), len( pattern ), 1, lambda period: np.array( [ [ pattern[ period ] ] ] ) )
+
+        # The sweep of every period, the credit is as old as it will be then
+        sweep = { 'repayments' : [], 'escalations' : [], 'blockings' : [], 'repaid' : [] }
+
+        for period, missed in enumerate( pattern ):
+            cash_account = CashAccount.objects.get( pk = user.cash_account.pk )
+            cash_account.amount = 0 if missed else 10 ** 6
+            cash_account.save()
+            was_blocked = cash_account.is_blocked
+
+            before = Credit.objects.get( pk = credit.pk )
+            before.creation_date = creation_date - get_period() * ( period + 1 )
+            before.save()
+
+            checking_credits_status()
+
+            cash_account.refresh_from_db()
+            after = Credit.objects.filter( pk = credit.pk ).first()
+
+            sweep['repayments'].append( 0 if missed else 10 ** 6 - cash_account.amount )
+            sweep['escalations'].append( int( after is not None and after.is_increased_percentage and not before.is_increased_percentage ) )
+            sweep['blockings'].append( int( cash_account.is_blocked and not was_blocked ) )
+            sweep['repaid'].append( int( after is None ) )
+
+        for metric, values in sweep.items():
+            self.assertEqual( values, list( forecast[ metric ][0] ), metric )
+
+        self.assertEqual( [ 505, 0, 510, 0, 0, 515 ], sweep['repayments'] )
+        self.assertEqual( 1, sum( sweep['blockings'] ) )
+        self.assertEqual( [ 1010, 1025, 515, 515, 515, 0 ], list( forecast['outstanding'][0] ) )
+
+    def test_forecast( self ):
+        for i in range( 3 ):
+            user = User.objects.create_user( email = f'user{i}@gmail.com', first_name = 'Lo', last_name = f'ha{i}', password = '123456' )
+            Credit.objects.create( amount = 3000, loan_duration = 3, cash_account = user.cash_account )
+
+        portfolio = load_portfolio()
+        scenarios = { 'base' : 0, 'stress' : 0.5 }
+
+        forecast = forecast_loan_book( portfolio, scenarios, periods = 6, runs = 50, seed = 1, chunk_size = 2 )
+
+        # Without misses every credit is repaid part by part
+        self.assertEqual( [ 3030 ] * 3 + [ 0 ] * 3, [ period['repayments']['mean'] for period in forecast['base'] ] )
+        self.assertEqual( 3, sum( period['repaid']['mean'] for period in forecast['base'] ) )
+        self.assertEqual( 0, sum( period['escalations']['p95'] + period['blockings']['p95'] for period in forecast['base'] ) )
+
+        # The misses escalate and block some credits, the results depend on the seed only
+        self.assertLess( 0, forecast['stress'][0]['escalations']['mean'] )
+        self.assertLess( 0, sum( period['blockings']['mean'] for period in forecast['stress'] ) )
+        self.assertEqual( forecast, forecast_loan_book( portfolio, scenarios, periods = 6, runs = 50, seed = 1, workers = 2, chunk_size = 2 ) )
+
+
+class TestDatasetService( TestCase ):
+
+    def snapshot( self ) -> dict:
+        return {
+            'users' : list( User.objects.order_by( 'pk' ).values_list( 'pk', 'email', 'full_name', 'birth_date', 'date_joined', 'cash_account_uuid' ) ),
+            'cash_accounts' : list( CashAccount.objects.order_by( 'pk' ).values_list( 'pk', 'pin', 'amount', 'is_blocked', 'creation_date' ) ),
+            'credits' : list( Credit.objects.order_by( 'cash_account' ).values_list( 'cash_account', 'amount', 'amount_returned', 'creation_date', *Credit.STATUS_FIELDS ) ),
+            'purchases' : list( Purchase.objects.order_by( 'creation_date' ).values_list( 'cash_account', 'merchant_ref__name', 'amount', 'creation_date', 'is_ignore' ) ),
+            'transfers' : list( Transfer.objects.order_by( 'creation_date' ).values_list( 'sender', 'reciever', 'amount', 'creation_date' ) ),
+            'messages' : list( Message.objects.order_by( 'creation_date' ).values_list( 'cash_account', 'content', 'creation_date' ) ),
+        }
+
+    def test_generate_dataset( self ):
+        end = datetime.datetime( 2026, 1, 1, tzinfo = datetime.timezone.utc )
+        options = { 'seed' : 3, 'credit_rate' : 1, 'merchants' : 20, 'end' : end, 'chunk_size' : 40, 'batch_size' : 100 }
+
+        summary = generate_dataset( 100, **options )
+
+        self.assertEqual( 100, summary['users'] )
+        self.assertEqual( 100, sum( summary['credits'].values() ) )
+        self.assertEqual( 5000, summary['purchases'] )
+        self.assertTrue( all( summary['credits'][ state ] for state in CREDIT_STATES ) )
+        self.assertEqual( summary['credits']['blocked'], CashAccount.objects.filter( is_blocked = True ).count() )
+        self.assertFalse( User.objects.first().has_usable_password() )
+
+        # The states are real: the stored statuses are consistent, the overdue credits are due at "end"
+        self.assertEqual( [], list( find_inconsistent_credits() ) )
+        self.assertEqual(
+            summary['credits']['overdue'] + summary['credits']['blocked'],
+            Credit.objects.filter( next_payment_date__lt = end ).count(),
+        )
+        self.assertFalse( Transfer.objects.filter( creation_date__gt = end ).exists() )
+
+        # The same seed gives the same dataset
+        snapshot = self.snapshot()
+        self.assertEqual( 100, delete_dataset( 3 ) )
+        self.assertFalse( User.objects.exists() or CashAccount.objects.exists() or Purchase.objects.exists() or Message.objects.exists() )
+
+        generate_dataset( 100, **options )
+        self.assertEqual( snapshot, self.snapshot() )
@@ -8,6 +8,7 @@ urlpatterns = [
 
     # Cash account urls
     path( 'user/cash-account/', RetrieveCashAccountAPIView.as_view(), name = 'retrieve-cash_account' ),
+    path( 'user/cash-account/history/', RetrieveHistoryAPIView.as_view(), name = 'retrieve-history' ),
     path( 'user/cash-account/update-pin/', UpdateCashAccountPinAPIView.as_view(), name = 'update-cash_account-pin' ),
 
     # Purchase urls
@@ -19,5 +20,14 @@ urlpatterns = [
     path( 'user/cash-account/transfers/clear/', UpdateTransferIsIgnoreAPIView.as_view(), name = 'update-transfer-is_ignore' ),
 
     # Credit urls
-    path( 'user/cash-account/credits/create/', CreateCreditAPIView.as_view(), name = 'create-credit' )
+    path( 'user/cash-account/credits/create/', CreateCreditAPIView.as_view(), name = 'create-credit' ),
+
+    # Analytics urls
+    path( 'user/cash-account/analytics/spending/', RetrieveSpendingReportAPIView.as_view(), name = 'retrieve-spending_report' ),
+
+    # Push channel urls ( the channel itself is served by the ASGI application )
+    path( 'user/cash-account/updates/ticket/', CreatePushTicketAPIView.as_view(), name = 'create-push_ticket' ),
+
+    # Account event urls
+    path( 'events/feed/', RetrieveAccountEventFeedAPIView.as_view(), name = 'retrieve-account_event_feed' ),
 ]
@@ -1,38 +1,86 @@
 from rest_framework.generics import RetrieveAPIView, CreateAPIView, UpdateAPIView
-
-from .models import *
-from .serializers import *
+from rest_framework.views import APIView
+from rest_framework.response import Response
+from rest_framework import status
+from django.http import HttpResponse
+from django.conf import settings
+import redis
+
+from .models import User, CashAccount, Purchase, Transfer
+from .serializers import (
+    RetrieveUserSerializer,
+    RetrieveCashAccountSerializer,
+    UpdateCashAccountPinSerializer,
+    CreatePurchaseSerializer,
+    CreateTransferSerializer,
+    CreateCreditSerializer,
+    SpendingReportQuerySerializer,
+    SpendingReportSerializer,
+    AccountEventFeedQuerySerializer,
+    history_representation,
+    cash_account_representation,
+)
+from rest_framework.permissions import IsAdminUser
 from .permissions import IsHasCashAccount, IsAuthenticated
-from .mixins.view_mixins import *
+from .mixins.view_mixins import ClearHistoryMixinAPIView, HistorySearchMixin, ReplicaReadMixin, ConditionalGetMixin, SparseFieldsetMixin
+from .services.analytics_service import get_spending_report
+from .services.event_service import get_feed
+from .push import create_ticket
 
 
 
 # User APIViews
 
-class RetrieveUserAPIView( RetrieveAPIView ):
+class RetrieveUserAPIView( ReplicaReadMixin, ConditionalGetMixin, SparseFieldsetMixin, RetrieveAPIView ):
     """
-        APIView for retrieve user data
+        APIView for retrieve user data.
+        Accepts the sparse fieldset parameters ( the cash account can be expanded ), see "SparseFieldsetQuerySerializer"
     """
 
     serializer_class = RetrieveUserSerializer
     permission_classes = ( IsAuthenticated, )
+    sparse_fields = User.READING_FIELDS
+    expandable = { 'cash_account' : CashAccount.READING_FIELDS }
 
     def get_object(self):
         return self.request.user
 
 # Cash Account APIViews
 
-class RetrieveCashAccountAPIView( RetrieveAPIView ):
+class RetrieveCashAccountAPIView( ReplicaReadMixin, ConditionalGetMixin, HistorySearchMixin, SparseFieldsetMixin, RetrieveAPIView ):
     """
-        APIView for retrieve cash account data
+        APIView for retrieve cash account data.
+        Accepts the history search parameters, see "HistorySearchSerializer",
+        and the sparse fieldset parameters ( the user can be expanded ), see "SparseFieldsetQuerySerializer"
     """
 
     serializer_class = RetrieveCashAccountSerializer
     permission_classes = ( IsHasCashAccount, )
+    sparse_fields = CashAccount.READING_FIELDS
+    expandable = { 'user' : User.READING_FIELDS }
 
     def get_object(self):
         return self.request.user.cash_account
 
+    def retrieve( self, request, *args, **kwargs ):
+        # The fast read path, the same output as of the serializer ( see "cash_account_representation" ). Only the requested fields are read
+
+        fieldset = self.get_sparse_fieldset()
+
+        return Response( cash_account_representation( self.get_object(), self.get_history_filters(), **fieldset ) )
+
+
+class RetrieveHistoryAPIView( ReplicaReadMixin, HistorySearchMixin, APIView ):
+    """
+        APIView for retrieve ( and search ) the history of the cash account.
+        Accepts the history search parameters, see "HistorySearchSerializer"
+    """
+
+    permission_classes = ( IsHasCashAccount, )
+
+    def get( self, request ):
+        return Response( history_representation( request.user.cash_account, self.get_history_filters() ) )
+
 
 class UpdateCashAccountPinAPIView( UpdateAPIView ):
     """
@@ -86,4 +134,66 @@ class CreateCreditAPIView( CreateAPIView ):
         APIView for create credit
     """
 
-    serializer_class = CreateCreditSerializer
\ No newline at end of file
+    serializer_class = CreateCreditSerializer
+
+
+# Analytics APIViews
+
+class RetrieveSpendingReportAPIView( ReplicaReadMixin, APIView ):
+    """
+        APIView for retrieve the spending report of the cash account.
+        Only the spending rollups are read, see "services/analytics_service.py"
+    """
+
+    permission_classes = ( IsHasCashAccount, )
+
+    def get( self, request ):
+        query_serializer = SpendingReportQuerySerializer( data = request.query_params )
+        query_serializer.is_valid( raise_exception = True )
+
+        report = get_spending_report( request.user.cash_account, **query_serializer.validated_data )
+
+        return Response( SpendingReportSerializer( report, many = True ).data )
+
+
+# Push channel APIViews
+
+class CreatePushTicketAPIView( APIView ):
+    """
+        APIView for issuing a stream ticket of the push channel ( "?ticket=" of PUSH_PATH ), so the token is not sent in the query string.
+        The ticket expires in PUSH_TICKET_SECONDS and opens one connection, see "bank_controller/push.py"
+    """
+
+    permission_classes = ( IsAuthenticated, )
+
+    def post( self, request ):
+        try:
+            ticket = create_ticket( request.user )
+        except redis.RedisError:
+            return Response( { 'detail' : 'The push channel is unavailable.' }, status = status.HTTP_503_SERVICE_UNAVAILABLE )
+
+        return Response( { 'ticket' : ticket, 'expires_in' : settings.PUSH_TICKET_SECONDS }, status = status.HTTP_201_CREATED )
+
+
+# Account event APIViews
+
+class RetrieveAccountEventFeedAPIView( APIView ):
+    """
+        APIView for reading the change-data feed of the cash accounts ( admins only ), as newline-delimited JSON.
+        Returns the events after the "since" cursor at once, without holding a worker to wait for new ones: the long polling ( "wait" )
+        is served by the ASGI application ( see "bank_controller/feed.py" ). The cursor to continue from is returned in the "X-Next-Cursor" header, see "services/event_service.py"
+    """
+
+    permission_classes = ( IsAdminUser, )
+
+    def get( self, request ):
+        query_serializer = AccountEventFeedQuerySerializer( data = request.query_params )
+        query_serializer.is_valid( raise_exception = True )
+
+        lines, cursor = get_feed( query_serializer.validated_data['since'], query_serializer.validated_data['limit'] )
+
+        return HttpResponse(
+            ''.join( f'{line}\n' for line in lines ),
+            content_type = 'application/x-ndjson',
+            headers = { 'X-Next-Cursor' : cursor },
+        )
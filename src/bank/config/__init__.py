@@ -1,5 +1,2 @@
-# This will make sure the app is always imported when
-# Django starts so that shared_task will use this app.
-from config.celery import app as celery_app
-
-__all__ = ('celery_app',)
\ No newline at end of file
+# The celery app ( "config/celery.py" ) is not imported here: the API and the management commands load it only when they send a task,
+# the workers load it by the "-A config" option
@@ -14,4 +14,21 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', f'config.settings.{decouple.config("CONFIGURATION_FILE_TYPE")}_settings')
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Imported once Django is set up
+from django.conf import settings
+from bank_controller.push import push_application
+from bank_controller.feed import feed_application
+
+
+async def application( scope, receive, send ):
+    # The push channel is served outside of Django, a subscriber holds its connection open, see "bank_controller/push.py"
+    if scope['type'] == 'http' and scope['path'] == settings.PUSH_PATH:
+        return await push_application( scope, receive, send )
+
+    # The long polling of the feed waits on Redis, not in a thread, see "bank_controller/feed.py"
+    if scope['type'] == 'http' and scope['path'] == settings.ACCOUNT_EVENT_FEED_PATH:
+        return await feed_application( scope, receive, send )
+
+    return await django_application( scope, receive, send )
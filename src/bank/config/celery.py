@@ -2,11 +2,41 @@ import os
 import decouple
 
 from celery import Celery
+from celery.fixups.django import DjangoFixup, DjangoWorkerFixup
+from django.conf import settings
 
 # Set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', f'config.settings.{decouple.config("CONFIGURATION_FILE_TYPE")}_settings')
 
-app = Celery('config')
+
+class WorkerFixup( DjangoWorkerFixup ):
+    """
+        Django fixup of the worker without the system checks on start.
+        The checks import the whole URL configuration ( views, serializers, djoser, the admin ), which the tasks never use.
+        They are run by "manage.py migrate_all" before the workers are started, see "docker-compose.yaml"
+    """
+
+    def validate_models( self ):
+        self.django_setup()
+
+class ProjectDjangoFixup( DjangoFixup ):
+    """
+        The Django fixup of celery that installs "WorkerFixup" in the workers
+    """
+
+    @property
+    def worker_fixup( self ):
+        # Created on first use, when the configuration of the app is loaded
+        if self._worker_fixup is None:
+            self._worker_fixup = WorkerFixup( self.app )
+
+        return self._worker_fixup
+
+def django_fixup( app ):
+    return ProjectDjangoFixup( app ).install()
+
+
+app = Celery('config', fixups = [ django_fixup ])
 
 # Using a string here means the worker doesn't have to serialize
 # the configuration object to child processes.
@@ -14,8 +44,8 @@ app = Celery('config')
 #   should have a `CELERY_` prefix.
 app.config_from_object('django.conf:settings', namespace='CELERY')
 
-# Load task modules from all registered Django apps.
-app.autodiscover_tasks()
+# Load task modules of the project only ( the libraries have no tasks, looking for them costs time on every start )
+app.autodiscover_tasks( [ 'bank_controller' ] )
 
 
 # Celery beat schedule
@@ -23,6 +53,27 @@ app.autodiscover_tasks()
 app.conf.beat_schedule = {
     'periodic-check-credit-status': {
         'task': 'bank_controller.tasks.periodic_check_credit_status',
+        # In the 'eta' mode the credits are checked by the scheduled tasks, the periodic task is the safety net
+        'schedule': 60.0 if settings.CREDIT_SCHEDULING_MODE == 'beat' else float( settings.CREDIT_SCHEDULING_HORIZON_SECONDS ),
+    },
+    'periodic-relay-transfer-outbox': {
+        'task': 'bank_controller.tasks.periodic_relay_transfer_outbox',
+        'schedule': 60.0,
+    },
+    'periodic-flush-email-outbox': {
+        'task': 'bank_controller.tasks.flush_email_outbox',
         'schedule': 60.0,
     },
+    'periodic-compact-hot-accounts': {
+        'task': 'bank_controller.tasks.periodic_compact_hot_accounts',
+        'schedule': float( settings.HOT_ACCOUNT_COMPACTION_SECONDS ),
+    },
+    'periodic-relay-account-events': {
+        'task': 'bank_controller.tasks.periodic_relay_account_events',
+        'schedule': 60.0,
+    },
+    'maintain-history-partitions': {
+        'task': 'bank_controller.tasks.maintain_history_partitions',
+        'schedule': 60.0 * 60 * 24,
+    },
 }
\ No newline at end of file
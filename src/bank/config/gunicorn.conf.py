@@ -0,0 +1,51 @@
+"""
+    Gunicorn configuration of the API: "gunicorn -c config/gunicorn.conf.py" ( from the "bank" directory ).
+
+    The application is loaded and warmed up once in the master process, then the workers are forked from it,
+    so a new worker ( on start or after "max_requests" ) is ready to serve at once.
+"""
+
+import multiprocessing
+import os
+
+import decouple
+
+
+wsgi_app = 'config.wsgi:application'
+chdir = os.path.dirname( os.path.dirname( os.path.abspath( __file__ ) ) )
+
+bind = decouple.config( 'GUNICORN_BIND', default = '0.0.0.0:8000' )
+
+# Synchronous workers: one request at a time per process, so the warmed up connections of the process are the ones that serve the requests
+workers = decouple.config( 'GUNICORN_WORKERS', default = multiprocessing.cpu_count() * 2 + 1, cast = int )
+worker_class = 'sync'
+
+preload_app = True
+
+timeout = decouple.config( 'GUNICORN_TIMEOUT', default = 30, cast = int )
+# On SIGTERM the workers finish the requests in progress within this time. Must be shorter than the stop timeout of the container
+graceful_timeout = decouple.config( 'GUNICORN_GRACEFUL_TIMEOUT', default = 25, cast = int )
+keepalive = 5
+
+# Restarting the workers now and then limits the effect of memory leaks, the jitter keeps them from restarting together
+max_requests = decouple.config( 'GUNICORN_MAX_REQUESTS', default = 2000, cast = int )
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'
+
+
+def when_ready( server ):
+    from config.warmup import warm_up_application
+
+    server.log.info( 'Application warmed up: %s', warm_up_application() )
+
+def post_fork( server, worker ):
+    from config.warmup import warm_up_connections
+
+    server.log.info( 'Worker %s connected to: %s', worker.pid, ', '.join( warm_up_connections() ) )
+
+def worker_exit( server, worker ):
+    from django.db import connections
+
+    connections.close_all()
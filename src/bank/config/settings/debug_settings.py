@@ -58,6 +58,8 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+
+    'bank_controller.middleware.ReadYourWritesMiddleware',
 ]
 
 ROOT_URLCONF = 'config.urls'
@@ -84,13 +86,45 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/4.1/ref/settings/#databases
 
+# The SQLite files are created on the first connection, only their directory has to exist. The tests use in-memory databases
+( BASE_DIR / 'test_db' ).mkdir( exist_ok = True )
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'test_db' / 'db.sqlite3',
-    }
+    },
+    # Stands in for a read replica locally and in tests. Used only when listed in DATABASE_REPLICAS
+    'replica': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_db' / 'replica.sqlite3',
+    },
+    # Account shards locally and in tests. Used only when listed in ACCOUNT_SHARDS
+    'shard_0': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_db' / 'shard_0.sqlite3',
+    },
+    'shard_1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': BASE_DIR / 'test_db' / 'shard_1.sqlite3',
+    },
 }
 
+DATABASE_ROUTERS = [
+    'bank_controller.routers.AccountShardRouter',
+    'bank_controller.routers.PrimaryReplicaRouter',
+]
+
+# Aliases of the read replicas of the "default" database. Read-only views read from them, see "bank_controller/routers.py"
+DATABASE_REPLICAS = decouple.config( 'DATABASE_REPLICAS', default = '', cast = decouple.Csv() )
+
+# Aliases of the databases that cash accounts and their rows are sharded across ( by the hash of the account UUID ).
+# Empty - no sharding, everything lives on the "default" database. See "bank_controller/routers.py"
+ACCOUNT_SHARDS = decouple.config( 'ACCOUNT_SHARDS', default = '', cast = decouple.Csv() )
+
+# For how long the reads of a user stay on the primary after a write of that user ( read-your-writes )
+DATABASE_REPLICA_PIN_SECONDS = 10
+
 
 # Password validation
 # https://docs.djangoproject.com/en/4.1/ref/settings/#auth-password-validators
@@ -140,8 +174,10 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 AUTH_USER_MODEL = 'bank_controller.User'
 
 REST_FRAMEWORK = {
+    # The first renderer accepted by the "Accept" header of the request is used, JSON by default
     'DEFAULT_RENDERER_CLASSES' : [
-        'rest_framework.renderers.JSONRenderer',
+        'bank_controller.renderers.ORJSONRenderer',
+        'bank_controller.renderers.MessagePackRenderer',
         'rest_framework.renderers.BrowsableAPIRenderer',
     ],
 
@@ -166,14 +202,15 @@ DJOSER = {
     'SERIALIZERS' : {},
 
     "EMAIL" : {
+        # The emails are sent by a celery task, see "bank_controller/email.py"
         # venv/Lib/site-packages/djoser/templates/email/activation.html - Changed
-        "activation": "djoser.email.ActivationEmail",
+        "activation": "bank_controller.email.ActivationEmail",
 
-        "confirmation": "djoser.email.ConfirmationEmail",
-        "password_reset": "djoser.email.PasswordResetEmail",
-        "password_changed_confirmation": "djoser.email.PasswordChangedConfirmationEmail",
-        "username_changed_confirmation": "djoser.email.UsernameChangedConfirmationEmail",
-        "username_reset": "djoser.email.UsernameResetEmail",
+        "confirmation": "bank_controller.email.ConfirmationEmail",
+        "password_reset": "bank_controller.email.PasswordResetEmail",
+        "password_changed_confirmation": "bank_controller.email.PasswordChangedConfirmationEmail",
+        "username_changed_confirmation": "bank_controller.email.UsernameChangedConfirmationEmail",
+        "username_reset": "bank_controller.email.UsernameResetEmail",
     }
 }
 
@@ -182,6 +219,18 @@ EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_HOST_USER = 'mrloking11@gmail.com'
 EMAIL_HOST_PASSWORD = 'nexwdewfqqzqarjh'
 EMAIL_PORT = 587
+EMAIL_TIMEOUT = 30
+
+# EMAIL_OUTBOX
+# The emails are sent from the outbox by the "flush_email_outbox" celery task ( see "services/email_service.py" ):
+# - EMAIL_OUTBOX_BATCH_SIZE - the number of emails sent over one SMTP connection
+# - EMAIL_OUTBOX_RETRY_SECONDS - the delay of the first retry of a failed email, doubled after every attempt
+# - EMAIL_OUTBOX_MAX_ATTEMPTS - the email is not retried anymore after this number of failed attempts
+# - EMAIL_OUTBOX_LEASE_SECONDS - the time of the lease of the sender ( see "services/redis_service.py" )
+EMAIL_OUTBOX_BATCH_SIZE = 100
+EMAIL_OUTBOX_RETRY_SECONDS = 30
+EMAIL_OUTBOX_MAX_ATTEMPTS = 8
+EMAIL_OUTBOX_LEASE_SECONDS = 60
 
 
 # UNIT_PAYMENT_CREDIT_TIME
@@ -202,6 +251,103 @@ UNIT_PAYMENT_CREDIT_TIME = {
     # 'months' : None,
 }
 
+# CREDIT_SCHEDULING_MODE
+# How the credits are checked for the due payments ( see "services/credit_service.py" ):
+# - 'beat' - a periodic task checks all the credits every minute
+# - 'eta' - the check of every credit is scheduled at its payment time ( a celery task with an ETA ), on the creation of the credit
+#   and again after every payment or non-payment. The periodic task runs once per CREDIT_SCHEDULING_HORIZON_SECONDS as a safety net:
+#   it checks the overdue credits and schedules the checks that are due before its next run
+CREDIT_SCHEDULING_MODE = decouple.config( 'CREDIT_SCHEDULING_MODE', default = 'beat' )
+
+# CREDIT_SCHEDULING_HORIZON_SECONDS
+# Only the checks due within this time are sent to the broker, the later ones are scheduled by the periodic task when they come close.
+# Must be less than the 'visibility_timeout' of the broker, or the broker redelivers the waiting ETA tasks
+CREDIT_SCHEDULING_HORIZON_SECONDS = 60 * 60
+
+# CREDIT_BLOCKED_RETRY_SECONDS
+# In the 'eta' mode, the interval of the repeated checks of the credit of a blocked account.
+# The credit is also checked as soon as money arrives on the account
+CREDIT_BLOCKED_RETRY_SECONDS = 60 * 10
+
+
+
+# HISTORY_PARTITIONING
+# PostgreSQL only. When 'ENABLED' is True, the migration "0004_history_partitioning" ( or the "partition_history_tables" command
+# when it is enabled later ) converts the tables of the listed models
+# into tables partitioned by month on the "creation_date" field, and the "maintain_history_partitions" celery task:
+# - creates the partitions for the current month and 'MONTHS_AHEAD' months ahead
+# - detaches and drops the partitions older than 'RETENTION_MONTHS' months ( None - partitions are never dropped )
+HISTORY_PARTITIONING = {
+    'ENABLED' : decouple.config( 'HISTORY_PARTITIONING_ENABLED', default = False, cast = bool ),
+    'MODELS' : (
+        'bank_controller.Purchase',
+        'bank_controller.Transfer',
+        'bank_controller.Message',
+    ),
+    'MONTHS_AHEAD' : 3,
+    'RETENTION_MONTHS' : None,
+}
+
+
+
+# SPENDING_REPORT_MAX_DAYS
+# The maximum number of days that one spending report ( "user/cash-account/analytics/spending/" ) can cover.
+# Limits the number of rollup rows read by one request.
+SPENDING_REPORT_MAX_DAYS = 366
+
+
+
+# HOT_ACCOUNT_COMPACTION_SECONDS
+# Interval of the compaction of the hot cash accounts: their sub-balances are folded into their amounts ( see "services/cash_management_service.py" )
+HOT_ACCOUNT_COMPACTION_SECONDS = 60
+
+
+
+# CASH_ACCOUNT_OCC_RETRIES
+# The updates of a cash account are written only if its version is still the version that was read ( optimistic concurrency control,
+# see "services/version_service.py" ). After this number of conflicts the update locks the row of the account instead.
+# 0 - every update locks the row
+CASH_ACCOUNT_OCC_RETRIES = 3
+
+
+
+# ACCOUNT EVENTS
+# The change-data feed of the cash accounts ( see "services/event_service.py" ):
+# - ACCOUNT_EVENT_STREAM - the Redis stream the events are published to ( REDIS_URL ), trimmed to about ACCOUNT_EVENT_STREAM_MAX_LENGTH entries
+# - ACCOUNT_EVENT_RELAY_LEASE_SECONDS - the time of the lease of the relay of one database ( see "services/redis_service.py" )
+# - ACCOUNT_EVENT_FEED_PATH - the path of the feed, long-polled on the ASGI application ( see "bank_controller/feed.py" )
+# - ACCOUNT_EVENT_FEED_MAX_WAIT_SECONDS - the longest wait of a long-polling request of the feed
+ACCOUNT_EVENT_STREAM = 'account-events'
+ACCOUNT_EVENT_STREAM_MAX_LENGTH = 1000000
+ACCOUNT_EVENT_FEED_PATH = '/events/feed/'
+ACCOUNT_EVENT_FEED_MAX_WAIT_SECONDS = 30
+ACCOUNT_EVENT_RELAY_LEASE_SECONDS = 60
+
+
+
+# PUSH CHANNEL
+# Server-Sent Events of the cash account updates, served by the ASGI application ( see "bank_controller/push.py" ):
+# - PUSH_PATH - the path of the channel
+# - PUSH_CHANNEL_PREFIX - the prefix of the Redis pub/sub channels of the accounts ( REDIS_URL )
+# - PUSH_HEARTBEAT_SECONDS - an idle connection gets a comment line this often, so the proxies do not close it
+# - PUSH_QUEUE_SIZE - the number of updates kept for a subscriber that does not keep up
+# - PUSH_TICKET_PREFIX, PUSH_TICKET_SECONDS - the Redis keys of the stream tickets and their lifetime
+# - PUSH_RECONNECT_SECONDS, PUSH_RECONNECT_MAX_SECONDS - the first and the longest delay of the reconnection to Redis after a failure
+PUSH_PATH = '/user/cash-account/updates/'
+PUSH_CHANNEL_PREFIX = 'account-updates:'
+PUSH_HEARTBEAT_SECONDS = 15
+PUSH_QUEUE_SIZE = 100
+PUSH_TICKET_PREFIX = 'push-ticket:'
+PUSH_TICKET_SECONDS = 30
+PUSH_RECONNECT_SECONDS = 0.5
+PUSH_RECONNECT_MAX_SECONDS = 30
+
+
+
+# MERCHANT_CACHE_SIZE
+# The maximum number of merchant name <-> id pairs kept by the in-process merchant cache of every process
+MERCHANT_CACHE_SIZE = 10000
+
 
 
 # REDIS RELATED SETTINGS
@@ -209,7 +355,23 @@ UNIT_PAYMENT_CREDIT_TIME = {
 REDIS_SERVICE_NAME = 'redis'
 REDIS_PORT = '6379'
 
+# Redis of the distributed leases, see "services/redis_service.py"
+REDIS_URL = f'redis://{REDIS_SERVICE_NAME}:{REDIS_PORT}/2'
+
+# CREDIT_SWEEP_LEASE_SECONDS
+# Time of the lease of one credit sweep of a database ( renewed while the sweep runs ). A sweep started while the lease is held is skipped
+CREDIT_SWEEP_LEASE_SECONDS = 60
+
+# CREDIT_CHECK_LEASE_SECONDS
+# Time of the claim of one credit by its check, the other sweeps and scheduled checks skip a claimed credit
+CREDIT_CHECK_LEASE_SECONDS = 60
+
 # # CELERY SETTINGS
 
 CELERY_BROKER_URL = f'redis://{REDIS_SERVICE_NAME}:{REDIS_PORT}'
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
+
+# ETA tasks wait in the worker unacknowledged, the broker redelivers them after the visibility timeout ( see CREDIT_SCHEDULING_HORIZON_SECONDS )
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    'visibility_timeout' : 2 * 60 * 60,
+}
@@ -34,5 +34,43 @@ DATABASES = {
         'PASSWORD': decouple.config("POSTGRES_PASSWORD"),
         'HOST': 'postgres',
         'PORT': 5432,
+        # Connections are kept open between requests ( and warmed up on worker start, see "config/gunicorn.conf.py" )
+        'CONN_MAX_AGE': decouple.config( 'POSTGRES_CONN_MAX_AGE', default = 60, cast = int ),
     }
-}
\ No newline at end of file
+}
+
+# Read replicas: one database alias ( "replica_<n>" ) per host listed in POSTGRES_REPLICA_HOSTS
+
+DATABASE_REPLICAS = []
+
+for number, host in enumerate( decouple.config( 'POSTGRES_REPLICA_HOSTS', default = '', cast = decouple.Csv() ) ):
+    DATABASES[ f'replica_{number}' ] = dict( DATABASES['default'], HOST = host )
+    DATABASE_REPLICAS.append( f'replica_{number}' )
+
+# Account shards: one database alias ( "shard_<n>" ) per host listed in POSTGRES_SHARD_HOSTS. The list must never be reordered
+
+ACCOUNT_SHARDS = []
+
+for number, host in enumerate( decouple.config( 'POSTGRES_SHARD_HOSTS', default = '', cast = decouple.Csv() ) ):
+    DATABASES[ f'shard_{number}' ] = dict( DATABASES['default'], HOST = host )
+    ACCOUNT_SHARDS.append( f'shard_{number}' )
+
+# The read-your-writes pins must be shared by all API processes
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'redis://{REDIS_SERVICE_NAME}:{REDIS_PORT}/1',
+    }
+}
+
+
+# The browsable API is not served in production
+
+REST_FRAMEWORK = dict(
+    REST_FRAMEWORK,
+    DEFAULT_RENDERER_CLASSES = [
+        'bank_controller.renderers.ORJSONRenderer',
+        'bank_controller.renderers.MessagePackRenderer',
+    ],
+)
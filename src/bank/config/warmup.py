@@ -0,0 +1,70 @@
+"""
+    Warm-up of the API processes, so the first requests of a worker do not pay for lazy initialization.
+    Used by the gunicorn configuration ( "config/gunicorn.conf.py" ):
+    - warm_up_application - once in the master process, before the workers are forked ( the work is shared by all workers )
+    - warm_up_connections - in every worker after the fork ( connections cannot be shared between processes )
+"""
+
+import inspect
+
+from django.conf import settings
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.urls import get_resolver, reverse, NoReverseMatch
+from rest_framework.serializers import BaseSerializer
+
+
+
+def _iter_url_names( resolver ):
+    for pattern in resolver.url_patterns:
+        if hasattr( pattern, 'url_patterns' ):
+            yield from _iter_url_names( pattern )
+        elif pattern.name:
+            yield pattern.name
+
+def warm_up_application() -> dict:
+    """
+        Imports the views, builds the URL resolvers and the fields of all serializers of the application.
+        Does not touch the database. Returns the number of warmed up URLs and serializers
+    """
+
+    from bank_controller import serializers
+
+    # Resolving imports all views, reversing populates the reverse lookup tables of every resolver
+    resolver = get_resolver()
+    urls = 0
+
+    for name in _iter_url_names( resolver ):
+        try:
+            reverse( name )
+            urls += 1
+        except NoReverseMatch:
+            # Patterns with arguments are still populated by the lookup
+            pass
+
+    # Building the fields of a ModelSerializer introspects its model, the result is shared through the class declarations
+    serializer_classes = [
+        cls for _, cls in inspect.getmembers( serializers, inspect.isclass )
+        if issubclass( cls, BaseSerializer ) and cls.__module__ == serializers.__name__
+    ]
+
+    for cls in serializer_classes:
+        cls().fields
+
+    # Nothing opened in the master process may be inherited by the workers
+    connections.close_all()
+
+    return { 'urls' : urls, 'serializers' : len( serializer_classes ) }
+
+def warm_up_connections() -> list[ str ]:
+    """
+        Opens the connections to every database the application uses ( the primary, replicas and account shards ).
+        The connections are kept open between requests for CONN_MAX_AGE seconds. Returns the aliases of the opened connections
+    """
+
+    aliases = list( dict.fromkeys( [ DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS, *settings.ACCOUNT_SHARDS ] ) )
+
+    for alias in aliases:
+        with connections[ alias ].cursor() as cursor:
+            cursor.execute( 'SELECT 1' )
+
+    return aliases